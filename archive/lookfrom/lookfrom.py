@@ -1,49 +1,73 @@
 # Add language codes to transclusions of {{lookfrom}}.
 
 import argparse
-import re
+import collections
+import os
+import sys
 
 import pywikibot
+import pywikibot.pagegenerators
 import wikitextparser
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+import pywikibot_helpers
+import throttles
+import wikitext_helpers
+
+LOOKFROM_NAMES = {'lookfrom', 'Lookfrom'}
+
 def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-d' , '--dry-run', action='store_true')
 	parser.add_argument('-l', '--limit', type=int)
+	throttles.add_throttle_args(parser)
 	args = parser.parse_args()
 
 	site = pywikibot.Site()
-	with open('lookfrom.txt') as list_file:
-		for line in list_file:
-			if args.limit <= 0:
-				break
-			page_title = line[:-1]
-			if 2 <= len(page_title) <= 3:
-				continue
-			page = pywikibot.Page(site, page_title)
-			parsed = wikitextparser.parse(page.text)
-			lang_sections = parsed.get_sections(level=2)
-			for section in lang_sections:
-				if section.title == 'English':
-					if args.dry_run:
-						for line in section.contents.splitlines():
-							if '{{lookfrom' in line or '{{Lookfrom' in line:
-								print(f'Old line at {page_title}:\n{line}')
-								line, sub_count = re.subn(r'\{\{[lL]ookfrom(?=\||\}\})', '{{lookfrom|en', line)
-								print(f'New line at {page_title}:\n{line}')
-								args.limit -= 1
-					# For real
-					else:
-						section.contents, sub_count = re.subn(r'\{\{[lL]ookfrom(?=\||\}\})', '{{lookfrom|en', section.contents)
-						if sub_count:
-							page.text = str(parsed)
-							page.save(summary='Add language code to {{[[Template:lookfrom|lookfrom]]}} ([[Wiktionary:Requests for deletion/Others#Template:lookfrom|discussion]]).', botflag=True)
+	throttle = None if args.dry_run else throttles.throttle_from_args(args, site)
+	transform = lookfrom_transform(verify=args.dry_run)
+	# Skip titles of 2 or 3 characters before fetching anything
+	stats = collections.Counter()
+	listed_pages = (pywikibot.Page(site, title) for title in pywikibot_helpers.read_titles('lookfrom.txt'))
+	pages = pywikibot_helpers.filter_titles(listed_pages, lambda title: not 2 <= len(title) <= 3, stats)
+	for page in pywikibot.pagegenerators.PreloadingGenerator(pages, groupsize=pywikibot_helpers.API_TITLES_LIMIT):
+		if args.limit <= 0:
+			break
+		page_title = page.title()
+		text = page.text
+		for title, start, end in wikitext_helpers.lang_sections(text):
+			section_text = text[start:end]
+			if title == 'English':
+				if args.dry_run:
+					for line in section_text.splitlines():
+						if '{{lookfrom' in line or '{{Lookfrom' in line:
+							print(f'Old line at {page_title}:\n{line}')
+							line = transform.apply(line)
+							print(f'New line at {page_title}:\n{line}')
 							args.limit -= 1
-						else:
-							print(f'No instances of {{{{lookfrom}}}} found at "{page_title}".')
-				# Not English
-				elif '{{lookfrom' in section.contents or '{{Lookfrom' in section.contents:
-					print(f'"{page_title}" has an instance of {{{{lookfrom}}}} in a non-English section.')
+				# For real
+				else:
+					new_section_text = transform.apply(section_text)
+					if new_section_text != section_text:
+						page.text = ''.join((text[:start], new_section_text, text[end:]))
+						throttles.throttled_save(page, throttle, summary='Add language code to {{[[Template:lookfrom|lookfrom]]}} ([[Wiktionary:Requests for deletion/Others#Template:lookfrom|discussion]]).', botflag=True)
+						args.limit -= 1
+					else:
+						print(f'No instances of {{{{lookfrom}}}} found at "{page_title}".')
+			# Not English
+			elif '{{lookfrom' in section_text or '{{Lookfrom' in section_text:
+				print(f'"{page_title}" has an instance of {{{{lookfrom}}}} in a non-English section.')
+	pywikibot_helpers.print_summary(stats)
+	print(transform.report())
+	if throttle:
+		print(throttle.report())
+
+def lookfrom_transform(verify: bool = False) -> wikitext_helpers.TemplateTransform:
+	return wikitext_helpers.TemplateTransform(LOOKFROM_NAMES, r'\{\{[lL]ookfrom(?P<rest>(\|.*)?\}\})', r'{{lookfrom|en\g<rest>', add_lang_code, verify=verify)
+
+def add_lang_code(temp: wikitextparser.Template) -> None:
+	if temp.name in LOOKFROM_NAMES:
+		temp.string = '{{lookfrom|en' + temp.string[2 + len(temp.name):]
 
 if __name__ == '__main__':
 	main()
@@ -1,5 +1,12 @@
+import itertools
+import os
+import sys
+
 import pywikibot
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+import pywikibot_helpers
+
 DRY_RUN = False
 LIMIT = 1000
 DOC_TEXT = '''{{documentation subpage}}
@@ -11,23 +18,24 @@ DOC_TEXT = '''{{documentation subpage}}
 '''
 
 def main():
-	with open('prefixed_ref_temps.txt', encoding='utf-8') as temps_file:
-		ref_temps = temps_file.read().splitlines()
-
 	site = pywikibot.Site()
-	for temp_title in ref_temps[:LIMIT]:
-		doc_title = temp_title + '/documentation'
-		doc_page = pywikibot.Page(site, doc_title)
-		if doc_page.exists():
-			print(f'Warning: {doc_title} already exists')
-			continue
-		doc_page.text = DOC_TEXT
-		if DRY_RUN:
-			with open(temp_title.removeprefix('Template:').replace(':', '-') + '.txt', 'w', encoding='utf-8') as out_file:
-				out_file.write(doc_page.text)
-		else:
-			doc_page.save(summary='Categorize prefixed reference templates', bot=True)
-			pywikibot.Page(site, temp_title).touch()
+	ref_temps = itertools.islice(pywikibot_helpers.read_titles('prefixed_ref_temps.txt'), LIMIT)
+	# Refresh the categories of the templates in batches once their documentation exists, rather than with a null edit each
+	with pywikibot_helpers.LinkRefreshQueue(site, dry_run=DRY_RUN) as link_refreshes:
+		# Only existence matters, so check that for the documentation pages in batches without fetching their text
+		for doc_page in pywikibot_helpers.titled_pages(site, (temp_title + '/documentation' for temp_title in ref_temps), content=False):
+			doc_title = doc_page.title()
+			temp_title = doc_title.removesuffix('/documentation')
+			if doc_page.exists():
+				print(f'Warning: {doc_title} already exists')
+				continue
+			doc_page.text = DOC_TEXT
+			if DRY_RUN:
+				with open(temp_title.removeprefix('Template:').replace(':', '-') + '.txt', 'w', encoding='utf-8') as out_file:
+					out_file.write(doc_page.text)
+			else:
+				doc_page.save(summary='Categorize prefixed reference templates', bot=True)
+				link_refreshes.add(temp_title)
 
 if __name__ == '__main__':
 	main()
@@ -4,13 +4,23 @@ Replace U+2019 RIGHT SINGLE QUOTATION MARK with U+02BC MODIFIER LETTER APOSTROPH
 
 import argparse
 import itertools
-import re
+import os
+import sys
 
 import pywikibot
 import pywikibot.pagegenerators
+import wikitextparser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+import dumps
+import pywikibot_helpers
+import throttles
+import wikitext_helpers
 
 quote_mark = '\N{RIGHT SINGLE QUOTATION MARK}'
 mod_letter = '\N{MODIFIER LETTER APOSTROPHE}'
+# A template with a "twf" parameter, followed by the parameters in which to replace. Like the line-by-line replacement this replaced, it only matches a transclusion on a single line.
+TWF_PATTERN = r'(\{\{[^}\n]*?\|twf\|)([^}\n]*?)(\}\})'
 summary = 'Replace curly quotes (U+2019) with modifier letter apostrophes (U+02BC) per [[Wiktionary:Requests for moves, mergers and splits#Entries in CAT:Taos lemmas with curly apostrophes|discussion]].'
 
 def main():
@@ -18,42 +28,79 @@ def main():
 	parser.add_argument('input_path', help='Path of the list of entries to parse.')
 	parser.add_argument('-l', '--limit', default=-1, type=int, help='Maximum number of entries to perform replacements on.')
 	parser.add_argument('-d', '--dry-run', action='store_true', help='Do not replace; just print replacements that would be made.')
+	parser.add_argument('--dump', help='A multistream dump of the wiki (see dumps.py) to read the entries from instead of the wiki. Only allowed for dry runs, which then do not contact the wiki at all.')
 	parser.add_argument('-v', '--verbose', action='store_true')
+	throttles.add_throttle_args(parser)
 	args = parser.parse_args()
+	if args.dump and not args.dry_run:
+		parser.error('--dump can only be used for dry runs.')
 
-	site = pywikibot.Site()
-	with open(args.input_path, errors='ignore') as in_file:
-		pages = {pywikibot.Page(site, line[:-1], 0) for line in in_file}
+	throttle = None
+	if args.dump:
+		pages = (OfflinePage(page) for page in dumps.MultistreamDump(args.dump).pages(pywikibot_helpers.read_titles(args.input_path)) if page.ns == 0)
+	else:
+		site = pywikibot.Site()
+		if not args.dry_run:
+			throttle = throttles.throttle_from_args(args, site)
+		pages = pywikibot_helpers.titled_pages(site, pywikibot_helpers.read_titles(args.input_path), ns=0)
 
+	transform = twf_transform(verify=args.dry_run)
 	page_count = 0
 	for page in pages:
 		if 0 <= args.limit <= page_count:
 			print(f'Limit reached.')
 			break
 
-		page_lines = page.text.splitlines()
-		page_modified = False
 		print(f'Reading {page.title(as_link=True)}...')
-		for i, line in enumerate(page_lines):
-			page_lines[i], sub_count = re.subn(r'(\{\{[^}]*?\|twf\|)([^}]*?)(\}\})', sub_replace, line)
-			if sub_count:
-				page_modified = True
-				if args.verbose:
-					print(f'Before: ' + line.encode('unicode-escape').decode())
-					print(f' After: ' + page_lines[i].encode('unicode-escape').decode())
-		if page_modified:
-			page.text = '\n'.join(page_lines)
+		new_text = transform.apply(page.text)
+		if new_text != page.text:
+			if args.verbose:
+				# The replacement never adds or removes lines
+				for line, new_line in zip(page.text.splitlines(), new_text.splitlines()):
+					if line != new_line:
+						print(f'Before: ' + line.encode('unicode-escape').decode())
+						print(f' After: ' + new_line.encode('unicode-escape').decode())
+			page.text = new_text
 			if args.dry_run:
-				with open(f'{i}-{page.title().replace("/", "-")}.wiki', 'w') as saveFile:
+				with open(f'{page_count}-{page.title().replace("/", "-")}.wiki', 'w') as saveFile:
 					saveFile.write(page.text)
 			else:
-				page.save(summary=summary, botflag=True, quiet=False)
+				throttles.throttled_save(page, throttle, summary=summary, botflag=True, quiet=False)
 			page_count += 1
 		else:
 			print(f'WARNING: Did not find any quotes to replace in {page.title(as_link=True)}.')
+	print(transform.report())
+	if throttle:
+		print(throttle.report())
+
+class OfflinePage:
+	'''Just enough of pywikibot.Page for a dry run over a page from a dump.'''
+
+	def __init__(self, dump_page: dumps.DumpPage):
+		self._title = dump_page.title
+		self.text = dump_page.text
+
+	def title(self, as_link: bool = False) -> str:
+		return f'[[{self._title}]]' if as_link else self._title
+
+def twf_transform(verify: bool = False) -> wikitext_helpers.TemplateTransform:
+	return wikitext_helpers.TemplateTransform(None, TWF_PATTERN, sub_replace, replace_after_twf, verify=verify)
 
 def sub_replace(mat):
 	return f'{mat[1]}{mat[2].replace(quote_mark, mod_letter)}{mat[3]}'
 
+def replace_after_twf(temp: wikitextparser.Template) -> None:
+	# Like TWF_PATTERN, leave transclusions over several lines alone
+	if '\n' in temp.string:
+		return
+	args = temp.arguments
+	try:
+		twf_index = next(i for i, arg in enumerate(args) if arg.string == '|twf')
+	except StopIteration:
+		return
+	# Like TWF_PATTERN, require that "twf" is not the last parameter
+	for arg in args[twf_index + 1:]:
+		arg.string = arg.string.replace(quote_mark, mod_letter)
+
 if __name__ == '__main__':
 	main()
@@ -3,12 +3,18 @@ Replace U+2019 RIGHT SINGLE QUOTATION MARK with U+02BC MODIFIER LETTER APOSTROPH
 '''
 
 import argparse
-import itertools
+import collections
+import os
 import re
+import sys
 
 import pywikibot
 import pywikibot.pagegenerators
-import wikitextparser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+import pywikibot_helpers
+import throttles
+import wikitext_helpers
 
 quote_mark = '\N{RIGHT SINGLE QUOTATION MARK}'
 mod_letter = '\N{MODIFIER LETTER APOSTROPHE}'
@@ -20,19 +26,22 @@ def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-l', '--limit', default=-1, type=int)
 	parser.add_argument('-d', '--dry-run', action='store_true')
+	throttles.add_throttle_args(parser)
 	args = parser.parse_args()
 
 	site = pywikibot.Site()
-	page_generators = [pywikibot.pagegenerators.CategorizedPageGenerator(pywikibot.Category(site, name)) for name in category_names]
+	throttle = None if args.dry_run else throttles.throttle_from_args(args, site)
+	stats = collections.Counter()
+	# Most entries are in more than one of the categories, but only need fetching once
+	pages = pywikibot.pagegenerators.PreloadingGenerator(pywikibot_helpers.category_members((pywikibot.Category(site, name) for name in category_names), stats=stats))
 	with open('taos_skipped.txt', 'w') as skipped_file:
-		for i, page in enumerate(itertools.chain.from_iterable(page_generators)):
+		for i, page in enumerate(pages):
 			if 0 < args.limit <= i:
 				print(f'Limit reached.')
 				break
 
-			parsed_page = wikitextparser.parse(page.text)
-			sections = parsed_page.get_sections(level=2)
-			if len(sections) == 1 and sections[0].title.strip() == 'Taos':
+			sections = wikitext_helpers.lang_sections(page.text)
+			if len(sections) == 1 and sections[0][0] == 'Taos':
 				# Replace in page title
 				if quote_mark in page.title():
 					new_title = page.title().replace(quote_mark, mod_letter)
@@ -40,32 +49,33 @@ def main():
 						print(f'Would move {page.title(as_link=True)} to [[{new_title}]].')
 					else:
 						print(f'Moving {page.title(as_link=True)} to [[{new_title}]].')
-						page.move(new_title, reason=move_summary)
+						throttles.throttled_move(page, new_title, throttle, reason=move_summary)
 						# prepare to read through the new page
 						page = pywikibot.page.Page(site, new_title)
-						parsed_page = wikitextparser.parse(page.text)
-						sections = parsed_page.get_sections(level=2)
+						sections = wikitext_helpers.lang_sections(page.text)
 
 				# Replace in page text
-				section_lines = sections[0].contents.splitlines()
-				section_sub_count = 0
+				_, start, end = sections[0]
+				text = page.text
+				section_text, section_sub_count = re.subn(f'(?<=\\w){quote_mark}(?=\\w)', mod_letter, text[start:end])
 				print(f'Reading {page.title(as_link=True)}...')
-				for j, line in enumerate(section_lines):
-					section_lines[j], line_sub_count = re.subn(f'(?<=\\w){quote_mark}(?=\\w)', mod_letter, line)
-					if line_sub_count:
-						print(f'Before: ' + line.encode('unicode-escape').decode())
-						print(f' After: ' + section_lines[j].encode('unicode-escape').decode())
-						section_sub_count += line_sub_count
 				if section_sub_count:
-					sections[0].contents = '\n'.join(section_lines)
-					page.text = str(parsed_page)
+					# The replacement never adds or removes lines
+					for line, new_line in zip(text[start:end].splitlines(), section_text.splitlines()):
+						if line != new_line:
+							print(f'Before: ' + line.encode('unicode-escape').decode())
+							print(f' After: ' + new_line.encode('unicode-escape').decode())
+					page.text = ''.join((text[:start], section_text, text[end:]))
 					if args.dry_run:
 						with open(f'{i}-{page.title()}.wiki', 'w') as saveFile:
 							saveFile.write(page.text)
 					else:
-						page.save(summary=text_summary, botflag=True, quiet=False)
+						throttles.throttled_save(page, throttle, summary=text_summary, botflag=True, quiet=False)
 			else:
 				print(page.title(), file=skipped_file)
+	pywikibot_helpers.print_summary(stats)
+	if throttle:
+		print(throttle.report())
 
 if __name__ == '__main__':
 	main()
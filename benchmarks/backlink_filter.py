@@ -0,0 +1,56 @@
+'''
+Times language_considerations.should_backlink_be_updated() on a synthetic list of 100,000 backlinks, against the loop over ACCEPTABLE_BACKLINK_PREFIXES it replaced, and counts how many of the backlinks the blnamespace restriction keeps from being listed at all.
+Results (Python 3.11, median of 5 runs):
+	prefix loop: 152 ms
+	compiled pattern: 35 ms
+	listed after the blnamespace restriction: 50,236 of 100,000 backlinks
+'''
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('PYWIKIBOT_DIR', sys.path[0])
+
+import language_considerations
+
+BACKLINK_COUNT = 100_000
+RUNS = 5
+# Roughly the mix of backlinks of a big language considerations page
+PREFIXES = {'': 30, 'Talk:': 8, 'User:': 12, 'User talk:': 10, 'Reconstruction:': 20, 'Wiktionary:Beer parlour/': 6, 'Wiktionary:Tea room/': 4, 'Wiktionary:': 6, 'Appendix:': 2, 'Category:': 2}
+# Namespaces excluded by backlink_namespaces(), as prefixes
+UNLISTED_PREFIXES = ('Talk:', 'User:', 'User talk:', 'Reconstruction:')
+
+def old_should_backlink_be_updated(backlink: str, lang: str) -> bool:
+	if any(backlink.startswith(prefix) for prefix in language_considerations.ACCEPTABLE_BACKLINK_PREFIXES) or ' talk:' in backlink:
+		return False
+	if backlink == f'Category:{lang} language':
+		return False
+	return True
+
+def time_filter(should_update, backlinks: list[str]) -> tuple[float, list[str]]:
+	'''Returns the median time of filtering the backlinks, in seconds, along with the backlinks kept.'''
+	times = []
+	for _ in range(RUNS):
+		start = time.perf_counter()
+		kept = [backlink for backlink in backlinks if should_update(backlink, 'French')]
+		times.append(time.perf_counter() - start)
+	return statistics.median(times), kept
+
+def main():
+	rng = random.Random(0)
+	prefixes = rng.choices(list(PREFIXES), weights=list(PREFIXES.values()), k=BACKLINK_COUNT)
+	backlinks = [f'{prefix}Page {i}' for i, prefix in enumerate(prefixes)]
+	old_time, old_kept = time_filter(old_should_backlink_be_updated, backlinks)
+	new_time, new_kept = time_filter(language_considerations.should_backlink_be_updated, backlinks)
+	assert old_kept == new_kept
+	listed = sum(not backlink.startswith(UNLISTED_PREFIXES) for backlink in backlinks)
+	print(f'prefix loop: {old_time * 1000:.0f} ms')
+	print(f'compiled pattern: {new_time * 1000:.0f} ms')
+	print(f'listed after the blnamespace restriction: {listed:,} of {BACKLINK_COUNT:,} backlinks')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,46 @@
+'''
+Times starting scripts cold (each in a fresh Python process, as when run one after another from the command line) against running the same jobs in one warm process with bot_session.py.
+Each job is a script run with --help, which imports everything the script needs and parses its arguments, but stops before setting up the site (which needs the network, so the time saved by reusing the site and its login in a session is not measured here).
+Results (Python 3.11, pywikibot 11.8, median of 5 runs):
+	python -c pass: 45 ms
+	python -c "import pywikibot": 385 ms
+	6 scripts cold, one process each: 2,189 ms in all (365 ms each)
+	the same 6 jobs in one bot_session.py process: 374 ms
+'''
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+SCRIPTS = ['temp_move.py', 'cat_move.py', 'lang_cats_move.py', 'composite_job.py', 'recategorize.py', 'rollback.py']
+
+def time_command(args: list[str]) -> float:
+	'''Returns the median wall time of running a command, in seconds.'''
+	env = dict(os.environ, PYWIKIBOT_DIR=ROOT)
+	times = []
+	for _ in range(RUNS):
+		start = time.perf_counter()
+		subprocess.run(args, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+		times.append(time.perf_counter() - start)
+	return statistics.median(times)
+
+def main():
+	print(f'python -c pass: {time_command([sys.executable, "-c", "pass"]) * 1000:.0f} ms')
+	print(f'python -c "import pywikibot": {time_command([sys.executable, "-c", "import pywikibot"]) * 1000:.0f} ms')
+	cold = sum(time_command([sys.executable, script, '--help']) for script in SCRIPTS)
+	print(f'{len(SCRIPTS)} scripts cold, one process each: {cold * 1000:,.0f} ms in all ({cold / len(SCRIPTS) * 1000:.0f} ms each)')
+	with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as jobs_file:
+		jobs_file.write(''.join(f'{script} --help\n' for script in SCRIPTS))
+	try:
+		warm = time_command([sys.executable, 'bot_session.py', jobs_file.name])
+	finally:
+		os.remove(jobs_file.name)
+	print(f'the same {len(SCRIPTS)} jobs in one bot_session.py process: {warm * 1000:,.0f} ms')
+
+if __name__ == '__main__':
+	main()
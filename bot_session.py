@@ -0,0 +1,50 @@
+'''
+Runs many jobs (each a run of one of the scripts in this directory) in one long-lived process, so that pywikibot and the other slow modules are imported, and the site is set up and logged in to, once for the whole session rather than once per job.
+Each line of input is one job: the name of a script followed by its arguments, quoted as on the command line, for example:
+temp_move.py old-temp new-temp "Rename {{old-temp}}" -c "English lemmas"
+Blank lines and lines starting with # are ignored.
+'''
+
+import argparse
+import importlib
+import os
+import shlex
+import sys
+import time
+import traceback
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('jobs_path', nargs='?', default='-', help='A file listing the jobs to run, one per line. By default jobs are read from standard input as they are entered.')
+	args = parser.parse_args()
+
+	with (sys.stdin if args.jobs_path == '-' else open(args.jobs_path, encoding='utf-8')) as job_file:
+		for line in job_file:
+			line = line.strip()
+			if line and not line.startswith('#'):
+				run_job(shlex.split(line))
+
+def run_job(argv: list[str]) -> None:
+	'''Runs the main() of the script named by argv[0] as though it had been run from the command line with argv.'''
+	script = os.path.basename(argv[0])
+	if not os.path.isfile(os.path.join(os.path.dirname(os.path.abspath(__file__)), script)):
+		print(f'Error: There is no script named {script}.', file=sys.stderr)
+		return
+	start = time.perf_counter()
+	saved_argv = sys.argv
+	sys.argv = [script] + argv[1:]
+	try:
+		# Scripts stay imported between jobs, so only the first job to use each one pays for importing it
+		importlib.import_module(script.removesuffix('.py')).main()
+	# Raised by argparse for bad arguments (and for --help), which should not end the session
+	except SystemExit as ex:
+		if ex.code:
+			print(f'Error: {script} exited with status {ex.code}.', file=sys.stderr)
+	except Exception:
+		traceback.print_exc()
+	finally:
+		sys.argv = saved_argv
+	print(f'Finished {shlex.join(argv)} in {time.perf_counter() - start:.1f} seconds.', file=sys.stderr, flush=True)
+
+if __name__ == '__main__':
+	main()
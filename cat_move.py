@@ -2,6 +2,9 @@ import argparse
 
 import pywikibot
 
+import run_state
+import throttles
+import wikitext_helpers
 import wiktionary_cats
 
 def main():
@@ -19,12 +22,16 @@ def main():
 	parser.add_argument('-d', '--dry-run', '--dr', action='store_true', help='Save changed pages locally instead of remotely (so no change is made to the remote).')
 	parser.add_argument('-i', '--limit', default=-1, type=int, help='Limit the number of pages to be moved.')
 	parser.add_argument('-v', '--verbose', action='store_true')
+	parser.add_argument('--parse-cache', nargs='?', const=wikitext_helpers.PARSE_CACHE_PATH, help='Keep what is learnt from parsing each revision in this file (by default ' + wikitext_helpers.PARSE_CACHE_PATH + '), so that later runs over the same revisions (such as the real run after a dry run) can skip pages not in the category without parsing them again.')
+	throttles.add_throttle_args(parser)
+	run_state.add_edit_log_args(parser)
 	args = parser.parse_args()
 
 	if args.page:
 		wiktionary_cats.move_or_redirect_cat_page(src_cat.full_name, dst_cat.full_name, summary=summary, dry_run=dry_run)
 	src_cat = wiktionary_cats.LangCat(args.src_base_name, args.src_lang_code, args.src_lang_name, args.src_topic)
-	src_cat.move(args.dst_base_name, args.dst_topic, summary=args.summary, dry_run=args.dry_run, limit=args.limit, verbose=args.verbose)
+	with run_state.run_context(args, f'cat_move-{src_cat.full_name}', src_cat.site) as run:
+		src_cat.move(args.dst_base_name, args.dst_topic, summary=args.summary, dry_run=args.dry_run, limit=args.limit, verbose=args.verbose, throttle=run.throttle, parse_cache=run.parse_cache, edit_log=run.edit_log)
 
 if __name__ == '__main__':
 	main()
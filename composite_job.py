@@ -0,0 +1,155 @@
+'''
+Applies several transforms to the same set of pages in a single pass, fetching and saving each page only once (with a summary combining those of the transforms that changed it), rather than running temp_move.py, cat_move.py, and the like one after another.
+The job is described by a JSON file like the following, in which the steps are applied to each page in the order given and every step may have a "summary":
+{
+	"source": {"language": "English"},
+	"steps": [
+		{"type": "rename_template", "old": "old-temp", "new": "new-temp"},
+		{"type": "retarget_lang_cat", "lang_code": "en", "lang_name": "English", "old": "nouns", "new": "common nouns"},
+		{"type": "replace_category", "old": "Category:Foo", "new": "Category:Bar"},
+		{"type": "rhymes_syllables", "syllable_count": 2}
+	]
+}
+The source is one of {"language": ...} (the lemmas and non-lemma forms of the language), {"category": ...}, and {"pages": ...} (a file of titles as for temp_move.py).
+retarget_lang_cat steps may also have "old_topic" and "new_topic" (see cat_move.py).
+'''
+
+import argparse
+import collections
+import json
+import os
+from typing import Callable, Iterator
+
+import pywikibot
+import pywikibot.pagegenerators
+
+import pywikibot_helpers
+import recategorize
+import rhyme_syllable_counts
+import run_state
+import temp_move
+import throttles
+import wiktionary_cats
+
+VERBOSE_FACTOR = 100
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('job_path', help='The JSON file describing the job.')
+	parser.add_argument('-d', '--dry-run', action='store_true', help='Save changed pages locally instead of remotely (so no change is made to the remote).')
+	parser.add_argument('-l', '--limit', type=int, default=-1, help='The maximum number of pages to edit.')
+	parser.add_argument('-v', '--verbose', action='store_true')
+	throttles.add_throttle_args(parser)
+	run_state.add_edit_log_args(parser)
+	args = parser.parse_args()
+
+	with open(args.job_path, encoding='utf-8') as job_file:
+		job = json.load(job_file)
+	site = pywikibot.Site()
+	stats = collections.Counter()
+	# Dry runs double as differential tests of the fast paths of template transforms
+	steps = [(make_step(site, step, args.dry_run, stats, args.verbose), step.get('summary', default_summary(step))) for step in job['steps']]
+
+	with run_state.run_context(args, 'composite_job-' + os.path.splitext(os.path.basename(args.job_path))[0], site) as run:
+		edit_count = 0
+		for page_count, page in enumerate(pywikibot.pagegenerators.PreloadingGenerator(job_pages(site, job['source'], stats))):
+			if 0 <= args.limit <= edit_count:
+				break
+			if args.verbose and page_count % VERBOSE_FACTOR == 0:
+				print(page_count, flush=True)
+			title = page.title()
+			transform, summaries = steps_transform(title, steps)
+			if args.dry_run:
+				new_text = transform(page.text)
+				if not summaries:
+					continue
+				with open(f'{title.replace("/", "_")}.txt', 'w', encoding='utf-8') as out_file:
+					out_file.write(new_text)
+				print(f'Would save [[{title}]] with summary: {"; ".join(summaries)}')
+			# All the steps are rerun on the latest text if someone else edits the page in the meantime, and the summary describes the steps that changed that text
+			elif not pywikibot_helpers.save_transformed(page, transform, lambda: '; '.join(summaries), throttle=run.throttle, edit_log=run.edit_log, bot=True, quiet=not args.verbose):
+				continue
+			for step_summary in summaries:
+				stats[f'edited: {step_summary}'] += 1
+			edit_count += 1
+
+		print(f'Edited {edit_count} pages.')
+		for key, count in stats.items():
+			if key.startswith('edited: '):
+				print(f'{count} pages: {key.removeprefix("edited: ")}')
+		pywikibot_helpers.print_summary(stats)
+
+def job_pages(site: pywikibot.site.BaseSite, source: dict, stats: collections.Counter) -> Iterator[pywikibot.Page]:
+	'''Lists (without fetching) the pages of the source of a job (see the docstring of this module).'''
+	if 'language' in source:
+		cats = [pywikibot.Category(site, f'{source["language"]} {kind}') for kind in ('lemmas', 'non-lemma forms')]
+		return pywikibot_helpers.category_members(cats, stats=stats)
+	elif 'category' in source:
+		return pywikibot_helpers.category_members([pywikibot.Category(site, source['category'])], stats=stats)
+	elif 'pages' in source:
+		# Fetched (once) by the caller
+		return (pywikibot.Page(site, title) for title in pywikibot_helpers.read_titles(source['pages']))
+	raise ValueError(f'Unknown job source: {source}')
+
+def make_step(site: pywikibot.site.BaseSite, step: dict, verify: bool, stats: collections.Counter, verbose: bool = False) -> Callable[[str, str], str]:
+	'''Returns a function that applies a step of a job to the text of the page with a given title (and returns the text unchanged if the step does not apply).'''
+	if step['type'] == 'rename_template':
+		transform = temp_move.rename_transform(step['old'], step['new'], verify, stats)
+		return lambda text, title: transform.apply(text)
+	elif step['type'] == 'rhymes_syllables':
+		transform = rhyme_syllable_counts.rhymes_transform(step['syllable_count'], verify, stats)
+		return lambda text, title: transform.apply(text)
+	elif step['type'] == 'retarget_lang_cat':
+		src_cat = wiktionary_cats.LangCat(step['old'], step['lang_code'], step['lang_name'], step.get('old_topic', False), site)
+		dst_cat = wiktionary_cats.LangCat(step['new'], step['lang_code'], step['lang_name'], step.get('new_topic', False), site)
+		def retarget(text: str, title: str) -> str:
+			try:
+				return src_cat.retarget_page_text(text, title, dst_cat, verbose)
+			# The page is not in the source category
+			except ValueError:
+				return text
+		return retarget
+	elif step['type'] == 'replace_category':
+		old_cat = pywikibot.Category(site, step['old'])
+		new_cat = pywikibot.Category(site, step['new'])
+		def replace(text: str, title: str) -> str:
+			# Most pages will not be in the category, so do not warn about them as recategorize() would
+			if old_cat not in pywikibot.textlib.getCategoryLinks(text, site=site):
+				return text
+			return recategorize.recategorize(text, title, 'replace', old_cat, new_cat, site)
+		return replace
+	raise ValueError(f'Unknown job step type: {step["type"]}')
+
+def default_summary(step: dict) -> str:
+	if step['type'] == 'rename_template':
+		return f'Rename {{{{[[Template:{step["old"]}|{step["old"]}]]}}}} to {{{{[[Template:{step["new"]}|{step["new"]}]]}}}}'
+	elif step['type'] == 'rhymes_syllables':
+		return f'Add syllable count of {step["syllable_count"]} to {{{{rhymes}}}}'
+	elif step['type'] == 'retarget_lang_cat':
+		src_cat = wiktionary_cats.LangCat(step['old'], step['lang_code'], step['lang_name'], step.get('old_topic', False))
+		dst_cat = wiktionary_cats.LangCat(step['new'], step['lang_code'], step['lang_name'], step.get('new_topic', False))
+		return f'Move from [[:Category:{src_cat.full_name}]] to [[:Category:{dst_cat.full_name}]]'
+	old_name = step['old'].removeprefix('Category:')
+	new_name = step['new'].removeprefix('Category:')
+	return f'Move from [[:Category:{old_name}]] to [[:Category:{new_name}]]'
+
+def steps_transform(title: str, steps: list[tuple[Callable[[str, str], str], str]]) -> tuple[Callable[[str], str], list[str]]:
+	'''Returns a function applying the steps to the text of the page with the given title (see apply_steps()), and a list that it fills with the summaries of the steps that changed the text it was last called with.'''
+	summaries = []
+	def transform(text: str) -> str:
+		new_text, summaries[:] = apply_steps(text, title, steps)
+		return new_text
+	return transform, summaries
+
+def apply_steps(text: str, title: str, steps: list[tuple[Callable[[str, str], str], str]]) -> tuple[str, list[str]]:
+	'''Applies each step in turn, returning the final text and the summaries of the steps that changed it.'''
+	summaries = []
+	for step, summary in steps:
+		new_text = step(text, title)
+		if new_text != text:
+			summaries.append(summary)
+			text = new_text
+	return text, summaries
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,132 @@
+'''
+Random access to the text of pages in a multistream XML dump (like enwiktionary-latest-pages-articles-multistream.xml.bz2) without decompressing the whole dump.
+A multistream dump is many bz2 streams (blocks) of about 100 pages each, one after another, and its index file lists the byte offset of the block holding each page, so a page can be read by seeking to its block and decompressing just that block.
+'''
+
+import bisect
+import bz2
+import collections
+import concurrent.futures
+import itertools
+import os
+import xml.etree.ElementTree
+from typing import Iterable, Iterator, NamedTuple
+
+# How many decompressed blocks to keep for reuse by later lookups
+BLOCK_CACHE_SIZE = 16
+
+class DumpPage(NamedTuple):
+	title: str
+	ns: int
+	pageid: int
+	revid: int
+	text: str
+
+class MultistreamDump:
+	'''
+	dump_path: The path of the multistream dump.
+	index_path: The path of its index (optionally compressed), which by default is worked out from the name of the dump as the Wikimedia dumps name them.
+	'''
+
+	def __init__(self, dump_path: str, index_path: str | None = None, cache_size: int = BLOCK_CACHE_SIZE):
+		self.dump_path = dump_path
+		self.index_path = index_path or dump_path.replace('multistream.xml', 'multistream-index.txt')
+		self.cache_size = cache_size
+		self.block_cache = collections.OrderedDict()
+		# Loaded from the index when first needed
+		self.offsets = None
+		self.title_offsets = None
+		self.dump_size = os.path.getsize(dump_path)
+
+	def index_entries(self) -> Iterator[tuple[int, str]]:
+		'''Yields the offset and title of every page in the index, in the order of the dump.'''
+		opener = bz2.open if self.index_path.endswith('.bz2') else open
+		with opener(self.index_path, 'rt', encoding='utf-8') as index_file:
+			for line in index_file:
+				offset, _, rest = line.partition(':')
+				# Titles can themselves contain colons
+				yield int(offset), rest.partition(':')[2].rstrip('\n')
+
+	def load_offsets(self, titles: set[str] | None = None) -> dict[str, int]:
+		'''
+		Reads the offset of every block from the index (needed to know where each block ends), along with the offset of each of titles (or every title if titles is None), in one pass.
+		Returns the offsets of the titles found.
+		'''
+		offsets = []
+		title_offsets = {}
+		for offset, title in self.index_entries():
+			if not offsets or offsets[-1] != offset:
+				offsets.append(offset)
+			if titles is None or title in titles:
+				title_offsets[title] = offset
+		self.offsets = offsets
+		return title_offsets
+
+	def block_end(self, offset: int) -> int:
+		i = bisect.bisect_right(self.offsets, offset)
+		return self.offsets[i] if i < len(self.offsets) else self.dump_size
+
+	def read_block(self, offset: int) -> dict[str, DumpPage]:
+		'''Decompresses and parses the block at offset, without caching it (so it is safe to call from several threads at once).'''
+		with open(self.dump_path, 'rb') as dump_file:
+			dump_file.seek(offset)
+			data = dump_file.read(self.block_end(offset) - offset)
+		xml_text = bz2.decompress(data).decode('utf-8')
+		# The last block is followed by the end of the root element
+		xml_text = xml_text.partition('</mediawiki>')[0]
+		pages = {}
+		for page_el in xml.etree.ElementTree.fromstring(f'<pages>{xml_text}</pages>'):
+			revision_el = page_el.find('revision')
+			page = DumpPage(page_el.findtext('title'), int(page_el.findtext('ns')), int(page_el.findtext('id')), int(revision_el.findtext('id')), revision_el.findtext('text') or '')
+			pages[page.title] = page
+		return pages
+
+	def block(self, offset: int) -> dict[str, DumpPage]:
+		'''Like read_block(), but keeps the most recently used blocks for reuse.'''
+		if offset in self.block_cache:
+			self.block_cache.move_to_end(offset)
+			return self.block_cache[offset]
+		pages = self.read_block(offset)
+		self.block_cache[offset] = pages
+		if len(self.block_cache) > self.cache_size:
+			self.block_cache.popitem(last=False)
+		return pages
+
+	def page(self, title: str) -> DumpPage | None:
+		'''Looks up a single page (loading the offsets of every title the first time). Returns None if the page is not in the dump.'''
+		if self.title_offsets is None:
+			self.title_offsets = self.load_offsets()
+		offset = self.title_offsets.get(title)
+		return None if offset is None else self.block(offset).get(title)
+
+	def pages(self, titles: Iterable[str]) -> Iterator[DumpPage]:
+		'''
+		Yields the pages with the given titles that are in the dump, block by block in the order of the dump, decompressing each block that holds any of them only once.
+		Only the offsets of the given titles are kept from the index, so this works for long lists of titles without loading the whole index.
+		'''
+		titles = set(titles)
+		title_offsets = self.load_offsets(titles) if self.title_offsets is None else self.title_offsets
+		by_offset = collections.defaultdict(list)
+		for title in titles:
+			if title in title_offsets:
+				by_offset[title_offsets[title]].append(title)
+		for offset in sorted(by_offset):
+			block = self.block(offset)
+			for title in by_offset[offset]:
+				yield block[title]
+
+	def scan(self, workers: int = os.cpu_count() or 1) -> Iterator[DumpPage]:
+		'''
+		Yields every page in the dump, in order, decompressing blocks in parallel (bz2 releases the GIL while decompressing, so threads suffice).
+		'''
+		if self.offsets is None:
+			self.load_offsets(set())
+		offsets = iter(self.offsets)
+		with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+			# Keep only a few blocks ahead of the consumer, so that a slow consumer does not fill memory with decompressed blocks
+			pending = collections.deque(executor.submit(self.read_block, offset) for offset in itertools.islice(offsets, 2 * workers))
+			while pending:
+				block = pending.popleft().result()
+				for offset in itertools.islice(offsets, 1):
+					pending.append(executor.submit(self.read_block, offset))
+				yield from block.values()
@@ -1,6 +1,9 @@
 import argparse
 
 import cat_move
+import run_state
+import throttles
+import wikitext_helpers
 import wiktionary_cats
 
 def main():
@@ -15,12 +18,18 @@ def main():
 	parser.add_argument('-d', '--dry-run', '--dr', action='store_true', help='Save changed pages locally instead of remotely (so no change is made to the remote).')
 	parser.add_argument('-l', '--limit', default=-1, type=int, help='Limit the number of pages to be moved.')
 	parser.add_argument('-v', '--verbose', action='store_true')
+	parser.add_argument('--parse-cache', nargs='?', const=wikitext_helpers.PARSE_CACHE_PATH, help='Keep what is learnt from parsing each revision in this file (by default ' + wikitext_helpers.PARSE_CACHE_PATH + '), so that later runs over the same revisions (such as the real run after a dry run) can skip pages not in the category without parsing them again.')
+	parser.add_argument('--tree-snapshot', nargs='?', const=wiktionary_cats.CAT_TREE_SNAPSHOT_PATH, help='Keep a snapshot of the subcategories (and their sizes) in this file (by default ' + wiktionary_cats.CAT_TREE_SNAPSHOT_PATH + '), so that later runs (such as the real run after a dry run, or the other shards) need not list them again.')
+	throttles.add_throttle_args(parser)
+	run_state.add_shard_args(parser)
+	run_state.add_edit_log_args(parser)
 	args = parser.parse_args()
 	if args.limit < 0:
 		args.limit = None
 
 	parent = wiktionary_cats.ParentCat(args.src_base_name, args.src_topic, args.langs_path)
-	parent.move(args.dst_base_name, args.summary, args.dst_topic, args.page, args.dry_run, args.limit, args.verbose)
+	with run_state.run_context(args, f'lang_cats_move-{args.src_base_name}', parent.site) as run:
+		parent.move(args.dst_base_name, args.summary, args.dst_topic, args.page, args.dry_run, args.limit, args.verbose, run.throttle, run.parse_cache, run.checkpoint, args.tree_snapshot, run.edit_log)
 
 if __name__ == '__main__':
 	main()
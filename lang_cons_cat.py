@@ -2,33 +2,50 @@
 Find language considerations pages by title and categorize those that are not yet in Category:Wiktionary language considerations.
 '''
 
+import argparse
+import collections
+
 import pywikibot
 import pywikibot.pagegenerators
 
 import wikitextparser
 
 import pywikibot_helpers
+import run_state
+import throttles
 
 DRY_RUN = False
 LANG_CONS_PREFIX = 'About '
-REDIRECT_PREFIX = '#redirect'
 WIKTIONARY_NS_ID = 4
 
 def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--incremental', action='store_true', help='Only check pages that were created, edited, or moved since the last run with this option (falling back to a full scan the first time).')
+	throttles.add_throttle_args(parser)
+	args = parser.parse_args()
+
 	site = pywikibot.Site()
+	throttle = throttles.throttle_from_args(args, site)
 	lang_cons_cat = pywikibot.Category(site, 'Wiktionary language considerations')
 	reason = f'Add to {lang_cons_cat.title(as_link=True, textlink=True)}'
-	for page in pywikibot.pagegenerators.PrefixingPageGenerator(LANG_CONS_PREFIX, namespace=site.namespaces[WIKTIONARY_NS_ID], site=site):
-		# Already categorized
-		if lang_cons_cat in page.categories():
-			continue
-		# Skip redirects
-		if pywikibot_helpers.startswith_casefold(page.text, REDIRECT_PREFIX):
+	# Fetch the current members once (in batches of up to 500 titles) instead of asking for the categories of each page separately
+	categorized_titles = {page.title() for page in lang_cons_cat.articles(namespaces=WIKTIONARY_NS_ID)}
+	state = run_state.IncrementalState('lang_cons_cat') if args.incremental else None
+	changed_titles = state.changed_titles(site, namespaces=[WIKTIONARY_NS_ID]) if state else None
+	if changed_titles is None:
+		# Redirects are excluded by the API, so they never need their text fetched
+		listed_pages = pywikibot.pagegenerators.PrefixingPageGenerator(LANG_CONS_PREFIX, namespace=site.namespaces[WIKTIONARY_NS_ID], includeredirects=False, site=site)
+	else:
+		listed_pages = (pywikibot.Page(site, title) for title in sorted(changed_titles))
+		listed_pages = (page for page in listed_pages if page.title(with_ns=False).startswith(LANG_CONS_PREFIX))
+	stats = collections.Counter()
+	candidates = pywikibot_helpers.filter_titles(listed_pages, is_candidate_title, stats, with_ns=False)
+	candidates = pywikibot_helpers.filter_out_titles(candidates, categorized_titles, stats)
+	for page in pywikibot.pagegenerators.PreloadingGenerator(candidates):
+		# Changed pages are not filtered by the API (and may have been deleted since)
+		if not page.exists() or page.isRedirectPage():
 			continue
 		lang = page.title(with_ns=False).removeprefix(LANG_CONS_PREFIX)
-		# Skip subpages
-		if '/' in lang:
-			continue
 		# Skip if it's just a link to Wikipedia
 		if len(page.text) < 128 and any(temp.normal_name() == 'pedia' for temp in wikitextparser.parse(page.text).templates):
 			continue
@@ -40,7 +57,18 @@ def main():
 		else:
 			cat_link = lang_cons_cat.aslink(sort_key=lang)
 		new_text = f'{page.text}\n{cat_link}'
-		pywikibot_helpers.edit(page, new_text, reason, dry_run=DRY_RUN)
+		# Pages that were not edited (because the edit was declined or failed) would otherwise be left behind by the mark
+		if not pywikibot_helpers.edit(page, new_text, reason, dry_run=DRY_RUN, throttle=throttle) and state:
+			state.retry(page.title())
+	pywikibot_helpers.print_summary(stats)
+	if throttle:
+		print(throttle.report())
+	if state and not DRY_RUN:
+		state.commit()
+
+def is_candidate_title(title: str) -> bool:
+	'''Skip subpages, which can be decided from the title alone.'''
+	return '/' not in title.removeprefix(LANG_CONS_PREFIX)
 
 if __name__ == '__main__':
 	main()
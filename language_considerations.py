@@ -1,13 +1,19 @@
 import argparse
 import collections.abc
 import difflib
+import json
+import logging
+import queue
 import re
+import threading
+import time
 
 import pywikibot
 import pywikibot.pagegenerators
 import wikitextparser
 
 import pywikibot_helpers
+import throttles
 
 MOVE_SUMMARY = 'Moved to match the title of [[Wiktionary:English entry guidelines]] per [[Wiktionary talk:English entry guidelines#RFM discussion: November 2015–August 2018|old RFM]] and [[Wiktionary:Requests for moves, mergers and splits#Wiktionary:English entry guidelines vs "About (language)" in every other language|new RFM]]'
 REDIRECT_SUMMARY = 'Moved target to match the title of [[Wiktionary:English entry guidelines]] per [[Wiktionary talk:English entry guidelines#RFM discussion: November 2015–August 2018|old RFM]] and [[Wiktionary:Requests for moves, mergers and splits#Wiktionary:English entry guidelines vs "About (language)" in every other language|new RFM]]'
@@ -16,6 +22,11 @@ VERBOSE_FACTOR = 10
 BANNED_TITLE_PARTS = ['/', 'language', 'script', 'romanization', 'transliteration']
 # Reconstruction backlinks are acceptable because because [[Template:reconstructed]] links to the language consideration page for the term's language, causing every term in a reconstructed language to be a backlink
 ACCEPTABLE_BACKLINK_PREFIXES = ['Talk:', 'User:', 'Reconstruction:', 'Wiktionary:Beer parlour', 'Wiktionary:Etymology scriptorium', 'Wiktionary:Information desk', 'Wiktionary:Grease pit', 'Wiktionary:Tea room', 'Wiktionary:Requests for ', 'Wiktionary:Translation requests/archive', 'Wiktionary:News for editors/Archive', 'Wiktionary:Votes/', 'Wiktionary:Language treatment requests']
+# Matches every acceptable prefix at once, rather than trying them in turn for every backlink
+ACCEPTABLE_BACKLINK_PATTERN = re.compile('|'.join(re.escape(prefix) for prefix in ACCEPTABLE_BACKLINK_PREFIXES))
+# Namespaces every page of which is acceptable (see ACCEPTABLE_BACKLINK_PREFIXES), so backlinks from them need not even be listed
+USER_NS_ID = 2
+RECONSTRUCTION_NS_ID = 118
 LANG_CONS_CAT_TITLE = 'Category:Wiktionary language considerations'
 BACKLINK_DISPLAY_MAX = 200
 MAX_MAINSPACE_BACKLINKS = 12
@@ -25,110 +36,264 @@ def main():
 	parser.add_argument('-s', '--skip', nargs='*', default=[], help='A list of languages which should not have their language consideration pages moved.')
 	parser.add_argument('-d', '--dry_run', action='store_true')
 	parser.add_argument('-l', '--limit', type=int, default=-1)
+	modes = parser.add_mutually_exclusive_group()
+	modes.add_argument('-p', '--plan', help='Instead of asking what to do with each page, look up every page and its backlinks and write them to this JSON file for review. Entries whose "action" is changed from "move" to "skip" will not be moved by --execute.')
+	modes.add_argument('-e', '--execute', help='Carry out a plan written (and reviewed) with --plan, without asking for any confirmation.')
+	throttles.add_throttle_args(parser)
 	args = parser.parse_args()
 
 	site = pywikibot.Site()
-	lang_cons_cat = pywikibot.Category(site, LANG_CONS_CAT_TITLE)
-	lang_cons = pywikibot.pagegenerators.CategorizedPageGenerator(lang_cons_cat)
+	# Writing a plan saves nothing
+	throttle = None if args.dry_run or args.plan else throttles.throttle_from_args(args, site)
+	if args.plan:
+		write_plan(site, args.plan, args.skip, args.limit)
+	elif args.execute:
+		execute_plan(site, args.execute, args.limit, args.dry_run, throttle)
+	else:
+		review_interactively(site, args.skip, args.limit, args.dry_run, throttle)
+	if throttle:
+		print(throttle.report())
+
+class HeldOutput(logging.Filter):
+	'''Holds back pywikibot's output from threads other than the main one, so that it can be printed between prompts instead of over them.'''
+
+	def __init__(self):
+		super().__init__()
+		self.records = []
+
+	def filter(self, record: logging.LogRecord) -> bool:
+		if record.thread == threading.main_thread().ident or getattr(record, 'released', False):
+			return True
+		self.records.append(record)
+		return False
+
+	def release(self) -> None:
+		'''Prints the output held back so far.'''
+		records, self.records = self.records, []
+		for record in records:
+			record.released = True
+			logging.getLogger('pywiki').handle(record)
+
+def review_interactively(site: pywikibot.site.BaseSite, skip: list[str], limit: int = -1, dry_run: bool = False, throttle: throttles.AdaptiveThrottle | None = None) -> None:
+	lang_cons_pages = iter(pywikibot.pagegenerators.CategorizedPageGenerator(pywikibot.Category(site, LANG_CONS_CAT_TITLE)))
+	# pywikibot only sets up its output when it is first used, and would then replace the filter
+	pywikibot.bot.init_handlers()
+	held_output = HeldOutput()
+	handlers = logging.getLogger('pywiki').handlers
+	for handler in handlers:
+		handler.addFilter(held_output)
 	move_count = 0
-	for page in lang_cons:
-		if 0 <= args.limit <= move_count:
+	try:
+		# Look up the next page and its backlinks while the current one is being reviewed
+		next_lookup = look_up_in_background(lang_cons_pages, skip)
+		while True:
+			result, error = next_lookup.get()
+			if error:
+				raise error
+			notes, lookup = result
+			held_output.release()
+			for note in notes:
+				print(note)
+			if lookup is None or 0 <= limit <= move_count:
+				break
+			page, lang, backlinks = lookup
+			next_lookup = look_up_in_background(lang_cons_pages, skip)
+			print_backlinks(backlinks)
+			print('What now? (m = move it and and update backlinks; s = skip; q = quit)')
+			action = input('==> ').casefold()
+			held_output.release()
+			if action.startswith('s'):
+				continue
+			# If quit or invalid action chosen
+			if not action.startswith('m'):
+				return
+			if move_and_update_links(site, page, lang, backlinks, dry_run=dry_run, throttle=throttle):
+				move_count += 1
+	finally:
+		# The output of a lookup that is still running is no longer held back
+		for handler in handlers:
+			handler.removeFilter(held_output)
+		held_output.release()
+
+def look_up_in_background(lang_cons_pages: collections.abc.Iterator[pywikibot.Page], skip: list[str]) -> queue.Queue:
+	'''
+	Starts look_up_next() on a daemon thread, so that quitting does not wait for a lookup that is still running.
+	Returns a queue onto which the result of the lookup (or the error it raised) will be put, as (result, error).
+	'''
+	results = queue.Queue(maxsize=1)
+	def look_up() -> None:
+		try:
+			results.put((look_up_next(lang_cons_pages, skip), None))
+		except BaseException as error:
+			results.put((None, error))
+	threading.Thread(target=look_up, daemon=True).start()
+	return results
+
+def write_plan(site: pywikibot.site.BaseSite, plan_path: str, skip: list[str], limit: int = -1) -> None:
+	plan = []
+	for page, lang in find_candidates(site, skip):
+		if 0 <= limit <= len(plan):
 			break
-		title = page.title()
-		# If already done
-		if title.endswith(' entry guidelines'):
-			continue
-		title_lower = title.casefold()
-		if not title.startswith('Wiktionary:About ') or any(banned in title_lower for banned in BANNED_TITLE_PARTS):
-			print(f'Note: Skipping [[{title}]] because its title does not fit the expected pattern.')
-			continue
-		lang = title.removeprefix('Wiktionary:About ')
-		if lang in args.skip:
-			continue
-		if any(word[0].islower() for word in lang.split()):
-			print(f'Note: Skipping [[{title}]] because its language would not be titlecased.')
-			continue
+		backlinks = get_backlinks(page, lang)
+		plan.append({'title': page.title(), 'lang': lang, 'action': 'move', 'backlinks': {target: [bl.title for bl in links] for target, links in backlinks.items()}})
+		print(f'Planned [[{page.title()}]] with {sum(len(links) for links in backlinks.values())} relevant backlinks.')
+	with open(plan_path, 'w', encoding='utf-8') as plan_file:
+		json.dump(plan, plan_file, ensure_ascii=False, indent='\t')
+	print(f'Wrote a plan for {len(plan)} pages to {plan_path}.')
 
-		new_title = f'Wiktionary:{lang} entry guidelines'
-		backlinks = get_and_print_backlinks(page, lang)
-		print('What now? (m = move it and and update backlinks; s = skip; q = quit)')
-		action = input('==> ').casefold()
-		if action.startswith('s'):
+def execute_plan(site: pywikibot.site.BaseSite, plan_path: str, limit: int = -1, dry_run: bool = False, throttle: throttles.AdaptiveThrottle | None = None) -> None:
+	with open(plan_path, encoding='utf-8') as plan_file:
+		plan = json.load(plan_file)
+	move_count = 0
+	for entry in plan:
+		if 0 <= limit <= move_count:
+			break
+		if entry['action'] != 'move':
+			print(f'Note: Skipping [[{entry["title"]}]] as planned.')
 			continue
-		# If quit or invalid action chosen
-		if not action.startswith('m'):
-			return
+		# Backlinks deleted since the plan was written are dropped
+		backlinks = {target: list(pywikibot_helpers.page_records(site, titles)) for target, titles in entry['backlinks'].items()}
+		if move_and_update_links(site, pywikibot.Page(site, entry['title']), entry['lang'], backlinks, skip_confirmation=True, dry_run=dry_run, throttle=throttle):
+			move_count += 1
 
-		if args.dry_run:
-			print(f'Would move [[{title}]] to [[{new_title}]].')
-			new_page = page
-		else:
-			print(f'Moving [[{title}]] to [[{new_title}]].')
-			try:
-				# Move the page and its subpages (but leave backlinks for later)
-				pywikibot_helpers.advanced_move(page, new_title, MOVE_SUMMARY, backlinks='none', dry_run=args.dry_run)
-				new_page = pywikibot.Page(site, new_title)
-			except pywikibot.exceptions.LockedPageError:
-				print(f'Warning: Skipping [[{title}]] because the page is protected (so I can\'t move it).')
-				continue
-		move_count += 1
-
-		# Update backlinks
-		for link_target_title, links in backlinks.items():
-			non_mainspace_bls = [link for link in links if ':' in link.title()]
-			if len(links) - len(non_mainspace_bls) > MAX_MAINSPACE_BACKLINKS:
-				print(f'Warning: Skipping {len(links) - len(non_mainspace_bls)} backlinks which are in mainspace.')
-				links = non_mainspace_bls
-			subpage_part = link_target_title.partition('/')[2]
-			new_link_target_title = f'{new_title}/{subpage_part}' if subpage_part else new_title
-			for bl in links:
-				bl_title = bl.title()
-				if (bl_title.startswith('Template:') or bl_title.startswith('Module:')) and not bl_title.endswith('/documentation'):
-					print(f'Warning: [[{bl_title}]] links to [[{link_target_title}]], but I am NOT going to touch it since it\'s a template or module.')
-					continue
-				is_lang_code_redirect = bool(re.fullmatch(r'Wiktionary:A[A-Z]{2,3}(-[A-Z]{3})?', bl_title))
-				update_links(bl, link_target_title, new_link_target_title, skip_confirmation=is_lang_code_redirect, dry_run=args.dry_run)
-
-		# Remove redundant sort key
-		wikitext = wikitextparser.parse(new_page.text)
-		original_text = wikitext.string
+def find_candidates(site: pywikibot.site.BaseSite, skip: list[str]) -> collections.abc.Iterator[tuple[pywikibot.Page, str]]:
+	'''Yields each language considerations page that should be moved, along with its language.'''
+	lang_cons_cat = pywikibot.Category(site, LANG_CONS_CAT_TITLE)
+	for page in pywikibot.pagegenerators.CategorizedPageGenerator(lang_cons_cat):
+		lang, note = candidate_lang(page.title(), skip)
+		if note:
+			print(note)
+		if lang:
+			yield page, lang
+
+def candidate_lang(title: str, skip: list[str]) -> tuple[str | None, str | None]:
+	'''Returns the language of a language considerations page if it should be moved (or else None), along with a note to print about why it is skipped (if any).'''
+	# If already done
+	if title.endswith(' entry guidelines'):
+		return None, None
+	title_lower = title.casefold()
+	if not title.startswith('Wiktionary:About ') or any(banned in title_lower for banned in BANNED_TITLE_PARTS):
+		return None, f'Note: Skipping [[{title}]] because its title does not fit the expected pattern.'
+	lang = title.removeprefix('Wiktionary:About ')
+	if lang in skip:
+		return None, None
+	if any(word[0].islower() for word in lang.split()):
+		return None, f'Note: Skipping [[{title}]] because its language would not be titlecased.'
+	return lang, None
+
+def look_up_next(lang_cons_pages: collections.abc.Iterator[pywikibot.Page], skip: list[str]) -> tuple[list[str], tuple[pywikibot.Page, str, dict[str, list[pywikibot_helpers.PageRecord]]] | None]:
+	'''
+	Finds the next page to be moved and looks up its backlinks (or returns None if there are none left), along with notes about the pages skipped on the way.
+	Intended to be run in a background thread, so it prints nothing itself.
+	'''
+	notes = []
+	for page in lang_cons_pages:
+		lang, note = candidate_lang(page.title(), skip)
+		if note:
+			notes.append(note)
+		if lang:
+			return notes, (page, lang, get_backlinks(page, lang))
+	return notes, None
+
+def move_and_update_links(site: pywikibot.site.BaseSite, page: pywikibot.Page, lang: str, backlinks: dict[str, list[pywikibot_helpers.PageRecord]], skip_confirmation: bool = False, dry_run: bool = False, throttle: throttles.AdaptiveThrottle | None = None) -> bool:
+	'''
+	Moves a language considerations page and its subpages, updates their backlinks, and removes the redundant sort key.
+	skip_confirmation: Do not ask for confirmation before any edit (see pywikibot_helpers.edit()).
+	throttle: Pace the edits with this throttle rather than just pywikibot's.
+	Returns whether the page was moved.
+	'''
+	title = page.title()
+	new_title = f'Wiktionary:{lang} entry guidelines'
+	if dry_run:
+		print(f'Would move [[{title}]] to [[{new_title}]].')
+		new_page = page
+	else:
+		print(f'Moving [[{title}]] to [[{new_title}]].')
 		try:
-			cat_link = next(link for link in wikitext.wikilinks if link.title == LANG_CONS_CAT_TITLE)
-			old_sort_key = cat_link.text
-			# Modifies wikitext
-			cat_link.string = f'[[{LANG_CONS_CAT_TITLE}]]'
-			lang_lower = lang.casefold()
-			# Middle Dutch had "Dutch, Middle" as its sort key, which should have been preserved
-			if old_sort_key.rstrip() == lang:
-				pywikibot_helpers.edit(new_page, wikitext.string, SORT_KEY_SUMMARY, skip_confirmation=True, dry_run=args.dry_run, indent='\t')
+			# Move the page and its subpages (but leave backlinks for later)
+			pywikibot_helpers.advanced_move(page, new_title, MOVE_SUMMARY, backlinks='none', dry_run=dry_run, throttle=throttle)
+			new_page = pywikibot.Page(site, new_title)
+		except pywikibot.exceptions.LockedPageError:
+			print(f'Warning: Skipping [[{title}]] because the page is protected (so I can\'t move it).')
+			return False
+
+	# Update backlinks
+	updated_titles = []
+	last_update = None
+	for link_target_title, links in backlinks.items():
+		non_mainspace_bls = [link for link in links if link.ns != 0]
+		if len(links) - len(non_mainspace_bls) > MAX_MAINSPACE_BACKLINKS:
+			print(f'Warning: Skipping {len(links) - len(non_mainspace_bls)} backlinks which are in mainspace.')
+			links = non_mainspace_bls
+		subpage_part = link_target_title.partition('/')[2]
+		new_link_target_title = f'{new_title}/{subpage_part}' if subpage_part else new_title
+		to_update = []
+		for bl in links:
+			if (bl.title.startswith('Template:') or bl.title.startswith('Module:')) and not bl.title.endswith('/documentation'):
+				print(f'Warning: [[{bl.title}]] links to [[{link_target_title}]], but I am NOT going to touch it since it\'s a template or module.')
 			else:
-				print(f'Note: The sort key used at [[{new_title}]] is "{old_sort_key}", which does not match the language ({lang}), so I am NOT going to attempt to remove the sort key.')
-		except StopIteration:
-			print(f'Warning: Unable to find category link in [[{new_title}]] to [[{LANG_CONS_CAT_TITLE}]].')
+				to_update.append(bl.to_page(site))
+		# Fetch the text of the backlinks in batches, since they will all be edited
+		for bl in pywikibot.pagegenerators.PreloadingGenerator(to_update):
+			bl_title = bl.title()
+			is_lang_code_redirect = bool(re.fullmatch(r'Wiktionary:A[A-Z]{2,3}(-[A-Z]{3})?', bl_title))
+			if update_links(bl, link_target_title, new_link_target_title, skip_confirmation=skip_confirmation or is_lang_code_redirect, dry_run=dry_run, throttle=throttle):
+				updated_titles.append(bl_title)
+				last_update = time.monotonic()
 
-		# Confirm that all backlinks have been addressed
-		get_and_print_backlinks(page, lang)
-		print()
+	# Remove redundant sort key
+	wikitext = wikitextparser.parse(new_page.text)
+	original_text = wikitext.string
+	try:
+		cat_link = next(link for link in wikitext.wikilinks if link.title == LANG_CONS_CAT_TITLE)
+		old_sort_key = cat_link.text
+		# Modifies wikitext
+		cat_link.string = f'[[{LANG_CONS_CAT_TITLE}]]'
+		lang_lower = lang.casefold()
+		# Middle Dutch had "Dutch, Middle" as its sort key, which should have been preserved
+		if old_sort_key.rstrip() == lang:
+			pywikibot_helpers.edit(new_page, wikitext.string, SORT_KEY_SUMMARY, skip_confirmation=True, dry_run=dry_run, indent='\t', throttle=throttle)
+		else:
+			print(f'Note: The sort key used at [[{new_title}]] is "{old_sort_key}", which does not match the language ({lang}), so I am NOT going to attempt to remove the sort key.')
+	except StopIteration:
+		print(f'Warning: Unable to find category link in [[{new_title}]] to [[{LANG_CONS_CAT_TITLE}]].')
+
+	# Confirm that the pages that were edited no longer link to the old titles, without listing all the backlinks again
+	if not dry_run and updated_titles:
+		# Links are read from replicas, which may not have the edits yet. With maxlag the API refuses to answer (and pywikibot waits and retries) while they lag more than MAXLAG_TARGET seconds, so waiting that long after the last edit means they have it.
+		time.sleep(max(0, last_update + throttles.MAXLAG_TARGET - time.monotonic()))
+		# The API only accepts so many link targets at a time
+		for targets in pywikibot_helpers.batched(backlinks, pywikibot_helpers.API_TITLES_LIMIT):
+			for title, info in pywikibot_helpers.query_pages(site, updated_titles, prop='links', pltitles=targets, pllimit='max', maxlag=throttles.MAXLAG_TARGET):
+				for link in info.get('links', []):
+					print(f'Warning: [[{title}]] still links to [[{link["title"]}]].')
+	print()
+	return True
 
-def get_and_print_backlinks(parent_page: pywikibot.Page, lang: str) -> dict[str, list[pywikibot.Page]]:
-	'''Looks up, prints, and returns backlinks of the specified page and all its subpages.'''
+def get_backlinks(parent_page: pywikibot.Page, lang: str) -> dict[str, list[pywikibot_helpers.PageRecord]]:
+	'''Looks up and returns backlinks of the specified page and all its subpages.'''
 	page_with_subpages = [parent_page]
 	page_with_subpages.extend(pywikibot.pagegenerators.PrefixingPageGenerator(f'{parent_page.title()}/', site=parent_page.site))
-	backlinks: dict[str, list[pywikibot.Page]] = {}
-	for page in page_with_subpages:
-		page_title = page.title()
-		backlinks[page_title] = [bl for bl in page.backlinks(follow_redirects=False) if should_backlink_be_updated(bl.title(), lang)]
-		if backlinks[page_title]:
-			print(f'[[{page.title()}]] has the following relevant backlinks:')
-			for bl in backlinks[page_title][:BACKLINK_DISPLAY_MAX]:
-				print(f'\t{bl.title()}')
-			if len(backlinks[page_title]) > BACKLINK_DISPLAY_MAX:
-				print(f'Warning: {len(backlinks[page_title]) - BACKLINK_DISPLAY_MAX} more backlinks not shown.')
+	namespaces = backlink_namespaces(parent_page.site)
+	return {page.title(): [bl for bl in pywikibot_helpers.list_records(parent_page.site, 'backlinks', bltitle=page.title(), blnamespace=namespaces) if should_backlink_be_updated(bl.title, lang)] for page in page_with_subpages}
+
+def backlink_namespaces(site: pywikibot.site.BaseSite) -> list[int]:
+	'''The namespaces in which backlinks might need updating: every content namespace except those that are acceptable in their entirety (including all talk namespaces).'''
+	return [ns_id for ns_id in site.namespaces if ns_id >= 0 and ns_id % 2 == 0 and ns_id not in (USER_NS_ID, RECONSTRUCTION_NS_ID)]
+
+def print_backlinks(backlinks: dict[str, list[pywikibot_helpers.PageRecord]]) -> None:
+	for page_title, links in backlinks.items():
+		if links:
+			print(f'[[{page_title}]] has the following relevant backlinks:')
+			for bl in links[:BACKLINK_DISPLAY_MAX]:
+				print(f'\t{bl.title}')
+			if len(links) > BACKLINK_DISPLAY_MAX:
+				print(f'Warning: {len(links) - BACKLINK_DISPLAY_MAX} more backlinks not shown.')
 		else:
-			print(f'[[{page.title()}]] has no relevant backlinks.')
-	return backlinks
+			print(f'[[{page_title}]] has no relevant backlinks.')
 
-def update_links(page: pywikibot.Page, old_target: str, new_target: str, skip_confirmation: bool = False, dry_run: bool = False) -> None:
+def update_links(page: pywikibot.Page, old_target: str, new_target: str, skip_confirmation: bool = False, dry_run: bool = False, throttle: throttles.AdaptiveThrottle | None = None) -> bool:
+	'''Returns whether the page was edited (or would have been, if dry_run).'''
 	wikitext = wikitextparser.parse(page.text)
 	original_text = wikitext.string
 	for link in wikitext.wikilinks:
@@ -138,15 +303,14 @@ def update_links(page: pywikibot.Page, old_target: str, new_target: str, skip_co
 			if link.text == old_target.partition(':')[2]:
 				link.text = new_target.partition(':')[2]
 	summary = REDIRECT_SUMMARY if original_text[:9].casefold() == '#redirect' else f'Updated links to [[{new_target}]]'
-	if not pywikibot_helpers.edit(page, wikitext.string, summary, skip_confirmation, dry_run, indent='\t'):
+	edited = pywikibot_helpers.edit(page, wikitext.string, summary, skip_confirmation, dry_run, indent='\t', throttle=throttle)
+	if not edited:
 		print(f'\tWarning: Did NOT update the link to [[{old_target}]] at [[{page.title()}]].')
 	print()
+	return edited
 
 def should_backlink_be_updated(backlink: str, lang: str) -> bool:
-	for good_prefix in ACCEPTABLE_BACKLINK_PREFIXES:
-		if backlink.startswith(good_prefix):
-			return False
-	if ' talk:' in backlink:
+	if ACCEPTABLE_BACKLINK_PATTERN.match(backlink) or ' talk:' in backlink:
 		return False
 	if backlink == f'Category:{lang} language':
 		return False
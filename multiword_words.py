@@ -1,10 +1,15 @@
 import argparse
+import collections
 import re
 
 import pywikibot
 import pywikibot.pagegenerators
 import wikitextparser
 
+import pywikibot_helpers
+import run_state
+import throttles
+
 T_CAT_NAMES = {'cat', 'categorize'}
 T_CLN_NAMES = {'cln', 'catlangname'}
 
@@ -14,13 +19,27 @@ def main():
 	parser.add_argument('-l', '--limit', default=10**9, type=int, help='The maximum number of pages to edit.')
 	parser.add_argument('-d', '--dry-run', action='store_true', help='Save each page locally after processing it instead of saving remotely.')
 	parser.add_argument('-v', '--verbose', action='store_true')
+	parser.add_argument('--incremental', action='store_true', help='Only check pages that were added to the category since the last run with this option (falling back to a full scan the first time).')
+	throttles.add_throttle_args(parser)
 	args = parser.parse_args()
 	CATEGORY_NAME = f'Category:English {args.syllable_count}-syllable words'
 	CATEGORY_LINK = f'\n[[{CATEGORY_NAME}]]'
 
+	def template_arg_is_cat(te_name, te_argument):
+		return te_argument.positional and ((te_name in T_CAT_NAMES and te_argument.value == CATEGORY_NAME) or (te_name in T_CLN_NAMES and te_argument.value == CATEGORY_NAME.removeprefix('Category:English ')))
+
 	site = pywikibot.Site()
+	throttle = throttles.throttle_from_args(args, site)
 	cat = pywikibot.Category(site, CATEGORY_NAME)
-	gen = pywikibot.pagegenerators.CategorizedPageGenerator(cat)
+	state = run_state.IncrementalState(f'multiword_words:{CATEGORY_NAME}') if args.incremental else None
+	changed_titles = state.changed_titles(site, category=cat) if state else None
+	if changed_titles is None:
+		listed_pages = pywikibot.pagegenerators.CategorizedPageGenerator(cat)
+	else:
+		listed_pages = (pywikibot.Page(site, title) for title in sorted(changed_titles))
+	# Only fetch (in batches) the pages that could be multiword terms
+	stats = collections.Counter()
+	gen = pywikibot.pagegenerators.PreloadingGenerator(pywikibot_helpers.filter_titles(listed_pages, lambda title: ' ' in title, stats))
 	page_count = 0
 	for page in gen:
 		if page_count >= args.limit:
@@ -70,14 +89,18 @@ def main():
 					if args.verbose:
 						print(f'Saving {filename}.')
 				else:
-					page.save(summary=f'Remove term containing a space from [[:{CATEGORY_NAME}]] ([[Wiktionary:Beer parlour/2022/October#Category:English words by number of syllables|discussion]]).', botflag=True, quiet=not args.verbose)
+					throttles.throttled_save(page, throttle, summary=f'Remove term containing a space from [[:{CATEGORY_NAME}]] ([[Wiktionary:Beer parlour/2022/October#Category:English words by number of syllables|discussion]]).', botflag=True, quiet=not args.verbose)
 				page_count += 1
 			else:
 				print(f'Error: Unable to determine why [[{page.title()}]] is in {CATEGORY_NAME}.')
+	# Only advance the mark after a complete run, so pages beyond the limit are seen again next time
+	else:
+		if state and not args.dry_run:
+			state.commit()
+	pywikibot_helpers.print_summary(stats)
+	if throttle:
+		print(throttle.report())
 
 
-		def template_arg_is_cat(te_name, te_argument):
-			return te_argument.positional and ((te_name in T_CAT_NAMES and te_argument.value == CATEGORY_NAME) or (te_name in T_CLN_NAMES and te_argument.value == CATEGORY_NAME.removeprefix('Category:English ')))
-
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,125 @@
+'''
+A page store: the texts of many pages extracted once from a dump (see dumps.py) into an uncompressed file, so that repeated offline scans (dry runs, benchmarks, indexing) do not decompress the dump every time.
+The store is two files: the texts, UTF-8 encoded and concatenated, and an index beside it (with .index added to the name) listing the title, namespace, page ID, revision ID, offset, and length of every page, sorted by title.
+The texts are memory-mapped, so reading a page is a slice of the map rather than a read of the file.
+Extracting more pages into an existing store appends their texts (a page extracted again supersedes its old text, which is left in place).
+'''
+
+import argparse
+import bisect
+import mmap
+import os
+from typing import Iterable, Iterator
+
+import dumps
+import pywikibot_helpers
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('dump_path', help='The multistream dump to extract pages from.')
+	parser.add_argument('store_path', help='The page store to extract them into.')
+	parser.add_argument('-n', '--namespaces', type=int, nargs='+', help='Only extract pages in these namespaces.')
+	parser.add_argument('-p', '--pages', help='A text file (optionally compressed, or - for standard input) listing the titles of the pages to extract (one per line). By default every page is extracted.')
+	args = parser.parse_args()
+
+	dump = dumps.MultistreamDump(args.dump_path)
+	pages = dump.pages(pywikibot_helpers.read_titles(args.pages)) if args.pages else dump.scan()
+	if args.namespaces:
+		namespaces = set(args.namespaces)
+		pages = (page for page in pages if page.ns in namespaces)
+	print(f'Extracted {extract(pages, args.store_path)} pages.')
+
+def extract(pages: Iterable[dumps.DumpPage], store_path: str) -> int:
+	'''Appends the given pages to a page store (creating it if need be) and rewrites its index. Returns how many pages were extracted.'''
+	records = {record.title: record for record in read_index(store_path)}
+	count = 0
+	with open(store_path, 'ab') as store_file:
+		offset = store_file.tell()
+		for page in pages:
+			data = page.text.encode('utf-8')
+			store_file.write(data)
+			records[page.title] = pywikibot_helpers.PageRecord(page.pageid, page.ns, page.title, page.revid, offset, len(data))
+			offset += len(data)
+			count += 1
+	# Written to the side and then moved into place, so that a store is never left with a partial index
+	with open(f'{store_path}.index.tmp', 'w', encoding='utf-8') as index_file:
+		for title in sorted(records):
+			record = records[title]
+			print(record.title, record.ns, record.pageid, record.revid, record.text_offset, record.text_length, sep='\t', file=index_file)
+	os.replace(f'{store_path}.index.tmp', f'{store_path}.index')
+	return count
+
+def read_index(store_path: str) -> list[pywikibot_helpers.PageRecord]:
+	'''Returns a record of every page in a page store (sorted by title), with text_offset and text_length giving where its text is in bytes. Returns an empty list if there is no such store.'''
+	records = []
+	try:
+		with open(f'{store_path}.index', encoding='utf-8') as index_file:
+			for line in index_file:
+				title, ns, pageid, revid, offset, length = line.rstrip('\n').split('\t')
+				records.append(pywikibot_helpers.PageRecord(int(pageid), int(ns), title, int(revid), int(offset), int(length)))
+	except FileNotFoundError:
+		pass
+	return records
+
+class PageStore:
+	'''
+	Read access to a page store made with extract(). Use it as a context manager (or call close()) to unmap the texts.
+	'''
+
+	def __init__(self, store_path: str):
+		self.records = read_index(store_path)
+		self.titles = [record.title for record in self.records]
+		with open(store_path, 'rb') as store_file:
+			# An empty file cannot be mapped
+			self.map = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(store_path) else None
+		self.view = memoryview(self.map) if self.map else memoryview(b'')
+
+	def __enter__(self) -> 'PageStore':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close()
+
+	def __len__(self) -> int:
+		return len(self.records)
+
+	def record(self, title: str) -> pywikibot_helpers.PageRecord | None:
+		i = bisect.bisect_left(self.titles, title)
+		return self.records[i] if i < len(self.titles) and self.titles[i] == title else None
+
+	def data(self, record: pywikibot_helpers.PageRecord) -> bytes:
+		'''The UTF-8 encoded text of a page, copied out of the map so that it can outlive the store.'''
+		return bytes(self.span(record))
+
+	def text(self, record: pywikibot_helpers.PageRecord) -> str:
+		# Decoded straight from the map, without copying the bytes first
+		return str(self.span(record), 'utf-8')
+
+	def span(self, record: pywikibot_helpers.PageRecord) -> memoryview:
+		'''A view of the text of a page in the map. It must not be kept, since close() cannot unmap the texts while any such view is alive.'''
+		return self.view[record.text_offset:record.text_offset + record.text_length]
+
+	def page(self, title: str) -> dumps.DumpPage | None:
+		'''Looks up a single page, like dumps.MultistreamDump.page(). Returns None if the page is not in the store.'''
+		record = self.record(title)
+		return None if record is None else self.to_dump_page(record)
+
+	def pages(self, titles: Iterable[str] | None = None) -> Iterator[dumps.DumpPage]:
+		'''
+		Yields the pages with the given titles (or every page) that are in the store, in the order of their texts in the store so that the map is read front to back.
+		The pages are like those from a dump, so the store can be used wherever a dump can.
+		'''
+		records = self.records if titles is None else (self.record(title) for title in set(titles))
+		for record in sorted((record for record in records if record), key=lambda record: record.text_offset):
+			yield self.to_dump_page(record)
+
+	def to_dump_page(self, record: pywikibot_helpers.PageRecord) -> dumps.DumpPage:
+		return dumps.DumpPage(record.title, record.ns, record.pageid, record.revid, self.text(record))
+
+	def close(self) -> None:
+		self.view.release()
+		if self.map:
+			self.map.close()
+
+if __name__ == '__main__':
+	main()
@@ -1,14 +1,32 @@
 import argparse
+import bz2
+import collections
 import difflib
+import gzip
+import io
 import itertools
+import lzma
+import sys
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, TextIO
 
 import pywikibot
+import pywikibot.data.api
 import pywikibot.pagegenerators
 import wikitextparser
 
+import throttles
+# Only for annotations, since run_state uses this module
+if TYPE_CHECKING:
+	import run_state
+
 REDIRECT_PREFIX = '#redirect'
+# The maximum number of titles a (non-bot) user can query at once
+API_TITLES_LIMIT = 50
+MOVE_PLAN_DESCRIPTIONS = {'move': 'Move', 'redirect': 'Update redirect', 'skip': 'Skip (destination exists)'}
+# How many times save_transformed() tries to save a page that someone else keeps editing
+SAVE_ATTEMPTS = 3
 
-def advanced_move(old_page: pywikibot.Page, new_title: str, move_reason: str, backlinks: str | None = None, redirect_reason: str | None = None, link_reason: str | None = None, ignore_subpages: bool = False, dry_run: bool = False):
+def advanced_move(old_page: pywikibot.Page, new_title: str, move_reason: str, backlinks: str | None = None, redirect_reason: str | None = None, link_reason: str | None = None, ignore_subpages: bool = False, dry_run: bool = False, throttle: throttles.AdaptiveThrottle | None = None):
 	'''
 	old_page: The page to move.
 	new_title: The new title to move the page to.
@@ -20,56 +38,95 @@ def advanced_move(old_page: pywikibot.Page, new_title: str, move_reason: str, ba
 	link_reason: The edit summary to use when updating a link to a page that has been moved.
 	ignore_subpages: Indicates that any subpages of the page to move should not be moved (and should therefore not have backlinks updated).
 	dry_run: Indicates that no moves or edits should actually be made, but these actions should just be previewed.
+	throttle: Pace the moves and edits (of the page, its subpages, and their backlinks) with this throttle rather than just pywikibot's.
 	'''
 
-	move_page_or_update_redirect(old_page, new_title, move_reason, dry_run)
+	move_page_or_update_redirect(old_page, new_title, move_reason, dry_run, throttle)
 	if backlinks != 'none':
-		update_backlinks(old_page, new_title, backlinks, redirect_reason, link_reason, dry_run=dry_run)
+		update_backlinks(old_page, new_title, backlinks, redirect_reason, link_reason, dry_run=dry_run, throttle=throttle)
 
-	subpage_prefix = f'{old_page.title()}/'
 	# Despite pywikibot.BasePage.move() having a movesubpages parameter that defaults to True, this method does not actually move subpages in my experience as of pywikibot v9.6.1.
 	if not ignore_subpages:
-		for subpage in pywikibot.pagegenerators.PrefixingPageGenerator(subpage_prefix, site=old_page.site):
-			new_subpage_title = f'{new_title}/{subpage.title()[len(subpage_prefix):]}'
-			move_page_or_update_redirect(subpage, new_subpage_title, move_reason, dry_run)
+		plan = plan_subpage_moves(old_page, new_title)
+		if plan:
+			print(f'Plan for the {len(plan)} subpages of [[{old_page.title()}]]:')
+			for subpage, new_subpage_title, action in plan:
+				print(f'\t{MOVE_PLAN_DESCRIPTIONS[action]}: [[{subpage.title()}]] -> [[{new_subpage_title}]]')
+		for subpage, new_subpage_title, action in plan:
+			execute_move(subpage, new_subpage_title, action, move_reason, dry_run, throttle)
 			if backlinks != 'none':
-				update_backlinks(subpage, new_subpage_title, backlinks, redirect_reason, link_reason, dry_run=dry_run)
+				update_backlinks(subpage, new_subpage_title, backlinks, redirect_reason, link_reason, dry_run=dry_run, throttle=throttle)
 
-def move_page_or_update_redirect(old_page: pywikibot.Page, new_title: str, reason: str, dry_run: bool = False):
-	old_title = old_page.title()
+def plan_subpage_moves(old_page: pywikibot.Page, new_title: str) -> list[tuple[pywikibot.Page, str, str]]:
+	'''
+	Decides what to do with each subpage of old_page when it is moved to new_title, using a few batched queries rather than trying each move: 'move' it, update it if it is a 'redirect', or 'skip' it because the destination already exists.
+	Returns a list of (subpage, new subpage title, action).
+	'''
+	subpage_prefix = f'{old_page.title()}/'
+	# The listing already says which subpages are redirects
+	subpages = list(pywikibot.pagegenerators.PrefixingPageGenerator(subpage_prefix, site=old_page.site))
+	new_subpage_titles = [f'{new_title}/{subpage.title()[len(subpage_prefix):]}' for subpage in subpages]
+	dst_info = page_info(old_page.site, new_subpage_titles)
+	plan = []
+	for subpage, new_subpage_title in zip(subpages, new_subpage_titles):
+		if subpage.isRedirectPage():
+			action = 'redirect'
+		elif 'missing' not in dst_info[new_subpage_title]:
+			action = 'skip'
+		else:
+			action = 'move'
+		plan.append((subpage, new_subpage_title, action))
+	# Fetch the text of all the redirects that need updating in batches too
+	redirects = [subpage for subpage, _, action in plan if action == 'redirect']
+	for _ in old_page.site.preloadpages(redirects):
+		pass
+	return plan
 
+def move_page_or_update_redirect(old_page: pywikibot.Page, new_title: str, reason: str, dry_run: bool = False, throttle: throttles.AdaptiveThrottle | None = None):
 	if dry_run:
+		execute_move(old_page, new_title, 'move', reason, dry_run)
+	else:
+		execute_move(old_page, new_title, 'redirect' if startswith_casefold(old_page.text, REDIRECT_PREFIX) else 'move', reason, dry_run, throttle)
+
+def execute_move(old_page: pywikibot.Page, new_title: str, action: str, reason: str, dry_run: bool = False, throttle: throttles.AdaptiveThrottle | None = None):
+	'''
+	action: What to do with old_page; one of the actions decided by plan_subpage_moves().
+	throttle: Pace the move (or the edit of a redirect) with this throttle rather than just pywikibot's.
+	'''
+	old_title = old_page.title()
+
+	if action == 'skip':
+		print(f'Warning: Skipping [[{old_title}]] because [[{new_title}]] already exists.')
+	elif dry_run:
 		print(f'Would move [[{old_title}]] to [[{new_title}]].')
+	elif action == 'redirect':
+		print(f'Updating [[{old_title}]] to redirect to [[{new_title}]].')
+		wikitext = wikitextparser.parse(old_page.text)
+		redirect_link = wikitext.wikilinks[0]
+		redirect_link.title = new_title
+		edit(old_page, wikitext.string, reason, skip_confirmation=True, dry_run=dry_run, throttle=throttle)
 	else:
-		if startswith_casefold(old_page.text, REDIRECT_PREFIX):
-			print(f'Updating [[{old_title}]] to redirect to [[{new_title}]].')
-			wikitext = wikitextparser.parse(old_page.text)
-			redirect_link = wikitext.wikilinks[0]
-			redirect_link.title = new_title
-			edit(old_page, wikitext.string, reason, skip_confirmation=True, dry_run=dry_run)
-		else:
-			print(f'Moving [[{old_title}]] to [[{new_title}]].')
-			try:
-				old_page.move(new_title, reason, movesubpages=False)
-			# If the parent page has already been moved, proceed normally
-			except pywikibot.exceptions.ArticleExistsConflictError:
-				print(f'Warning: Skipping [[{old_title}]] because [[{new_title}]] already exists.')
-				pass
+		print(f'Moving [[{old_title}]] to [[{new_title}]].')
+		try:
+			throttles.throttled_move(old_page, new_title, throttle, reason=reason, movesubpages=False)
+		# If the parent page has already been moved, proceed normally
+		except pywikibot.exceptions.ArticleExistsConflictError:
+			print(f'Warning: Skipping [[{old_title}]] because [[{new_title}]] already exists.')
 
-def update_backlinks(old_page: pywikibot.Page, new_title: str, type_: str = 'all', redirect_reason: str | None = None, link_reason: str | None = None, skip_confirmation: bool = False, dry_run: bool = False) -> None:
+def update_backlinks(old_page: pywikibot.Page, new_title: str, type_: str = 'all', redirect_reason: str | None = None, link_reason: str | None = None, skip_confirmation: bool = False, dry_run: bool = False, throttle: throttles.AdaptiveThrottle | None = None) -> None:
 	'''
 	A wrapper that calls update_backlinks_single_page on a given page and its talk page. (If a talk page is given it and its corresponding normal page are moved.)
 	type_: Indicates which kinds of backlinks should be updated.
 		'all': Both redirects and links from other pages.
 		'redirects': Just redirects.
 		'links': Just links from other pages.
-	skip_confirmation: See edit().
+	skip_confirmation, throttle: See edit().
 	'''
-	update_backlinks_single_page(old_page, new_title, type_, redirect_reason, link_reason, skip_confirmation, dry_run)
+	update_backlinks_single_page(old_page, new_title, type_, redirect_reason, link_reason, skip_confirmation, dry_run, throttle)
 	new_page = pywikibot.Page(old_page.site, new_title)
-	update_backlinks_single_page(old_page.toggleTalkPage(), new_page.toggleTalkPage().title(), type_, redirect_reason, link_reason, skip_confirmation, dry_run)
+	update_backlinks_single_page(old_page.toggleTalkPage(), new_page.toggleTalkPage().title(), type_, redirect_reason, link_reason, skip_confirmation, dry_run, throttle)
 
-def update_backlinks_single_page(old_page: pywikibot.Page, new_title: str, type_: str = 'all', redirect_reason: str | None = None, link_reason: str | None = None, skip_confirmation: bool = False, dry_run: bool = False) -> None:
+def update_backlinks_single_page(old_page: pywikibot.Page, new_title: str, type_: str = 'all', redirect_reason: str | None = None, link_reason: str | None = None, skip_confirmation: bool = False, dry_run: bool = False, throttle: throttles.AdaptiveThrottle | None = None) -> None:
 	old_title = old_page.title()
 
 	for source_page in old_page.backlinks(follow_redirects=False):
@@ -97,10 +154,10 @@ def update_backlinks_single_page(old_page: pywikibot.Page, new_title: str, type_
 				# If the link text is just the page title with the namespace removed, update it to use the new page title
 				if ':' in old_title and link.text == old_title.partition(':')[2]:
 					link.text = new_title.partition(':')[2]
-		if not edit(page, wikitext.string, specific_reason, skip_confirmation, dry_run, indent='\t\t'):
+		if not edit(page, wikitext.string, specific_reason, skip_confirmation, dry_run, indent='\t\t', throttle=throttle):
 			print(f'\tWarning: Unable to update the link to [[{old_target}]] at [[{page.title()}]].')
 
-def edit(page: pywikibot.Page, new_text: str, reason: str, skip_confirmation: bool = False, dry_run: bool = False, indent: str = '') -> None:
+def edit(page: pywikibot.Page, new_text: str, reason: str, skip_confirmation: bool = False, dry_run: bool = False, indent: str = '', throttle: throttles.AdaptiveThrottle | None = None) -> bool:
 	'''
 	page: The page to edit. In order for the edit diff to be accurate page.text must not have been altered.
 	new_text: The updated text of the entire page.
@@ -108,6 +165,7 @@ def edit(page: pywikibot.Page, new_text: str, reason: str, skip_confirmation: bo
 	skip_confirmation (default False): Do not ask for confirmation before saving the edit. This value is ignored and no confirmation is asked for if dry_run is True.
 	dry_run (default False): Do not save the edit; just preview it.
 	indent (defaults to the empty string): A string to print before each of this function's messages. Intended to be used when this function is called many times within a larger program.
+	throttle (default None): Pace the save with this throttle rather than just pywikibot's.
 	'''
 
 	def print_with_indent(message):
@@ -132,14 +190,296 @@ def edit(page: pywikibot.Page, new_text: str, reason: str, skip_confirmation: bo
 			confirmation = input(f'{indent}==> ').casefold()
 			if not confirmation.startswith('y'):
 				return False
+		base_revid = page.latest_revision_id
 		page.text = new_text
 		try:
-			page.save(summary=reason)
+			throttles.throttled_save(page, throttle, summary=reason, baserevid=base_revid)
 		except pywikibot.exceptions.LockedPageError:
 			print_with_indent(f'Error: Unable to save edit at [[{title}]] because the page is protected.')
 			return False
+		except pywikibot.exceptions.EditConflictError:
+			print_with_indent(f'Error: Unable to save edit at [[{title}]] because someone else has edited it since it was fetched.')
+			return False
 	return True
 
+def save_transformed(page: pywikibot.Page, transform: Callable[[str], str], summary: str | Callable[[], str], max_attempts: int = SAVE_ATTEMPTS, throttle: throttles.AdaptiveThrottle | None = None, edit_log: 'run_state.EditLog | None' = None, **save_kwargs) -> bool:
+	'''
+	Saves the result of applying transform to the text of page, with the revision it was computed from passed along so that the wiki rejects the edit if the page has been edited since instead of silently overwriting that edit.
+	On an edit conflict just this page is fetched again and transform is reapplied to its latest text, up to max_attempts times in all.
+	page: The page to edit. page.text must not have been altered.
+	transform: Computes the new text of the page from its current text. It is called again on every attempt, so it should not have side effects (other than recording what it did for summary).
+	summary: The edit summary to pass to page.save(), or a function returning it that is called after transform on every attempt, for a summary that depends on what transform changed.
+	throttle: Pace saves with this throttle rather than just pywikibot's.
+	edit_log: Record the edit here.
+	save_kwargs: Other arguments to pass to page.save().
+	Returns whether the page was saved (False if transform did not change it or every attempt conflicted).
+	'''
+	title = page.title()
+	for attempt in range(1, max_attempts + 1):
+		base_revid = page.latest_revision_id
+		old_text = page.text
+		new_text = transform(old_text)
+		if new_text == old_text:
+			return False
+		page.text = new_text
+		try:
+			throttles.throttled_save(page, throttle, summary=summary if isinstance(summary, str) else summary(), baserevid=base_revid, **save_kwargs)
+			# The wiki does not make a revision if the text turned out not to change after all
+			if edit_log and page.latest_revision_id != base_revid:
+				edit_log.record(title, base_revid, page.latest_revision_id)
+			return True
+		except pywikibot.exceptions.EditConflictError:
+			print(f'Warning: Edit conflict at [[{title}]] (attempt {attempt} of {max_attempts}).')
+			del page.text
+			page.get(force=True)
+	print(f'Error: Gave up on editing [[{title}]] after {max_attempts} edit conflicts.')
+	return False
+
+class LinkRefreshQueue:
+	'''
+	Collects the titles of pages whose links (including categories) need refreshing, for example templates whose documentation was just edited, and refreshes them in batches of API_TITLES_LIMIT with action=purge&forcelinkupdate, instead of a null edit (Page.touch()) for each.
+	Use it as a context manager (or call flush() at the end) so that the last partial batch is refreshed too.
+	max_attempts: How many times to try to refresh pages that the API reports it did not refresh.
+	dry_run: Only print the titles that would be refreshed.
+	'''
+
+	def __init__(self, site: pywikibot.site.BaseSite, max_attempts: int = SAVE_ATTEMPTS, dry_run: bool = False):
+		self.site = site
+		self.max_attempts = max_attempts
+		self.dry_run = dry_run
+		self.titles = []
+		self.stats = collections.Counter()
+
+	def __enter__(self) -> 'LinkRefreshQueue':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.flush()
+
+	def add(self, title: str) -> None:
+		self.titles.append(title)
+		if len(self.titles) >= API_TITLES_LIMIT:
+			self.flush()
+
+	def flush(self) -> None:
+		titles, self.titles = self.titles, []
+		if not titles:
+			return
+		if self.dry_run:
+			print(f'Would refresh the links of {len(titles)} pages: {", ".join(titles)}')
+			return
+		for attempt in range(1, self.max_attempts + 1):
+			self.stats['requests'] += 1
+			result = self.site.simple_request(action='purge', titles=titles, forcelinkupdate=True).submit()
+			# Pages that do not exist have nothing to refresh, so they are not retried
+			titles = [page['title'] for page in result.get('purge', []) if not ('purged' in page and 'linkupdate' in page) and 'missing' not in page and 'invalid' not in page]
+			self.stats['refreshed'] += sum('purged' in page and 'linkupdate' in page for page in result.get('purge', []))
+			if not titles:
+				return
+			print(f'Warning: Failed to refresh the links of {len(titles)} pages (attempt {attempt} of {self.max_attempts}).')
+		self.stats['failed'] += len(titles)
+		print(f'Error: Gave up on refreshing the links of {", ".join(titles)}.')
+
+def query_pages(site: pywikibot.site.BaseSite, titles: Iterable[str], **params) -> Iterator[tuple[str, dict]]:
+	'''
+	Runs a query (action=query with the given parameters, typically a prop) for the given titles in batches of API_TITLES_LIMIT, following continuations, and yields each title with the result for its page.
+	List-valued properties that are split across continuations are merged.
+	If params includes redirects=True, the result is that of the page the title redirects to, if any.
+	'''
+	for batch in batched(titles, API_TITLES_LIMIT):
+		pages = {}
+		normalized = {}
+		redirects = {}
+		continue_params = {}
+		while True:
+			result = site.simple_request(action='query', titles=batch, **params, **continue_params).submit()
+			query = result.get('query', {})
+			normalized.update((item['from'], item['to']) for item in query.get('normalized', []))
+			redirects.update((item['from'], item['to']) for item in query.get('redirects', []))
+			result_pages = query.get('pages', {})
+			for page in (result_pages.values() if isinstance(result_pages, dict) else result_pages):
+				merged = pages.setdefault(page['title'], {})
+				for key, value in page.items():
+					if isinstance(value, list):
+						merged.setdefault(key, []).extend(value)
+					else:
+						merged[key] = value
+			if 'continue' not in result:
+				break
+			continue_params = result['continue']
+		for title in batch:
+			normal_title = normalized.get(title, title)
+			target_title = redirects.get(normal_title, normal_title)
+			yield title, pages.get(target_title, {'title': target_title, 'missing': ''})
+
+def page_info(site: pywikibot.site.BaseSite, titles: Iterable[str], resolve_redirects: bool = False) -> dict[str, dict]:
+	'''
+	Looks up basic information (prop=info) about many pages at once. The result for a page that does not exist has a 'missing' key, and that of a redirect has a 'redirect' key.
+	resolve_redirects: Give the information of the target of each redirect instead.
+	'''
+	params = {'prop': 'info'}
+	if resolve_redirects:
+		params['redirects'] = True
+	return dict(query_pages(site, titles, **params))
+
+class PageRecord:
+	'''
+	Just enough about a page to identify it, for holding many pages at once in bulk jobs: unlike a pywikibot.Page it carries no site, caches, or text, and it can be pickled (for example to send to worker processes).
+	Convert it to a pywikibot.Page with to_page() only when the page is to be fetched or saved.
+	text_offset, text_length: Where the text of the page is in a buffer shared by many records, if it has been stored in one.
+	'''
+	__slots__ = ('pageid', 'ns', 'title', 'revid', 'text_offset', 'text_length')
+
+	def __init__(self, pageid: int, ns: int, title: str, revid: int | None = None, text_offset: int | None = None, text_length: int | None = None):
+		self.pageid = pageid
+		self.ns = ns
+		self.title = title
+		self.revid = revid
+		self.text_offset = text_offset
+		self.text_length = text_length
+
+	def __repr__(self) -> str:
+		return f'PageRecord({self.pageid!r}, {self.ns!r}, {self.title!r}, {self.revid!r})'
+
+	@classmethod
+	def from_api(cls, info: dict) -> 'PageRecord':
+		'''Makes a record from a page as described by the API, for example in a list or in the pages of a query for prop=info.'''
+		return cls(info['pageid'], info['ns'], info['title'], info.get('lastrevid', info.get('revid')))
+
+	def to_page(self, site: pywikibot.site.BaseSite) -> pywikibot.Page:
+		return pywikibot.Page(site, self.title)
+
+	def text_in(self, buffer: str) -> str:
+		return buffer[self.text_offset:self.text_offset + self.text_length]
+
+def list_records(site: pywikibot.site.BaseSite, list_name: str, **params) -> Iterator[PageRecord]:
+	'''
+	Yields a record for each page in an API list (such as list=categorymembers or list=backlinks), without ever making a pywikibot.Page.
+	params: The parameters of the list, including its prefix (for example cmtitle for list=categorymembers).
+	'''
+	for info in pywikibot.data.api.ListGenerator(list_name, site=site, parameters=params):
+		yield PageRecord.from_api(info)
+
+def page_records(site: pywikibot.site.BaseSite, titles: Iterable[str]) -> Iterator[PageRecord]:
+	'''Yields a record for each of titles that exists (in batches of API_TITLES_LIMIT).'''
+	for _, info in query_pages(site, titles, prop='info'):
+		if 'missing' not in info and 'invalid' not in info:
+			yield PageRecord.from_api(info)
+
+def filter_by_templates(pages: Iterable[pywikibot.Page], template_titles: list[str], stats: collections.Counter | None = None) -> Iterator[pywikibot.Page]:
+	'''
+	Yields only the pages that transclude at least one of the given templates, as recorded by the server (prop=templates), so that pages that have no use of them (for example because they have already been handled) can be skipped in batches without fetching their text.
+	stats: A counter to which to add how many pages were checked and how many were eliminated, for print_summary().
+	'''
+	for batch in batched(pages, API_TITLES_LIMIT):
+		results = dict(query_pages(batch[0].site, [page.title() for page in batch], prop='templates', tltemplates=template_titles, tllimit='max'))
+		for page in batch:
+			if results[page.title()].get('templates'):
+				yield page
+			elif stats is not None:
+				stats['prefilter_eliminated'] += 1
+		if stats is not None:
+			stats['prefilter_checked'] += len(batch)
+
+def filter_titles(pages: Iterable[pywikibot.Page], predicate: Callable[[str], bool], stats: collections.Counter | None = None, with_ns: bool = True) -> Iterator[pywikibot.Page]:
+	'''
+	Yields only the pages whose titles satisfy predicate. Intended for pages straight from a listing, so that pages that can be ruled out by their titles alone are never fetched.
+	stats: See filter_by_templates().
+	with_ns: Whether to include the namespace in the titles passed to predicate.
+	'''
+	for page in pages:
+		if stats is not None:
+			stats['prefilter_checked'] += 1
+		if predicate(page.title(with_ns=with_ns)):
+			yield page
+		elif stats is not None:
+			stats['prefilter_eliminated'] += 1
+
+def filter_out_titles(pages: Iterable[pywikibot.Page], titles: set[str], stats: collections.Counter | None = None) -> Iterator[pywikibot.Page]:
+	'''
+	Yields only the pages whose titles are not in titles, for example because a listing has already shown that they have been handled.
+	stats: See filter_by_templates().
+	'''
+	return filter_titles(pages, lambda title: title not in titles, stats)
+
+class PageIdSet:
+	'''A set of page IDs stored as a bitset, which takes an eighth of a byte per page ID up to the largest one added (about 10 MB for all of the English Wiktionary) rather than dozens of bytes per member as a set of ints would.'''
+
+	def __init__(self):
+		self.bits = bytearray()
+
+	def __contains__(self, pageid: int) -> bool:
+		byte, bit = divmod(pageid, 8)
+		return byte < len(self.bits) and bool(self.bits[byte] >> bit & 1)
+
+	def add(self, pageid: int) -> bool:
+		'''Returns whether pageid was not already in the set.'''
+		byte, bit = divmod(pageid, 8)
+		if byte >= len(self.bits):
+			self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits))))
+		elif self.bits[byte] >> bit & 1:
+			return False
+		self.bits[byte] |= 1 << bit
+		return True
+
+def category_members(cats: Iterable[pywikibot.Category], namespaces: list[int] | None = None, stats: collections.Counter | None = None) -> Iterator[pywikibot.Page]:
+	'''
+	Lists the pages (but not subcategories) in any of several categories, yielding each page only once however many of the categories it is in, so that it is only fetched and processed once.
+	The pages are yielded without their text; preload them (for example with pywikibot.pagegenerators.PreloadingGenerator) after any further filtering.
+	stats: A counter to which to add the number of members listed ('members_listed') and how many of them were duplicates ('members_duplicate').
+	'''
+	seen = PageIdSet()
+	for cat in cats:
+		for page in cat.articles(namespaces=namespaces):
+			if stats is not None:
+				stats['members_listed'] += 1
+			if seen.add(page.pageid):
+				yield page
+			elif stats is not None:
+				stats['members_duplicate'] += 1
+
+def print_summary(stats: collections.Counter) -> None:
+	'''Prints the statistics collected over a run.'''
+	if stats['members_listed']:
+		print(f'Skipped {stats["members_duplicate"]} of {stats["members_listed"]} category members ({stats["members_duplicate"] / stats["members_listed"]:.0%}) as duplicates of members of another category.')
+	if stats['prefilter_checked']:
+		print(f'Eliminated {stats["prefilter_eliminated"]} of {stats["prefilter_checked"]} pages ({stats["prefilter_eliminated"] / stats["prefilter_checked"]:.0%}) without fetching their text.')
+	if stats['shard_other'] or stats['shard_done']:
+		print(f'Left {stats["shard_other"]} pages to other shards and skipped {stats["shard_done"]} pages already finished by this shard.')
+
+def read_titles(path: str) -> Iterator[str]:
+	'''
+	Streams the page titles listed (one per line) in a file, without reading the whole file into memory.
+	path: The file to read, which may be compressed with gzip (.gz), bzip2 (.bz2), or xz (.xz), or "-" for standard input.
+	Titles are normalized (surrounding whitespace removed, underscores replaced with spaces) and blank lines and duplicate titles are skipped.
+	'''
+	seen = set()
+	with open_text(path) as title_file:
+		for line in title_file:
+			title = ' '.join(line.replace('_', ' ').split())
+			if title and title not in seen:
+				seen.add(title)
+				yield title
+
+def open_text(path: str) -> TextIO:
+	'''Opens a UTF-8 text file for reading, decompressing it according to its extension. "-" means standard input.'''
+	if path == '-':
+		return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='replace')
+	for extension, opener in (('.gz', gzip.open), ('.bz2', bz2.open), ('.xz', lzma.open)):
+		if path.endswith(extension):
+			return opener(path, 'rt', encoding='utf-8', errors='replace')
+	return open(path, encoding='utf-8', errors='replace')
+
+def titled_pages(site: pywikibot.site.BaseSite, titles: Iterable[str], ns: int = 0, content: bool = True) -> Iterator[pywikibot.Page]:
+	'''Yields a page for each title, fetched in batches of API_TITLES_LIMIT (with their text unless content is False).'''
+	return pywikibot.pagegenerators.PreloadingGenerator((pywikibot.Page(site, title, ns) for title in titles), groupsize=API_TITLES_LIMIT, content=content)
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+	'''Like itertools.batched() (which requires Python 3.12), but yields lists.'''
+	iterator = iter(iterable)
+	while batch := list(itertools.islice(iterator, size)):
+		yield batch
+
 def startswith_casefold(st: str, prefix: str) -> bool:
 	return st[:len(prefix)].casefold() == prefix.casefold()
 
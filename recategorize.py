@@ -7,69 +7,115 @@ But the latter will always try to move the category page to the new name as well
 '''
 
 import argparse
+import csv
+import itertools
 
 import pywikibot
 import pywikibot.pagegenerators
 
+import pywikibot_helpers
+import throttles
+
+ACTIONS = ['add', 'remove', 'replace']
+
 def main():
 	parser = argparse.ArgumentParser(description='Add, remove, or replace plain category links in pages.')
-	parser.add_argument('action', choices=['add', 'remove', 'replace'], help='Add, remove, or replace.')
-	parser.add_argument('existing_cat', help='The existing category to iterate over the members of. If removing, this is also the category to remove. If replacing, this is also the category to replace.')
+	parser.add_argument('action', nargs='?', choices=ACTIONS, help='Add, remove, or replace. Required unless --rules is given.')
+	parser.add_argument('existing_cat', nargs='?', help='The existing category to iterate over the members of. If removing, this is also the category to remove. If replacing, this is also the category to replace. Required unless --rules is given.')
 	parser.add_argument('new_cat', nargs='?', help='If adding, the category to add. If removing, optional and ignored. If replacing, this is the category to replace with.')
+	parser.add_argument('-r', '--rules', help='A file of many actions to carry out at once, one per line, each an action, an existing category, and (unless removing) a new category separated by semicolons (like "replace;Foo;Bar"). Each page in any of the existing categories is fetched and saved only once, with every action that applies to it.')
 	parser.add_argument('-s', '--summary', help='The edit summary to use when saving the pages.')
 	parser.add_argument('-d', '--dry-run', '--dr', action='store_true', help='Save changed pages locally instead of remotely (so no change is made to the remote).')
 	parser.add_argument('-l', '--limit', default=-1, type=int, help='Limit the number of pages to be moved.')
 	parser.add_argument('-v', '--verbose', action='store_true')
+	throttles.add_throttle_args(parser)
 	args = parser.parse_args()
 
+	if args.rules:
+		rules = read_rules(args.rules)
+	elif args.action and args.existing_cat:
+		rules = [(args.action, args.existing_cat, args.new_cat)]
+	else:
+		parser.error('Either an action and an existing category or --rules must be given.')
+	for action, existing_cat, new_cat in rules:
+		if action == 'add' and not new_cat:
+			raise ValueError('You must specify which category to add.')
+		elif action == 'replace' and not new_cat:
+			raise ValueError(f'You must specify which category to replace "{existing_cat}" with.')
+
 	site = pywikibot.Site()
-	existing_cat = pywikibot.Category(site, args.existing_cat)
-	new_cat = None
-	if args.new_cat:
-		new_cat = pywikibot.Category(site, args.new_cat)
-	elif args.action == 'add':
-		raise ValueError('You must specify which category to add.')
-	elif args.action == 'replace':
-		raise ValueError('You must specify which category to replace "{args.existing_cat}" with.')
+	throttle = throttles.throttle_from_args(args, site)
+	rules = [(action, pywikibot.Category(site, existing_cat), pywikibot.Category(site, new_cat) if new_cat else None) for action, existing_cat, new_cat in rules]
+
+	# Collect the members of all the categories first (remembering which rules apply to each), so that a page in several of them is only fetched and saved once
+	page_rules = {}
+	for rule in rules:
+		for record in pywikibot_helpers.list_records(site, 'categorymembers', cmtitle=rule[1].title(), cmprop='ids|title'):
+			page_rules.setdefault(record.title, []).append(rule)
+	if args.verbose and len(rules) > 1:
+		print(f'Found {len(page_rules)} pages to which {len(rules)} rules apply.')
+
+	titles = itertools.islice(page_rules, args.limit) if args.limit >= 0 else page_rules
+	for page in pywikibot.pagegenerators.PreloadingGenerator(pywikibot.Page(site, title) for title in titles):
+		title = page.title()
+		if args.dry_run:
+			page.text = apply_rules(page.text, title, page_rules[title], site, dry_run=True)
+		else:
+			# recategorize the latest text again if someone else edits the page in the meantime
+			pywikibot_helpers.save_transformed(page, lambda text: apply_rules(text, title, page_rules[title], site), args.summary, throttle=throttle, botflag=True, quiet=not args.verbose)
+	if throttle:
+		print(throttle.report())
+
+def read_rules(path: str) -> list[tuple[str, str, str | None]]:
+	'''Reads the rules file given with --rules (see main()). Blank lines and lines starting with # are ignored.'''
+	rules = []
+	with open(path, newline='', encoding='utf-8') as rules_file:
+		for line_num, row in enumerate(csv.reader(rules_file, delimiter=';'), start=1):
+			if not row or not ''.join(row).strip() or row[0].startswith('#'):
+				continue
+			row = [field.strip() for field in row]
+			if row[0] not in ACTIONS or len(row) not in (2, 3):
+				raise ValueError(f'Line {line_num} of {path} is not a valid rule: {";".join(row)}')
+			rules.append((row[0], row[1], row[2] if len(row) == 3 and row[2] else None))
+	return rules
+
+def apply_rules(text: str, title: str, rules: list[tuple[str, pywikibot.Category, pywikibot.Category | None]], site: pywikibot.site.BaseSite, dry_run: bool = False) -> str:
+	'''Applies each rule (an action, an existing category, and a new category) to text in turn with recategorize().'''
+	for action, existing_cat, new_cat in rules:
+		text = recategorize(text, title, action, existing_cat, new_cat, site, dry_run)
+	return text
 
-	count = 0
-	for page in existing_cat.members():
-		if 0 <= args.limit <= count:
-			break
-		original_text = page.text
-		cats = set(pywikibot.textlib.getCategoryLinks(page.text, site=site))
-		if args.action == 'add':
-			if new_cat in cats:
-				print(f'"{page.title()}" is already in "{args.new_cat}", so I\'m skipping it.')
-			else:
-				page.text = pywikibot.textlib.replaceCategoryLinks(page.text, [args.new_cat], site=site, add_only=True)
-			if args.dry_run:
-				print(f'Would add "{page.title()}" to category "{args.new_cat}".')
-		elif args.action == 'remove':
-			try:
-				cats.remove(exisiting_cat)
-			except KeyError:
-				print(f'Warning: "{page.title()}" does not contain a category link that causes it to be in "{args.existing_cat}", so I\'m skipping it.')
-			page.text = pywikibot.textlib.replaceCategoryLinks(page.text, cats, site=site)
-			if args.dry_run:
-				print(f'Would save "{page.title()}" with categories: {cats}')
-		# the only other possiblility
-		elif args.action == 'replace':
-			if exsiting_cat in cats:
-				if new_cat in cats:
-					print(f'"{page.title()}" is already in "{args.new_cat}", so I will just remove it from "{args.existing_cat}".')
-					page.text = pywikibot.textlib.replaceCategoryInPlace(page.text, existing_cat, newcat=None)
-				else:
-					# sort key is preserved
-					page.text = pywikibot.textlib.replaceCategoryInPlace(page.text, existing_cat, new_cat)
-				if args.dry_run:
-					print(f'Would change category "{args.existing_cat}" to "{args.new_cat}" in "{page.title()}".')
-			else:
-				print(f'Warning: "{page.title()}" does not contain a category link that causes it to be in "{args.existing_cat}", so I\'m skipping it.')
-		# There's no risk of performing a null edit here, but we shouldn't print if no edit is being performed.
-		if not args.dry_run and page.text != original_text:
-			page.save(summary=args.summary, botflag=True, quiet=not args.verbose)
-		count += 1
+def recategorize(text: str, title: str, action: str, existing_cat: pywikibot.Category, new_cat: pywikibot.Category | None, site: pywikibot.site.BaseSite, dry_run: bool = False) -> str:
+	'''Returns text with the category links changed according to action (see main()), or unchanged if there is nothing to do.'''
+	cats = set(pywikibot.textlib.getCategoryLinks(text, site=site))
+	if action == 'add':
+		if new_cat in cats:
+			print(f'"{title}" is already in "{new_cat.title(with_ns=False)}", so I\'m skipping it.')
+			return text
+		if dry_run:
+			print(f'Would add "{title}" to category "{new_cat.title(with_ns=False)}".')
+		return pywikibot.textlib.replaceCategoryLinks(text, [new_cat], site=site, add_only=True)
+	elif action == 'remove':
+		try:
+			cats.remove(existing_cat)
+		except KeyError:
+			print(f'Warning: "{title}" does not contain a category link that causes it to be in "{existing_cat.title(with_ns=False)}", so I\'m skipping it.')
+			return text
+		if dry_run:
+			print(f'Would save "{title}" with categories: {cats}')
+		return pywikibot.textlib.replaceCategoryLinks(text, cats, site=site)
+	# the only other possiblility
+	elif action == 'replace':
+		if existing_cat not in cats:
+			print(f'Warning: "{title}" does not contain a category link that causes it to be in "{existing_cat.title(with_ns=False)}", so I\'m skipping it.')
+			return text
+		if dry_run:
+			print(f'Would change category "{existing_cat.title(with_ns=False)}" to "{new_cat.title(with_ns=False)}" in "{title}".')
+		if new_cat in cats:
+			print(f'"{title}" is already in "{new_cat.title(with_ns=False)}", so I will just remove it from "{existing_cat.title(with_ns=False)}".')
+			return pywikibot.textlib.replaceCategoryInPlace(text, existing_cat, newcat=None)
+		# sort key is preserved
+		return pywikibot.textlib.replaceCategoryInPlace(text, existing_cat, new_cat)
 
 if __name__ == '__main__':
 	main()
@@ -5,66 +5,104 @@ import re
 
 import pywikibot
 import pywikibot.pagegenerators
+import wikitextparser
+
+import pywikibot_helpers
+import throttles
+import wikitext_helpers
 
 TEMP_PARAMS_PATTERN = r'(\|(q\d*=)?[^=|}' + '\n' + r']*)+'
+RHYMES_TEMP_NAMES = {'rhymes', 'rhyme'}
+RHYMES_TEMP_TITLES = [f'Template:{name}' for name in sorted(RHYMES_TEMP_NAMES)]
+RHYMES_PATTERN = r'(\{\{rhymes?\|en' + TEMP_PARAMS_PATTERN + r')\}\}'
+# Only {{rhymes}} that start a bulleted line (as in a pronunciation section) are edited
+RHYMES_LINE_PREFIX = r'\*+ '
 
 def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-l', '--limit', default=-1, type=int)
 	parser.add_argument('-d', '--dry-run', action='store_true')
 	parser.add_argument('-v', '--verbose', action='store_true')
+	throttles.add_throttle_args(parser)
 	args = parser.parse_args()
 	if args.dry_run and args.limit < 0:
 		args.limit = 8
 
 	site = pywikibot.Site()
+	throttle = throttles.throttle_from_args(args, site)
 	cats = {}
 	if args.verbose:
 		print('Collecting pages in all categories...')
+	# Millions of pages are listed, so only keep lightweight records of them until their text is needed
 	for syllable_count in range(1, (2 if args.limit >= 0 or args.dry_run else 20)):
-		cat = pywikibot.Category(site, f'Category:English {syllable_count}-syllable words')
-		gen = pywikibot.pagegenerators.CategorizedPageGenerator(cat)
-		cats[syllable_count] = {page for page in (itertools.islice(gen, args.limit * 32) if args.limit >= 0 else gen)}
+		records = pywikibot_helpers.list_records(site, 'categorymembers', cmtitle=f'Category:English {syllable_count}-syllable words', cmtype='page', cmprop='ids|title')
+		cats[syllable_count] = list(itertools.islice(records, args.limit * 32) if args.limit >= 0 else records)
 
 	# We want to exclude any terms that fall in multiple "English N-syllable words" categories.
 	if args.verbose:
 		print('Excluding entries that are in multiple categories...')
-	deduped_cats = collections.defaultdict(set)
-	for syllable_count, cat in cats.items():
-		for page in cat:
-			if not any(page in other for other in cats.values() if other != cat):
-				deduped_cats[syllable_count].add(page)
-	del cats
+	cat_counts = collections.Counter(record.pageid for records in cats.values() for record in records)
+	deduped_cats = {syllable_count: [record for record in records if cat_counts[record.pageid] == 1] for syllable_count, records in cats.items()}
+	del cats, cat_counts
 
 	if args.verbose:
 		print('Adding syllable counts. Periods represent pages for which no action was taken.')
 	hits = 0
+	transform_stats = collections.Counter()
+	stats = collections.Counter()
 	for syllable_count, cat in deduped_cats.items():
+		# Dry runs double as differential tests of the transform's fast path
+		transform = rhymes_transform(syllable_count, verify=args.dry_run, stats=transform_stats)
 		if args.verbose:
 			print(f'=== {syllable_count}-syllable words ===\n')
-		while cat:
+		candidates = pywikibot_helpers.filter_titles((record.to_page(site) for record in cat), lambda title: re.fullmatch(r'[a-z]+', title, flags=re.IGNORECASE), stats)
+		# Pages without any {{rhymes}} can be skipped without fetching their text
+		candidates = pywikibot_helpers.filter_by_templates(candidates, RHYMES_TEMP_TITLES, stats)
+		for page in pywikibot.pagegenerators.PreloadingGenerator(candidates):
 			if 0 < args.limit <= hits:
 				print()
+				pywikibot_helpers.print_summary(stats)
+				print(transform.report())
+				if throttle:
+					print(throttle.report())
 				return
-			page = cat.pop()
-			if re.fullmatch(r'[a-z]+', page.title(), flags=re.IGNORECASE):
-				page.text, page_hits = re.subn(r'^(\*+ {{rhymes?\|en' + TEMP_PARAMS_PATTERN + r')}}', r'\1|s=' + str(syllable_count) + r'}}', page.text, flags=re.MULTILINE)
-				if page_hits:
-					hits += 1
-					if args.dry_run:
-						with open(page.title() + '.wiki', 'w') as page_file:
-							page_file.write(page.text)
-					else:
-						print(flush=True)
-						page.save(summary='Add syllable counts to English rhymes ([[Wiktionary:Beer parlour/2024/April#Copying rhyme syllable counts from existing categories|discussion]]).', botflag=True)
-					if args.verbose:
-						print(f'Added syllable count of {syllable_count} to "{page.title()}".')
-				elif args.verbose:
-					print('.', end='')
+			if args.dry_run:
+				new_text = transform.apply(page.text)
+				saved = new_text != page.text
+				if saved:
+					page.text = new_text
+					with open(page.title() + '.wiki', 'w') as page_file:
+						page_file.write(page.text)
+			else:
+				# The transform is rerun on the latest text if someone else edits the page in the meantime
+				saved = pywikibot_helpers.save_transformed(page, transform.apply, 'Add syllable counts to English rhymes ([[Wiktionary:Beer parlour/2024/April#Copying rhyme syllable counts from existing categories|discussion]]).', throttle=throttle, botflag=True)
+			if saved:
+				hits += 1
+				if args.verbose:
+					print(f'Added syllable count of {syllable_count} to "{page.title()}".')
+			elif args.verbose:
+				print('.', end='')
 		if args.verbose:
 			print(flush=True)
 	if args.verbose:
 		print(flush=True)
+	pywikibot_helpers.print_summary(stats)
+	print(transform.report())
+	if throttle:
+		print(throttle.report())
+
+def rhymes_transform(syllable_count: int, verify: bool = False, stats: collections.Counter | None = None) -> wikitext_helpers.TemplateTransform:
+	'''Add s=syllable_count to English {{rhymes}} that start a bulleted line and do not have any named parameters other than qualifiers.'''
+	def add_syllable_count(temp: wikitextparser.Template) -> None:
+		if temp.name not in RHYMES_TEMP_NAMES or '\n' in temp.string:
+			return
+		args = temp.arguments
+		if len(args) < 2 or not args[0].positional or args[0].value != 'en':
+			return
+		if all((arg.positional or re.fullmatch(r'q\d*', arg.name)) and '=' not in arg.value for arg in args):
+			temp.set_arg('s', str(syllable_count))
+
+	return wikitext_helpers.TemplateTransform(RHYMES_TEMP_NAMES, RHYMES_PATTERN, r'\1|s=' + str(syllable_count) + '}}', add_syllable_count, verify, stats, RHYMES_LINE_PREFIX)
 
 if __name__ == '__main__':
 	main()
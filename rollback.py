@@ -0,0 +1,84 @@
+'''
+Undoes the edits of a run recorded in an edit log (see the --edit-log option of temp_move.py, cat_move.py, and the like), restoring each page to its revision from before the run.
+Pages that have been edited again since the run are left alone (and listed), since reverting them would also undo the later edits.
+The latest revisions of the pages and the texts to restore are looked up in batches, and the reverts are saved through the same pipeline (and throttle) as other edits.
+'''
+
+import argparse
+import collections
+
+import pywikibot
+
+import pywikibot_helpers
+import run_state
+import throttles
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('edit_log', help='The edit log of the run to undo.')
+	parser.add_argument('-s', '--summary', default='Revert edits of a bot run', help='The edit summary to use for the reverts.')
+	parser.add_argument('-d', '--dry-run', action='store_true', help='Only list the pages that would be reverted.')
+	parser.add_argument('-v', '--verbose', action='store_true')
+	throttles.add_throttle_args(parser)
+	args = parser.parse_args()
+
+	revids = run_state.read_edit_log(args.edit_log)
+	site = pywikibot.Site()
+	throttle = None if args.dry_run else throttles.throttle_from_args(args, site)
+	stats = collections.Counter()
+	for batch in pywikibot_helpers.batched(pywikibot_helpers.titled_pages(site, revids), pywikibot_helpers.API_TITLES_LIMIT):
+		to_revert = []
+		for page in batch:
+			title = page.title()
+			if not page.exists():
+				print(f'Skipping [[{title}]], which no longer exists.')
+				stats['gone'] += 1
+			elif page.latest_revision_id != revids[title][1]:
+				print(f'Skipping [[{title}]], which has been edited since.')
+				stats['edited_since'] += 1
+			else:
+				to_revert.append(page)
+		old_texts = revision_texts(site, [revids[page.title()][0] for page in to_revert])
+		for page in to_revert:
+			title = page.title()
+			old_revid = revids[title][0]
+			if old_revid not in old_texts:
+				print(f'Skipping [[{title}]], since the text of revision {old_revid} is not available.')
+				stats['unavailable'] += 1
+			# For example because someone has already restored it by hand
+			elif old_texts[old_revid] == page.text:
+				print(f'Skipping [[{title}]], which already has the text of revision {old_revid}.')
+				stats['unchanged'] += 1
+			elif args.dry_run:
+				print(f'Would revert [[{title}]] to revision {old_revid}.')
+				stats['reverted'] += 1
+			else:
+				try:
+					# A single attempt, since an edit conflict means the page has been edited since after all (and the text is known to differ, so that is the only reason not to save)
+					if pywikibot_helpers.save_transformed(page, lambda text: old_texts[old_revid], args.summary, max_attempts=1, throttle=throttle, bot=True, quiet=not args.verbose):
+						stats['reverted'] += 1
+					else:
+						stats['edited_since'] += 1
+				# For example because the page has been protected since the run, which should not stop the rest of the pages being reverted
+				except pywikibot.exceptions.PageSaveRelatedError as error:
+					print(f'Error: Unable to revert [[{title}]]: {error}')
+					stats['failed'] += 1
+
+	print(f'{"Would revert" if args.dry_run else "Reverted"} {stats["reverted"]} of {len(revids)} pages. Skipped {stats["edited_since"]} edited since, {stats["unchanged"]} already reverted, {stats["gone"]} no longer existing, and {stats["unavailable"]} whose old text is unavailable. Failed to save {stats["failed"]}.')
+	if throttle:
+		print(throttle.report())
+
+def revision_texts(site: pywikibot.site.BaseSite, revids: list[int]) -> dict[int, str]:
+	'''Fetches the texts of many revisions (in batches of API_TITLES_LIMIT). Revisions that are deleted or whose text is hidden are left out.'''
+	texts = {}
+	for batch in pywikibot_helpers.batched(revids, pywikibot_helpers.API_TITLES_LIMIT):
+		result = site.simple_request(action='query', prop='revisions', revids=batch, rvprop='ids|content', rvslots='main', formatversion=2).submit()
+		for page in result.get('query', {}).get('pages', []):
+			for revision in page.get('revisions', []):
+				main_slot = revision.get('slots', {}).get('main', {})
+				if 'content' in main_slot:
+					texts[revision['revid']] = main_slot['content']
+	return texts
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,249 @@
+'''
+The state a run of a job keeps outside of the wiki: which pages its shard has finished (so that it can resume), the edits it has made (so that they can be undone), and how far it got (so that the next run can look at just what changed since).
+run_context() sets up whichever of these (along with a throttle and a parse cache) a script's arguments ask for, and closes them all at the end of the run.
+'''
+
+import argparse
+import collections
+import contextlib
+import datetime
+import json
+import re
+import time
+import zlib
+from typing import Iterable, Iterator
+
+import pywikibot
+
+import pywikibot_helpers
+import throttles
+import wikitext_helpers
+
+INCREMENTAL_STATE_PATH = 'incremental_state.json'
+# Recent changes are only kept for this long, so an older high-water mark cannot be caught up from
+RC_MAX_AGE = datetime.timedelta(days=30)
+# The edit summary MediaWiki gives to "categorize" recent changes, e.g. "[[:foo bar]] added to category"
+RC_CATEGORIZE_PATTERN = re.compile(r'\[\[:?([^\]|]+)\]\] added to category')
+
+def parse_shard(value: str) -> tuple[int, int]:
+	'''Parses a shard given as "i/N" (for shard i of N, counting from 0), for use as an argparse type.'''
+	index, sep, count = value.partition('/')
+	try:
+		index, count = int(index), int(count)
+	except ValueError:
+		index = count = 0
+	if not sep or not 0 <= index < count:
+		raise argparse.ArgumentTypeError(f'"{value}" is not a shard like 0/4 (the first of four shards).')
+	return index, count
+
+def add_shard_args(parser: argparse.ArgumentParser) -> None:
+	parser.add_argument('--shard', type=parse_shard, help='Only process the pages in this shard, given as i/N (counting from 0), so that N processes (on one or several machines) can share a job. Each shard keeps its own checkpoint of the pages it has finished, from which it resumes if run again. Combine with --rate-budget to share a rate limit.')
+
+def shard_of(pageid: int, shard_count: int) -> int:
+	# Hashed so that shards are balanced even if page IDs are correlated with the order of the listing
+	return zlib.crc32(pageid.to_bytes(8, 'little')) % shard_count
+
+class ShardCheckpoint:
+	'''
+	Records the pages a shard of a job has finished (and what was done with each) in a tab-separated file of its own, so that the shard can resume where it left off, and so that the results of all the shards can be collected afterwards.
+	job: A name for the job, from which the name of the file is made.
+	shard: The shard, as from parse_shard().
+	'''
+
+	def __init__(self, job: str, shard: tuple[int, int]):
+		self.shard = shard
+		self.path = f'{job}.shard-{shard[0]}-of-{shard[1]}.tsv'
+		self.done = pywikibot_helpers.PageIdSet()
+		try:
+			with open(self.path, encoding='utf-8') as checkpoint_file:
+				for line in checkpoint_file:
+					self.done.add(int(line.partition('\t')[0]))
+		except FileNotFoundError:
+			pass
+		self.checkpoint_file = open(self.path, 'a', encoding='utf-8')
+
+	def pages(self, pages: Iterable, stats: collections.Counter | None = None) -> Iterator:
+		'''
+		Yields only the pages in this shard that it has not already finished. The pages need only have a pageid, so they can be pywikibot pages from a listing that includes page IDs (as most of pywikibot's do) or pages from a dump.
+		stats: A counter to which to add how many pages were left to other shards ('shard_other') or already finished ('shard_done').
+		'''
+		for page in pages:
+			if shard_of(page.pageid, self.shard[1]) != self.shard[0]:
+				if stats is not None:
+					stats['shard_other'] += 1
+			elif page.pageid in self.done:
+				if stats is not None:
+					stats['shard_done'] += 1
+			else:
+				yield page
+
+	def record(self, pageid: int, title: str, result: str) -> None:
+		'''Records that the shard has finished with a page, and what was done with it (such as "edited" or "skipped").'''
+		self.done.add(pageid)
+		print(pageid, title, result, sep='\t', file=self.checkpoint_file, flush=True)
+
+	def close(self) -> None:
+		self.checkpoint_file.close()
+
+class EditLog:
+	'''
+	Records each edit a run saves as a line of title, revision ID before the edit, and revision ID after it (tab-separated), so that the run can be undone with rollback.py.
+	'''
+
+	def __init__(self, path: str):
+		self.path = path
+		self.log_file = open(path, 'a', encoding='utf-8')
+		self.count = 0
+
+	def record(self, title: str, old_revid: int, new_revid: int) -> None:
+		print(title, old_revid, new_revid, sep='\t', file=self.log_file, flush=True)
+		self.count += 1
+
+	def close(self) -> None:
+		self.log_file.close()
+
+	def report(self) -> str:
+		return f'Recorded {self.count} edits in {self.path} (undo them with rollback.py).'
+
+def read_edit_log(path: str) -> dict[str, tuple[int, int]]:
+	'''Returns the revision ID of each page in an edit log (see EditLog) from before its first logged edit and after its last one.'''
+	revids = {}
+	with open(path, encoding='utf-8') as log_file:
+		for line in log_file:
+			title, old_revid, new_revid = line.rstrip('\n').split('\t')
+			revids[title] = (revids[title][0] if title in revids else int(old_revid), int(new_revid))
+	return revids
+
+def add_edit_log_args(parser: argparse.ArgumentParser) -> None:
+	parser.add_argument('--edit-log', help='The file in which to record the edits made (see rollback.py). By default a new file named after the job and the time is used.')
+
+def edit_log_from_args(args: argparse.Namespace, job: str) -> EditLog | None:
+	'''Returns the edit log given by the arguments added by add_edit_log_args() (or a new one named after job), or None for a dry run.'''
+	if getattr(args, 'dry_run', False):
+		return None
+	return EditLog(args.edit_log or f'{job.replace("/", "_")}.{time.strftime("%Y%m%d-%H%M%S")}.edits.tsv')
+
+def checkpoint_from_args(args: argparse.Namespace, job: str) -> ShardCheckpoint | None:
+	'''
+	Returns the checkpoint for the shard given by the arguments added by add_shard_args(), or None if the job is not sharded.
+	job: A name for the job (which should differ between runs over different pages). Dry runs get checkpoints of their own, so that they do not cause the real run to skip pages.
+	'''
+	if not getattr(args, 'shard', None):
+		return None
+	job = job.replace('/', '_')
+	return ShardCheckpoint(f'{job}.dry-run' if getattr(args, 'dry_run', False) else job, args.shard)
+
+class IncrementalState:
+	'''
+	Remembers how far a maintenance job got the last time it ran (a high-water mark of recent changes timestamp and rcid), so that the next run can look at just the pages that changed since then instead of rescanning everything.
+	job: A key identifying the job (and whatever it iterates over) in the state file.
+	path: The JSON file in which the marks of all jobs are stored.
+	'''
+
+	def __init__(self, job: str, path: str = INCREMENTAL_STATE_PATH):
+		self.job = job
+		self.path = path
+		try:
+			with open(self.path, encoding='utf-8') as state_file:
+				self.all_marks = json.load(state_file)
+		except FileNotFoundError:
+			self.all_marks = {}
+		self.mark = self.all_marks.get(self.job)
+		self.new_mark = None
+
+	def changed_titles(self, site: pywikibot.site.BaseSite, namespaces: list[int] | None = None, category: pywikibot.Category | None = None) -> set[str] | None:
+		'''
+		Returns the titles of pages that were created, edited, or moved into the given namespaces since the last run, or that were added to the given category since the last run.
+		Pages passed to retry() in the last run are included whether or not they changed.
+		Returns None if a full scan is needed instead because there is no usable mark (this is the first run, or the last one was too long ago for recent changes to cover).
+		Call commit() once the returned pages have been dealt with to advance the mark.
+		'''
+		now = site.server_time()
+		self.new_mark = {'timestamp': now.isoformat(), 'rcid': self.mark['rcid'] if self.mark else 0}
+		if not self.mark:
+			return None
+		start = pywikibot.Timestamp.fromISOformat(self.mark['timestamp'])
+		if now - start > RC_MAX_AGE:
+			print(f'Warning: The last run of {self.job} was too long ago to catch up from recent changes, so doing a full scan.')
+			return None
+
+		if category:
+			changes = site.recentchanges(start=start, reverse=True, changetype='categorize', page=category.title())
+		else:
+			changes = site.recentchanges(start=start, reverse=True, changetype='edit|new|log', namespaces=namespaces)
+		titles = set(self.mark.get('retry', []))
+		for change in changes:
+			# Timestamps only have a resolution of seconds, so changes at the boundary are listed again
+			if change['rcid'] <= self.mark['rcid']:
+				continue
+			self.new_mark['rcid'] = max(self.new_mark['rcid'], change['rcid'])
+			if change['type'] == 'categorize':
+				mat = RC_CATEGORIZE_PATTERN.match(change.get('comment', ''))
+				if mat:
+					titles.add(mat[1])
+			elif change['type'] == 'log':
+				# The destinations of moves are new pages as far as a job is concerned
+				if change.get('logtype') == 'move':
+					target = pywikibot.Page(site, change['logparams']['target_title'])
+					if namespaces is None or target.namespace().id in namespaces:
+						titles.add(target.title())
+			else:
+				titles.add(change['title'])
+		return titles
+
+	def retry(self, title: str) -> None:
+		'''Have the next run look at a page again even if it does not change in the meantime, for example because editing it failed or was declined. Call it after changed_titles().'''
+		self.new_mark.setdefault('retry', []).append(title)
+
+	def commit(self) -> None:
+		'''Save the mark reached by the last call to changed_titles() so the next run starts from there.'''
+		if self.new_mark is None:
+			return
+		self.all_marks[self.job] = self.new_mark
+		with open(self.path, 'w', encoding='utf-8') as state_file:
+			json.dump(self.all_marks, state_file, indent='\t')
+		self.mark = self.new_mark
+
+class RunResources(contextlib.ExitStack):
+	'''
+	The resources of a run of a job, as set up by run_context(). Each is None if the arguments did not ask for it.
+	Other resources (such as a page store) can be closed along with them with enter_context().
+	'''
+
+	def __init__(self):
+		super().__init__()
+		self.throttle: throttles.AdaptiveThrottle | None = None
+		self.parse_cache: wikitext_helpers.ParseCache | None = None
+		self.checkpoint: ShardCheckpoint | None = None
+		self.edit_log: EditLog | None = None
+
+def run_context(args: argparse.Namespace, job: str, site: pywikibot.site.BaseSite | None = None) -> RunResources:
+	'''
+	Sets up the throttle, parse cache, shard checkpoint, and edit log asked for by the arguments (added by throttles.add_throttle_args(), add_shard_args(), add_edit_log_args(), and a --parse-cache argument, whichever a script has), for use as a context manager that prints their reports and closes them when the run ends, even if it ends with an error.
+	job: A name for the job, from which the names of the checkpoint and the edit log are made.
+	site: The site to install the throttle on. There is no throttle without one (as for a dry run from a dump) or in a dry run.
+	'''
+	run = RunResources()
+	try:
+		# Closed in the reverse order, so that the edit log (with how to undo the run) is reported last
+		run.edit_log = edit_log_from_args(args, job)
+		if run.edit_log:
+			run.callback(report_and_close, run.edit_log)
+		run.checkpoint = checkpoint_from_args(args, job)
+		if run.checkpoint:
+			run.callback(run.checkpoint.close)
+		if getattr(args, 'parse_cache', None):
+			run.parse_cache = wikitext_helpers.ParseCache(args.parse_cache)
+			run.callback(report_and_close, run.parse_cache)
+		if site is not None and not getattr(args, 'dry_run', False):
+			run.throttle = throttles.throttle_from_args(args, site)
+			if run.throttle:
+				run.callback(lambda: print(run.throttle.report()))
+	except BaseException:
+		run.close()
+		raise
+	return run
+
+def report_and_close(resource) -> None:
+	print(resource.report())
+	resource.close()
@@ -1,10 +1,18 @@
 import argparse
-import itertools
+import collections
+from typing import Iterable
 
 import pywikibot
 import pywikibot.pagegenerators
 import wikitextparser
 
+import dumps
+import page_store
+import pywikibot_helpers
+import run_state
+import throttles
+import wikitext_helpers
+
 VERBOSE_FACTOR = 100
 
 def main():
@@ -15,31 +23,66 @@ def main():
 	entry_iterators = parser.add_mutually_exclusive_group(required=True)
 	entry_iterators.add_argument('-l', '--language', help='Indicates that only entries in the given language should be scanned. Exactly one of -l, -c, and -p must be given.')
 	entry_iterators.add_argument('-c', '--category', help='Indicates that only entries in the given category should be scanned. Exactly one of -l, -c, and -p must be given.')
-	entry_iterators.add_argument('-p', '--pages', help='A text file in which is listed the titles of the pages to scan (one per line). Exactly one of -l, -c, and -p must be given.')
+	entry_iterators.add_argument('-p', '--pages', help='A text file (optionally compressed, or - for standard input) in which is listed the titles of the pages to scan (one per line). Exactly one of -l, -c, and -p must be given.')
+	parser.add_argument('--store', help='A page store (see page_store.py) to read the pages listed with -p from, like --dump but without decompressing anything.')
+	parser.add_argument('--dump', help='A multistream dump of the wiki (see dumps.py) to read the pages listed with -p from. In a dry run nothing is fetched from the wiki at all. Otherwise only the pages that use the old template in the dump are fetched (and edited as usual).')
+	parser.add_argument('--parse-cache', nargs='?', const=wikitext_helpers.PARSE_CACHE_PATH, help='Keep what is learnt from parsing each revision in this file (by default ' + wikitext_helpers.PARSE_CACHE_PATH + '), so that later runs over the same revisions (such as the real run after a dry run) can skip pages without the old template without looking through them again.')
 	parser.add_argument('-d', '--dry-run', action='store_true')
 	parser.add_argument('-i', '--limit', type=int, default=-1)
+	throttles.add_throttle_args(parser)
+	run_state.add_shard_args(parser)
+	run_state.add_edit_log_args(parser)
 	args = parser.parse_args()
+	if (args.dump or args.store) and not args.pages:
+		parser.error('--dump and --store can only be used with -p.')
+	if args.dump and args.store:
+		parser.error('Only one of --dump and --store can be given.')
+	# Do not even set up the site, which contacts it
+	site = None if (args.dump or args.store) and args.dry_run else pywikibot.Site()
+	with run_state.run_context(args, f'temp_move-{args.old_name}', site) as run:
+		# Pages from a dump or a page store, which are alike
+		dump_pages = None
+		if args.store:
+			# Unmapped along with the rest of the run's resources
+			dump_pages = run.enter_context(page_store.PageStore(args.store)).pages(pywikibot_helpers.read_titles(args.pages))
+		elif args.dump:
+			dump_pages = dumps.MultistreamDump(args.dump).pages(pywikibot_helpers.read_titles(args.pages))
+		if site is None:
+			move_offline(dump_pages, args.old_name, args.new_name, args.limit, run.checkpoint)
+		else:
+			move_online(site, dump_pages, args, run)
 
-	site = pywikibot.Site()
+def move_online(site: pywikibot.site.BaseSite, dump_pages: Iterable[dumps.DumpPage] | None, args: argparse.Namespace, run: run_state.RunResources) -> None:
+	'''Fetches the pages chosen by the arguments and moves (or in a dry run, previews moving) the ones that use the old template to the new one.'''
+	stats = collections.Counter()
 	if args.language:
 		target_cat_titles = [f'{args.language} lemmas', f'{args.language} non-lemma forms']
 		target_cats = [pywikibot.Category(site, cat_title) for cat_title in target_cat_titles]
 		for cat in target_cats:
 			if not cat.exists():
 				print(f'Warning: {cat.title()} does not exist, so it is unlikely to contain entries.')
-		page_iters = [pywikibot.pagegenerators.CategorizedPageGenerator(cat) for cat in target_cats]
-		pages = itertools.chain.from_iterable(page_iters)
+		# Many entries are in both, but only need fetching once
+		pages = pywikibot_helpers.category_members(target_cats, stats=stats)
 	elif args.category:
 		target_cat = pywikibot.Category(site, args.category)
 		if not target_cat.exists():
-			print(f'Warning: {cat.title()} does not exist, so it is unlikely to contain entries.')
-		pages = pywikibot.pagegenerators.CategorizedPageGenerator(target_cats)
+			print(f'Warning: {target_cat.title()} does not exist, so it is unlikely to contain entries.')
+		pages = pywikibot.pagegenerators.CategorizedPageGenerator(target_cat)
+	elif dump_pages is not None:
+		# Dumps are out of date, so only use them to decide which pages to fetch
+		dump_transform = rename_transform(args.old_name, args.new_name)
+		pages = pywikibot_helpers.titled_pages(site, (page.title for page in dump_pages if dump_transform.apply(page.text) != page.text))
 	# args.pages must have been given
 	else:
-		with open(args.pages) as pages_file:
-			page_titles = [line[:-1] for line in pages_file]
-			pages = (pywikibot.Page(site, title) for title in page_titles)
+		pages = pywikibot_helpers.titled_pages(site, pywikibot_helpers.read_titles(args.pages), content=False)
+	if run.checkpoint:
+		pages = run.checkpoint.pages(pages, stats)
+	if dump_pages is None:
+		# Only fetch the text of pages that still use the old template
+		pages = pywikibot.pagegenerators.PreloadingGenerator(pywikibot_helpers.filter_by_templates(pages, [f'Template:{args.old_name}'], stats))
 
+	# Dry runs double as differential tests of the transform's fast path
+	transform = rename_transform(args.old_name, args.new_name, verify=args.dry_run)
 	edit_count = 0
 	for page_count, page in enumerate(pages):
 		if 0 < args.limit <= edit_count:
@@ -47,21 +90,50 @@ def main():
 		if page_count % VERBOSE_FACTOR == 0:
 			print(page_count, flush=True)
 
-		wikitext = wikitextparser.parse(page.text)
-		target_temps = [temp for temp in wikitext.templates if temp.normal_name() == args.old_name]
-		# Skip pages that do not use the target template
-		if not target_temps:
-			continue
-		for temp in target_temps:
-			temp.name = args.new_name
 		if args.dry_run:
-			with open(f'{page.title()}.txt', 'w') as out_file:
-				out_file.write(str(wikitext))
-			print(f'Saved {page.title()}')
+			new_text = transform.apply(page.text, page.latest_revision_id, run.parse_cache)
+			# Skip pages that do not use the target template
+			edited = new_text != page.text
+			if edited:
+				with open(f'{page.title()}.txt', 'w') as out_file:
+					out_file.write(new_text)
+				print(f'Saved {page.title()}')
+		# The transform is rerun on the latest text if someone else edits the page in the meantime
 		else:
-			page.text = str(wikitext)
-			page.save(summary=args.summary, bot=True, quiet=False)
-		edit_count += 1
+			edited = pywikibot_helpers.save_transformed(page, lambda text: transform.apply(text, page.latest_revision_id, run.parse_cache), args.summary, throttle=run.throttle, edit_log=run.edit_log, bot=True, quiet=False)
+		if run.checkpoint:
+			run.checkpoint.record(page.pageid, page.title(), 'edited' if edited else 'skipped')
+		if edited:
+			edit_count += 1
+	pywikibot_helpers.print_summary(stats)
+	print(transform.report())
+
+def move_offline(dump_pages: Iterable[dumps.DumpPage], old_name: str, new_name: str, limit: int = -1, checkpoint: run_state.ShardCheckpoint | None = None) -> None:
+	'''Does a dry run entirely from a dump, without contacting the wiki.'''
+	transform = rename_transform(old_name, new_name, verify=True)
+	if checkpoint:
+		dump_pages = checkpoint.pages(dump_pages)
+	edit_count = 0
+	for page in dump_pages:
+		if 0 < limit <= edit_count:
+			break
+		new_text = transform.apply(page.text)
+		edited = new_text != page.text
+		if edited:
+			with open(f'{page.title}.txt', 'w') as out_file:
+				out_file.write(new_text)
+			print(f'Saved {page.title}')
+			edit_count += 1
+		if checkpoint:
+			checkpoint.record(page.pageid, page.title, 'edited' if edited else 'skipped')
+	print(transform.report())
+
+def rename_transform(old_name: str, new_name: str, verify: bool = False, stats: collections.Counter | None = None) -> wikitext_helpers.TemplateTransform:
+	'''Replace the name of every transclusion of the old template (however it is written) with the new name.'''
+	def rename(temp: wikitextparser.Template) -> None:
+		temp.name = new_name
+
+	return wikitext_helpers.TemplateTransform({old_name}, r'\{\{[^{}|]*(?P<rest>(\|.*)?\}\})', lambda mat: f'{{{{{new_name}{mat["rest"]}', rename, verify, stats)
 
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Find user-config.py however pytest is run
+os.environ.setdefault('PYWIKIBOT_DIR', ROOT)
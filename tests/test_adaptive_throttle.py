@@ -0,0 +1,87 @@
+import pytest
+
+import pywikibot_helpers
+import throttles
+
+@pytest.fixture
+def clock(monkeypatch):
+	'''A fake monotonic clock, so that record() and next_save do not depend on how fast the test runs. Sleeping just moves it on.'''
+	now = [1000.0]
+	monkeypatch.setattr(throttles.time, 'monotonic', lambda: now[0])
+	monkeypatch.setattr(throttles.time, 'sleep', lambda seconds: now.__setitem__(0, now[0] + seconds))
+	return now
+
+def test_increase_is_additive_and_capped(clock):
+	throttle = throttles.AdaptiveThrottle(max_rate=12, increase=2)
+	assert throttle.rate == 6
+	for rate in (8, 10, 12, 12):
+		throttle.record(latency=1)
+		assert throttle.rate == rate
+	assert throttle.stats['increase'] == 4
+	assert throttle.next_save == clock[0] + 60 / 12
+
+@pytest.mark.parametrize('kwargs, reason', [
+	({'lag': throttles.MAXLAG_TARGET + 1}, 'lag'),
+	({'retry_after': 3}, 'retry_after'),
+	({'latency': throttles.SLOW_SAVE_SECONDS + 1}, 'slow'),
+])
+def test_decrease_is_multiplicative(clock, kwargs, reason):
+	throttle = throttles.AdaptiveThrottle(max_rate=40, decrease=0.5)
+	throttle.record(**{'latency': 1, **kwargs})
+	assert throttle.rate == 10
+	assert throttle.stats == {'saves': 1, f'decrease_{reason}': 1}
+
+def test_lag_at_target_is_not_a_decrease(clock):
+	throttle = throttles.AdaptiveThrottle(max_rate=40)
+	throttle.record(latency=1, lag=throttles.MAXLAG_TARGET)
+	assert throttle.rate == 21
+	assert throttle.stats['increase'] == 1
+
+def test_decrease_stops_at_min_rate(clock):
+	throttle = throttles.AdaptiveThrottle(max_rate=40, min_rate=4, decrease=0.5)
+	for rate in (10, 5, 4, 4):
+		throttle.record(latency=1, lag=60)
+		assert throttle.rate == rate
+	assert throttle.next_save == clock[0] + 60 / 4
+
+def test_retry_after_longer_than_interval_delays_next_save(clock):
+	throttle = throttles.AdaptiveThrottle(max_rate=60, decrease=0.5)
+	throttle.record(latency=1, retry_after=30)
+	# Halved to 15 saves per minute, that is one every 4 seconds, but the wiki asked for 30
+	assert throttle.next_save == clock[0] + 30
+
+def test_latency_defaults_to_time_since_wait(clock):
+	throttle = throttles.AdaptiveThrottle(max_rate=40)
+	throttle.wait()
+	clock[0] += throttles.SLOW_SAVE_SECONDS + 1
+	throttle.record()
+	assert throttle.stats['decrease_slow'] == 1
+
+def test_lag_seen_by_hook_is_recorded_once(clock):
+	throttle = throttles.AdaptiveThrottle(max_rate=40)
+	throttle.observed_lag = throttles.MAXLAG_TARGET + 1
+	throttle.record(latency=1)
+	throttle.record(latency=1)
+	assert throttle.stats == {'saves': 2, 'decrease_lag': 1, 'increase': 1}
+
+class FakePage:
+	def __init__(self, title: str, moves: list[tuple[str, float]], clock: list[float]):
+		self._title = title
+		self.moves = moves
+		self.clock = clock
+
+	def title(self) -> str:
+		return self._title
+
+	def move(self, new_title: str, **kwargs) -> None:
+		self.moves.append((new_title, self.clock[0]))
+
+def test_moves_are_paced_like_saves(clock):
+	throttle = throttles.AdaptiveThrottle(max_rate=20, increase=0)
+	moves = []
+	for i in range(3):
+		pywikibot_helpers.execute_move(FakePage(f'Old/{i}', moves, clock), f'New/{i}', 'move', 'Moved', throttle=throttle)
+	assert [new_title for new_title, _ in moves] == ['New/0', 'New/1', 'New/2']
+	# At 10 moves per minute
+	assert [later - earlier for (_, earlier), (_, later) in zip(moves, moves[1:])] == [6, 6]
+	assert throttle.stats['saves'] == 3
@@ -0,0 +1,53 @@
+import pywikibot_helpers
+import wiktionary_cats
+
+class FakeRequest:
+	def __init__(self, result: dict):
+		self.result = result
+
+	def submit(self) -> dict:
+		return self.result
+
+class FakeSite:
+	'''A category whose subcategories are listed from self.subcats, as (title, page ID, time added).'''
+
+	def __init__(self, subcats: list[tuple[str, int, str]]):
+		self.subcats = subcats
+		self.listings = 0
+
+	def simple_request(self, **params) -> FakeRequest:
+		latest = sorted(self.subcats, key=lambda subcat: subcat[2], reverse=True)[:1]
+		return FakeRequest({'query': {
+			'pages': [{'title': params['titles'], 'categoryinfo': {'subcats': len(self.subcats)}}],
+			'categorymembers': [{'pageid': pageid, 'timestamp': added} for _, pageid, added in latest],
+		}})
+
+def fake_list_records(site: FakeSite, list_name: str, **params):
+	site.listings += 1
+	return [pywikibot_helpers.PageRecord(pageid, 14, title) for title, pageid, _ in site.subcats]
+
+def fake_query_pages(site: FakeSite, titles, **params):
+	return ((title, {'categoryinfo': {'pages': 10}}) for title in titles)
+
+def test_rename_invalidates_snapshot(tmp_path, monkeypatch):
+	monkeypatch.setattr(pywikibot_helpers, 'list_records', fake_list_records)
+	monkeypatch.setattr(pywikibot_helpers, 'query_pages', fake_query_pages)
+	lang_path = tmp_path / 'langs.csv'
+	lang_path.write_text('1;en;English\n2;fr;French\n', encoding='utf-8')
+	snapshot_path = str(tmp_path / 'snapshots.json')
+	site = FakeSite([('Category:English nouns', 1, '2026-01-01T00:00:00Z'), ('Category:French nouns', 2, '2026-01-02T00:00:00Z')])
+	parent = wiktionary_cats.ParentCat('nouns', False, str(lang_path), site)
+
+	first = parent.subcats(snapshot_path)
+	assert parent.subcats(snapshot_path) == first
+	assert site.listings == 1
+
+	# One subcategory renamed: the number of subcategories is unchanged
+	site.subcats = [site.subcats[0], ('Category:French common nouns', 3, '2026-01-03T00:00:00Z')]
+	assert [title for title, _, _ in parent.subcats(snapshot_path)] == ['English nouns', 'French common nouns']
+	assert site.listings == 2
+
+	# One removed
+	site.subcats = site.subcats[1:]
+	assert [title for title, _, _ in parent.subcats(snapshot_path)] == ['French common nouns']
+	assert site.listings == 3
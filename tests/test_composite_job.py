@@ -0,0 +1,49 @@
+import pywikibot
+
+import composite_job
+import pywikibot_helpers
+
+class FakePage:
+	'''A page whose first save conflicts with an edit made since it was fetched.'''
+
+	def __init__(self, text: str, text_after_conflict: str):
+		self._text = text
+		self.text_after_conflict = text_after_conflict
+		self.latest_revision_id = 1
+		self.saves = []
+
+	def title(self) -> str:
+		return 'cat'
+
+	@property
+	def text(self) -> str:
+		return self._text
+
+	@text.setter
+	def text(self, value: str) -> None:
+		self._text = value
+
+	@text.deleter
+	def text(self) -> None:
+		self._text = None
+
+	def get(self, force: bool = False) -> str:
+		self._text = self.text_after_conflict
+		self.latest_revision_id = 2
+		return self._text
+
+	def save(self, summary: str, baserevid: int, **kwargs) -> None:
+		if baserevid == 1:
+			raise pywikibot.exceptions.EditConflictError('conflict')
+		self.saves.append((self._text, summary))
+
+def test_summary_describes_saved_attempt():
+	steps = [
+		(lambda text, title: text.replace('{{old}}', '{{new}}'), 'Rename {{old}}'),
+		(lambda text, title: text.replace('[[Category:Foo]]', '[[Category:Bar]]'), 'Move to Bar'),
+	]
+	# Someone else renames {{old}} before the bot saves, and adds the category
+	page = FakePage('{{old}}\n', '{{new}}\n[[Category:Foo]]\n')
+	transform, summaries = composite_job.steps_transform('cat', steps)
+	assert pywikibot_helpers.save_transformed(page, transform, lambda: '; '.join(summaries))
+	assert page.saves == [('{{new}}\n[[Category:Bar]]\n', 'Move to Bar')]
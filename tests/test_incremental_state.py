@@ -0,0 +1,41 @@
+import datetime
+
+import pywikibot
+
+import run_state
+
+class FakeSite:
+	'''Just enough of a site for IncrementalState: a clock and a list of recent changes.'''
+
+	def __init__(self):
+		self.now = pywikibot.Timestamp(2026, 1, 1)
+		self.changes = []
+
+	def server_time(self) -> pywikibot.Timestamp:
+		return self.now
+
+	def recentchanges(self, start, reverse, changetype, namespaces=None, page=None):
+		return [change for change in self.changes if change['timestamp'] >= start]
+
+def run(site: FakeSite, path: str, declined: set[str]) -> set[str] | None:
+	'''One run of a job that edits every changed page except those in declined.'''
+	state = run_state.IncrementalState('job', path)
+	titles = state.changed_titles(site, namespaces=[4])
+	for title in titles or ():
+		if title in declined:
+			state.retry(title)
+	state.commit()
+	site.now += datetime.timedelta(hours=1)
+	return titles
+
+def test_declined_page_is_retried(tmp_path):
+	path = str(tmp_path / 'state.json')
+	site = FakeSite()
+	assert run(site, path, set()) is None
+
+	site.changes.append({'rcid': 1, 'type': 'edit', 'title': 'Wiktionary:About Foo', 'timestamp': site.now})
+	assert run(site, path, {'Wiktionary:About Foo'}) == {'Wiktionary:About Foo'}
+	# Nothing has changed since, but the declined page is looked at again
+	assert run(site, path, set()) == {'Wiktionary:About Foo'}
+	# Once it has been edited it is dropped
+	assert run(site, path, set()) == set()
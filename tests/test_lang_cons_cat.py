@@ -0,0 +1,103 @@
+import math
+import sys
+
+import pywikibot
+import pywikibot.data.api
+
+import lang_cons_cat
+import pywikibot_helpers
+
+# Enough pages that each listing takes several requests
+PAGE_COUNT = 1200
+CANONICAL_NAMESPACES = {-2: 'Media', -1: 'Special', 0: '', 1: 'Talk', 2: 'User', 3: 'User talk', 4: 'Project', 5: 'Project talk', 6: 'File', 7: 'File talk', 8: 'MediaWiki', 9: 'MediaWiki talk', 10: 'Template', 11: 'Template talk', 12: 'Help', 13: 'Help talk', 14: 'Category', 15: 'Category talk'}
+NAMESPACES = {str(ns): {'id': ns, 'case': 'first-letter', 'name': {4: 'Wiktionary', 5: 'Wiktionary talk'}.get(ns, name), 'canonical': name, 'subpages': ns > 0, 'content': ns == 0} for ns, name in CANONICAL_NAMESPACES.items()}
+GENERAL = {'mainpage': 'Wiktionary:Main Page', 'base': 'https://en.wiktionary.org/wiki/Wiktionary:Main_Page', 'sitename': 'Wiktionary', 'generator': 'MediaWiki 1.43.0', 'case': 'first-letter', 'lang': 'en', 'server': '//en.wiktionary.org', 'servername': 'en.wiktionary.org', 'scriptpath': '/w', 'script': '/w/index.php', 'articlepath': '/wiki/$1', 'wikiid': 'enwiktionary', 'time': '2026-01-01T00:00:00Z', 'timezone': 'UTC', 'timeoffset': 0, 'legaltitlechars': " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+", 'linktrail': '/^([a-z]+)(.*)$/sD', 'rtl': False, 'readonly': False, 'writeapi': True, 'thumblimits': {}, 'imagelimits': {}, 'magiclinks': {}}
+QUERY_MODULES = {'prop': {'revisions': 'rv', 'info': 'in', 'categoryinfo': 'ci', 'categories': 'cl', 'imageinfo': 'ii'}, 'list': {'categorymembers': 'cm', 'allpages': 'ap'}, 'meta': {'siteinfo': 'si', 'userinfo': 'ui'}}
+
+def module_info(path: str, prefix: str = '', parameters: list | None = None) -> dict:
+	return {'name': path.rpartition('+')[2], 'path': path, 'prefix': prefix, 'parameters': parameters or []}
+
+MODULES = {
+	'main': module_info('main', parameters=[{'name': 'action', 'type': ['query', 'paraminfo'], 'submodules': {'query': 'query', 'paraminfo': 'paraminfo'}}]),
+	'paraminfo': module_info('paraminfo'),
+	'query': module_info('query', parameters=[{'name': kind, 'type': list(modules), 'limit': 50, 'submodules': {name: f'query+{name}' for name in modules}} for kind, modules in QUERY_MODULES.items()] + [{'name': 'generator', 'type': ['categorymembers', 'allpages'], 'submodules': {}}]),
+	**{f'query+{name}': module_info(f'query+{name}', prefix, [{'name': 'limit', 'type': 'limit', 'max': 500, 'highmax': 5000}, {'name': 'prop', 'type': [], 'limit': 50, 'highlimit': 500}] + [{'name': param, 'type': 'string'} for param in ('namespace', 'title', 'prefix', 'filterredir', 'type')]) for modules in QUERY_MODULES.values() for name, prefix in modules.items()},
+}
+
+class FakeApi:
+	'''
+	Just enough of the API of a wiki (in place of pywikibot.data.api.Request.submit) for pywikibot to set up a site, list category members and pages by prefix, and preload pages, recording every request made once the site is set up.
+	'''
+
+	def __init__(self, pages: dict[str, str], members: list[str]):
+		self.pages = {title: (pageid, text) for pageid, (title, text) in enumerate(pages.items(), 1)}
+		self.members = members
+		self.requests = []
+
+	def submit(self, request: pywikibot.data.api.Request) -> dict:
+		params = request._params
+		if 'siteinfo' in params.get('meta', []):
+			known = {'general': dict(GENERAL), 'namespaces': NAMESPACES, 'namespacealiases': []}
+			if not set(params['siprop']) <= set(known):
+				raise pywikibot.exceptions.APIError('siunknown_siprop', 'Unrecognized value for parameter "siprop"')
+			return {'query': {'userinfo': {'id': 0, 'name': '127.0.0.1', 'anon': True}, **{prop: known[prop] for prop in params['siprop']}}}
+		if 'userinfo' in params.get('meta', []):
+			return {'query': {'userinfo': {'id': 0, 'name': '127.0.0.1', 'anon': True, 'groups': ['*'], 'rights': ['read', 'edit']}}}
+		if params['action'] == ['paraminfo']:
+			return {'paraminfo': {'modules': [MODULES[name] for name in params['modules'] if name in MODULES]}}
+		self.requests.append(params)
+		if params.get('generator') == ['categorymembers']:
+			return self.listing(self.members, params, 'gcm')
+		if params.get('generator') == ['allpages']:
+			prefix = f'Wiktionary:{params["gapprefix"][0]}'
+			return self.listing(sorted(title for title in self.pages if title.startswith(prefix)), params, 'gap')
+		# Preloading, by title or by page ID
+		if 'titles' in params or 'pageids' in params:
+			titles = params['titles'] if 'titles' in params else [title for title, (pageid, text) in self.pages.items() if str(pageid) in params['pageids']]
+			return {'query': {'pages': {str(self.pages[title][0]): self.page(title, content=True) for title in titles}}}
+		raise ValueError(f'Unexpected request: {params}')
+
+	def page(self, title: str, content: bool = False) -> dict:
+		pageid, text = self.pages[title]
+		page = {'pageid': pageid, 'ns': 4, 'title': title, 'lastrevid': pageid, 'length': len(text), 'contentmodel': 'wikitext', 'touched': '2026-01-01T00:00:00Z'}
+		if content:
+			page['revisions'] = [{'revid': pageid, 'parentid': 0, 'user': 'Someone', 'timestamp': '2026-01-01T00:00:00Z', 'comment': '', 'slots': {'main': {'contentmodel': 'wikitext', 'contentformat': 'text/x-wiki', '*': text}}}]
+		return page
+
+	def listing(self, titles: list[str], params: dict, prefix: str) -> dict:
+		start = int(params.get(f'{prefix}continue', ['0'])[0])
+		end = start + int(params[f'{prefix}limit'][0])
+		batch = titles[start:end]
+		result = {'query': {'pages': {str(self.pages[title][0]): self.page(title) for title in batch}, 'pageids': [str(self.pages[title][0]) for title in batch]}}
+		if end < len(titles):
+			result['continue'] = {f'{prefix}continue': str(end), 'continue': f'{prefix}continue||'}
+		return result
+
+def test_requests_scale_with_batches_not_pages(tmp_path, monkeypatch):
+	titles = [f'Wiktionary:About Lang{i:04}' for i in range(PAGE_COUNT)]
+	pages = {title: f'Considerations for {title}.' for title in titles}
+	# Every tenth page is not yet in the category, and subpages never need checking
+	members = [title for i, title in enumerate(titles) if i % 10]
+	pages['Wiktionary:About Lang0000/Pronunciation'] = 'Subpage.'
+	api = FakeApi(pages, members)
+	monkeypatch.setattr(pywikibot.data.api.Request, 'submit', lambda request: api.submit(request))
+	# Keep the throttle file and the API cache out of the repository, and set up a new site
+	monkeypatch.setattr(pywikibot.config, 'base_dir', str(tmp_path))
+	monkeypatch.setattr(pywikibot, '_sites', {})
+	edited = []
+	monkeypatch.setattr(pywikibot_helpers, 'edit', lambda page, new_text, reason, **kwargs: edited.append(page.title()) or True)
+	monkeypatch.setattr(sys, 'argv', ['lang_cons_cat.py'])
+
+	lang_cons_cat.main()
+
+	candidates = PAGE_COUNT - len(members)
+	assert sorted(edited) == sorted(set(titles) - set(members))
+	# Neither the categories nor the text of each page is fetched separately
+	assert not any('categories' in params.get('prop', []) for params in api.requests)
+	member_listings = sum(params.get('generator') == ['categorymembers'] for params in api.requests)
+	prefix_listings = sum(params.get('generator') == ['allpages'] for params in api.requests)
+	preloads = sum('titles' in params or 'pageids' in params for params in api.requests)
+	assert member_listings == math.ceil(len(members) / 500)
+	assert prefix_listings == math.ceil((PAGE_COUNT + 1) / 500)
+	assert preloads == math.ceil(candidates / pywikibot_helpers.API_TITLES_LIMIT)
+	assert len(api.requests) == member_listings + prefix_listings + preloads
@@ -0,0 +1,84 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pywikibot
+
+import language_considerations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# How long the lookup of the second page takes in a separate process, in seconds
+SLOW_LOOKUP = 30
+
+class FakePage:
+	def __init__(self, title: str):
+		self._title = title
+
+	def title(self) -> str:
+		return self._title
+
+PAGES = [FakePage('Wiktionary:About french'), FakePage('Wiktionary:About French'), FakePage('Wiktionary:About German')]
+
+def test_look_up_next_prints_nothing(monkeypatch, capsys):
+	monkeypatch.setattr(language_considerations, 'get_backlinks', lambda page, lang: {page.title(): []})
+	pages = iter(PAGES)
+	notes, (page, lang, backlinks) = language_considerations.look_up_next(pages, [])
+	assert lang == 'French'
+	assert notes == ['Note: Skipping [[Wiktionary:About french]] because its language would not be titlecased.']
+	assert language_considerations.look_up_next(pages, ['German']) == ([], None)
+	assert capsys.readouterr().out == ''
+
+def test_quit_does_not_wait_for_running_lookup(monkeypatch):
+	release = threading.Event()
+	def get_backlinks(page: FakePage, lang: str) -> dict:
+		# The lookup of the second page is still running when the operator quits
+		if lang == 'German':
+			release.wait(30)
+		return {page.title(): []}
+	monkeypatch.setattr(language_considerations, 'get_backlinks', get_backlinks)
+	monkeypatch.setattr(pywikibot, 'Category', lambda site, title: None)
+	monkeypatch.setattr(pywikibot.pagegenerators, 'CategorizedPageGenerator', lambda cat: PAGES)
+	monkeypatch.setattr('builtins.input', lambda prompt: 'q')
+	start = time.monotonic()
+	language_considerations.review_interactively(None, [])
+	assert time.monotonic() - start < 10
+	# Output is no longer held back once the review is over (pywikibot's own filters stay)
+	assert not any(isinstance(log_filter, language_considerations.HeldOutput) for handler in logging.getLogger('pywiki').handlers for log_filter in handler.filters)
+	release.set()
+
+QUITTER = f'''
+import builtins
+import sys
+import threading
+import time
+sys.path.insert(0, {ROOT!r})
+import pywikibot
+import language_considerations
+class FakePage:
+	def __init__(self, title):
+		self._title = title
+	def title(self):
+		return self._title
+started = threading.Event()
+def get_backlinks(page, lang):
+	if lang == 'German':
+		started.set()
+		time.sleep({SLOW_LOOKUP})
+	return {{page.title(): []}}
+language_considerations.get_backlinks = get_backlinks
+pywikibot.Category = lambda site, title: None
+pywikibot.pagegenerators.CategorizedPageGenerator = lambda cat: [FakePage('Wiktionary:About French'), FakePage('Wiktionary:About German')]
+# Quit only once the lookup of the second page is running
+builtins.input = lambda prompt: started.wait() and 'q'
+language_considerations.review_interactively(None, [])
+'''
+
+def test_process_exits_without_waiting_for_running_lookup(tmp_path):
+	start = time.monotonic()
+	# Run from elsewhere so that pywikibot writes nothing into the repository
+	subprocess.run([sys.executable, '-c', QUITTER], cwd=tmp_path, env=dict(os.environ, PYWIKIBOT_DIR=ROOT), stdout=subprocess.DEVNULL, check=True, timeout=SLOW_LOOKUP * 2)
+	# Including starting Python and importing pywikibot
+	assert time.monotonic() - start < SLOW_LOOKUP / 3
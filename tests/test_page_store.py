@@ -0,0 +1,12 @@
+import dumps
+import page_store
+
+def test_data_outlives_store(tmp_path):
+	store_path = str(tmp_path / 'pages.store')
+	page_store.extract([dumps.DumpPage('Foo', 0, 1, 10, 'fóó'), dumps.DumpPage('Bar', 0, 2, 20, 'bar')], store_path)
+	store = page_store.PageStore(store_path)
+	data = store.data(store.record('Foo'))
+	assert store.text(store.record('Bar')) == 'bar'
+	store.close()
+	assert store.map.closed
+	assert data == 'fóó'.encode('utf-8')
@@ -0,0 +1,57 @@
+import pytest
+import wikitextparser
+
+import temp_move
+import wikitext_helpers
+import wiktionary_cats
+
+@pytest.fixture
+def parses(monkeypatch):
+	'''Counts full parses with wikitextparser.'''
+	calls = []
+	parse = wikitextparser.parse
+	def counting_parse(text, *args, **kwargs):
+		calls.append(text)
+		return parse(text, *args, **kwargs)
+	monkeypatch.setattr(wikitextparser, 'parse', counting_parse)
+	return calls
+
+@pytest.fixture
+def parse_cache(tmp_path):
+	with wikitext_helpers.ParseCache(str(tmp_path / 'cache.sqlite')) as cache:
+		yield cache
+
+def test_miss_does_not_parse_when_fast_path_decides(parses, parse_cache):
+	transform = temp_move.rename_transform('old', 'new')
+	assert transform.apply('* {{old|a}} {{other}}\n', 1, parse_cache) == '* {{new|a}} {{other}}\n'
+	assert transform.apply('Nothing to do.\n', 2, parse_cache) == 'Nothing to do.\n'
+	assert parses == []
+	assert parse_cache.stats['parse_cache_miss'] == 0
+
+def test_slow_path_parses_once_and_later_runs_reuse_it(parses, parse_cache):
+	transform = temp_move.rename_transform('old', 'new')
+	# A template parameter ({{{1}}}) keeps the fast path from handling the page
+	text = '{{{1}}} {{other}}\n'
+	assert transform.apply(text, 3, parse_cache) == text
+	assert len(parses) == 1
+	assert transform.apply(text, 3, parse_cache) == text
+	assert len(parses) == 1
+	assert parse_cache.stats == {'parse_cache_miss': 1, 'parse_cache_hit': 1}
+
+def test_lang_cat_section_scan_does_not_consult_cache(parses, parse_cache):
+	src = wiktionary_cats.LangCat('nouns', 'en', 'English')
+	dst = wiktionary_cats.LangCat('common nouns', 'en', 'English')
+	text = '==English==\n===Noun===\ncat\n\n{{cln|en|nouns}}\n\n----\n\n==French==\nchat\n'
+	assert '{{cln|en|common nouns}}' in src.retarget_page_text(text, 'cat', dst, revid=4, parse_cache=parse_cache)
+	assert parse_cache.stats['parse_cache_miss'] == 0
+	# Only the English section was parsed, once to remove the category and once to add the new one
+	assert all(parsed.startswith('==English==') and '==French==' not in parsed for parsed in parses)
+
+def test_lang_cat_cached_revision_not_in_category_is_not_parsed(parses, parse_cache):
+	src = wiktionary_cats.LangCat('nouns', 'en', 'English')
+	dst = wiktionary_cats.LangCat('common nouns', 'en', 'English')
+	text = '==French==\nchat\n'
+	for _ in range(2):
+		with pytest.raises(ValueError):
+			src.retarget_page_text(text, 'chat', dst, revid=5, parse_cache=parse_cache)
+	assert len(parses) == 1
@@ -0,0 +1,53 @@
+'''
+A differential test of the {{rhymes}} transform of rhyme_syllable_counts.py against the whole-page regex it replaced, over a fixed corpus of page texts.
+'''
+
+import re
+
+import pytest
+
+import rhyme_syllable_counts
+
+# The substitution rhyme_syllable_counts.py made before it used wikitext_helpers.TemplateTransform
+def baseline(text: str, syllable_count: int) -> str:
+	return re.sub(r'^(\*+ {{rhymes?\|en' + rhyme_syllable_counts.TEMP_PARAMS_PATTERN + r')}}', r'\1|s=' + str(syllable_count) + r'}}', text, flags=re.MULTILINE)
+
+CORPUS = [
+	# Edited
+	'==English==\n\n===Pronunciation===\n* {{IPA|en|/kæt/}}\n* {{rhymes|en|æt}}\n',
+	'* {{rhyme|en|æt}}',
+	'** {{rhymes|en|æt|eɪt}}\n',
+	'* {{rhymes|en|æt|q1=US}}\n* {{rhymes|en|ɑːt|q=UK}}\n',
+	'===Pronunciation===\n* {{rhymes|en|iː}}\n* {{hyphenation|en|tea}}\n\n===Noun===\n{{en-noun}}\n',
+	# Left alone because they do not start a bulleted line
+	'{{rhymes|en|æt}}\n',
+	'* {{a|US}} {{rhymes|en|æt}}\n',
+	'*{{rhymes|en|æt}}\n',
+	'Compare {{rhymes|en|æt}} in prose.\n',
+	'* {{IPA|en|/kæt/}}<ref>{{rhymes|en|æt}}</ref>\n',
+	'* {{q|{{rhymes|en|æt}}}}\n',
+	# Left alone because of their arguments or language
+	'* {{rhymes|fr|a}}\n',
+	'* {{rhymes|en|æt|s=1}}\n',
+	'* {{rhymes|en}}\n',
+	'* {{rhymes|en|æt\n|eɪt}}\n',
+	'* {{Rhymes|en|æt}}\n',
+	# Several languages and transclusions on one page
+	'==English==\n* {{rhymes|en|æt}}\n\n----\n\n==French==\n* {{rhymes|fr|a}}\n',
+	'* {{rhymes|en|æt}} {{rhymes|en|eɪt}}\n',
+	'* {{rhymes|en|æt}}\n* {{q|{{m|en|cat}}}}\n* {{rhymes|en|eɪt}}\n',
+]
+
+@pytest.mark.parametrize('text', CORPUS)
+@pytest.mark.parametrize('syllable_count', [1, 3])
+def test_same_as_baseline(text: str, syllable_count: int):
+	transform = rhyme_syllable_counts.rhymes_transform(syllable_count)
+	expected = baseline(text, syllable_count)
+	assert transform.apply_slow(text) == expected
+	fast = transform.apply_fast(text)
+	assert fast is None or fast == expected
+
+def test_corpus_exercises_both_outcomes():
+	transform = rhyme_syllable_counts.rhymes_transform(1)
+	edited = sum(transform.apply(text) != text for text in CORPUS)
+	assert 0 < edited < len(CORPUS)
@@ -0,0 +1,39 @@
+import sys
+
+import pywikibot
+
+import pywikibot_helpers
+import rollback
+
+class FakePage:
+	def __init__(self, title: str, revid: int):
+		self._title = title
+		self.latest_revision_id = revid
+		self.text = f'Text of {title} after the run.'
+
+	def title(self) -> str:
+		return self._title
+
+	def exists(self) -> bool:
+		return True
+
+def test_failed_save_does_not_stop_rollback(tmp_path, monkeypatch, capsys):
+	log_path = tmp_path / 'edits.log'
+	log_path.write_text('Foo\t1\t2\nBar\t3\t4\nBaz\t5\t6\n', encoding='utf-8')
+	monkeypatch.setattr(pywikibot, 'Site', lambda: None)
+	monkeypatch.setattr(pywikibot_helpers, 'titled_pages', lambda site, revids: [FakePage(title, new_revid) for title, (_, new_revid) in revids.items()])
+	monkeypatch.setattr(rollback, 'revision_texts', lambda site, revids: {revid: f'Revision {revid}.' for revid in revids})
+	saved = []
+	def save_transformed(page: FakePage, transform, summary: str, **kwargs) -> bool:
+		if page.title() == 'Bar':
+			# Protected since the run
+			raise pywikibot.exceptions.LockedPageError(3)
+		saved.append((page.title(), transform(page.text)))
+		return True
+	monkeypatch.setattr(pywikibot_helpers, 'save_transformed', save_transformed)
+	monkeypatch.setattr(sys, 'argv', ['rollback.py', str(log_path)])
+	rollback.main()
+	assert saved == [('Foo', 'Revision 1.'), ('Baz', 'Revision 5.')]
+	out = capsys.readouterr().out
+	assert 'Error: Unable to revert [[Bar]]' in out
+	assert 'Reverted 2 of 3 pages.' in out and 'Failed to save 1.' in out
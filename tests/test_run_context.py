@@ -0,0 +1,26 @@
+import argparse
+
+import pytest
+
+import run_state
+
+def test_resources_closed_and_reported_on_error(tmp_path, capsys, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	args = argparse.Namespace(dry_run=False, shard=(0, 2), edit_log=str(tmp_path / 'edits.tsv'), parse_cache=str(tmp_path / 'cache.sqlite3'), max_save_rate=None, rate_budget=None)
+	with pytest.raises(RuntimeError):
+		with run_state.run_context(args, 'job') as run:
+			run.edit_log.record('Foo', 1, 2)
+			raise RuntimeError
+	assert run.throttle is None
+	assert run.checkpoint.checkpoint_file.closed
+	assert run.edit_log.log_file.closed
+	out = capsys.readouterr().out
+	# The edit log, which says how to undo the run, is reported last
+	assert out.rstrip('\n').endswith(run.edit_log.report())
+	assert run_state.read_edit_log(args.edit_log) == {'Foo': (1, 2)}
+
+def test_dry_run_has_no_edit_log_or_throttle(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	args = argparse.Namespace(dry_run=True, shard=None, edit_log=None, max_save_rate=30, rate_budget=None)
+	with run_state.run_context(args, 'job', site=object()) as run:
+		assert run.edit_log is None and run.throttle is None and run.checkpoint is None and run.parse_cache is None
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('fcntl')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAVES = 5
+PROCESSES = 3
+# Saves per minute, shared by all the processes
+MAX_RATE = 300
+
+WORKER = f'''
+import sys
+import time
+sys.path.insert(0, {ROOT!r})
+import throttles
+throttle = throttles.SharedThrottle(sys.argv[1], {MAX_RATE})
+for _ in range({SAVES}):
+	throttle.wait()
+	print(time.time(), flush=True)
+	throttle.record(latency=0.01)
+'''
+
+def test_processes_share_budget(tmp_path):
+	budget_path = str(tmp_path / 'budget')
+	workers = [subprocess.Popen([sys.executable, '-c', WORKER, budget_path], stdout=subprocess.PIPE, text=True) for _ in range(PROCESSES)]
+	times = sorted(float(line) for worker in workers for line in worker.communicate(timeout=120)[0].split())
+	assert all(worker.returncode == 0 for worker in workers)
+	assert len(times) == SAVES * PROCESSES
+	interval = 60 / MAX_RATE
+	# Each process alone could save every interval, so together they would take a third of the time without the shared budget
+	assert times[-1] - times[0] >= (len(times) - 1) * interval * 0.95
+	# Allowing for processes waking up a little late from their sleeps
+	assert all(later - earlier > interval / 2 for earlier, later in zip(times, times[1:]))
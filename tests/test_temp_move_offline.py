@@ -0,0 +1,23 @@
+import sys
+
+import dumps
+import page_store
+import temp_move
+
+def test_store_closed_after_offline_dry_run(tmp_path, monkeypatch):
+	store_path = str(tmp_path / 'pages.store')
+	page_store.extract([dumps.DumpPage('Foo', 0, 1, 10, '{{old|a}}'), dumps.DumpPage('Bar', 0, 2, 20, 'no template')], store_path)
+	titles_path = tmp_path / 'titles.txt'
+	titles_path.write_text('Foo\nBar\n', encoding='utf-8')
+	closed = []
+	close = page_store.PageStore.close
+	def record_close(self: page_store.PageStore) -> None:
+		closed.append(self)
+		close(self)
+	monkeypatch.setattr(page_store.PageStore, 'close', record_close)
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setattr(sys, 'argv', ['temp_move.py', 'old', 'new', 'Rename', '-p', str(titles_path), '--store', store_path, '-d'])
+	temp_move.main()
+	assert len(closed) == 1
+	assert (tmp_path / 'Foo.txt').read_text() == '{{new|a}}'
+	assert not (tmp_path / 'Bar.txt').exists()
@@ -0,0 +1,105 @@
+'''
+Differential tests of the template transforms of temp_move.py, archive/lookfrom/lookfrom.py and archive/taos_apostrophes/ns0_replace.py against the edits they replaced, over fixed corpora of page texts (see also test_rhymes_transform.py).
+'''
+
+import importlib.util
+import os
+import re
+
+import pytest
+import wikitextparser
+
+import temp_move
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_archived(*path: str):
+	'''Imports an archived script, which is not in a package.'''
+	spec = importlib.util.spec_from_file_location(os.path.splitext(path[-1])[0], os.path.join(ROOT, 'archive', *path))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+lookfrom = load_archived('lookfrom', 'lookfrom.py')
+ns0_replace = load_archived('taos_apostrophes', 'ns0_replace.py')
+
+# What temp_move.py did before it used wikitext_helpers.TemplateTransform
+def rename_baseline(text: str) -> str:
+	wikitext = wikitextparser.parse(text)
+	for temp in wikitext.templates:
+		if temp.normal_name() == 'old':
+			temp.name = 'new'
+	return wikitext.string
+
+# What lookfrom.py did to each English section
+def lookfrom_baseline(text: str) -> str:
+	return re.sub(r'\{\{[lL]ookfrom(?=\||\}\})', '{{lookfrom|en', text)
+
+# What ns0_replace.py did to each line
+def twf_baseline(text: str) -> str:
+	return '\n'.join(re.sub(r'(\{\{[^}]*?\|twf\|)([^}]*?)(\}\})', ns0_replace.sub_replace, line) for line in text.split('\n'))
+
+RENAME_CORPUS = [
+	'{{old}}',
+	'{{old|a|b=c}}\n',
+	'* {{old|a}} and {{old|b}}\n',
+	'{{Old|a}}',
+	'{{ old |a}}',
+	'{{Template:old|a}}',
+	'{{old_|a}}',
+	'{{old\n|a\n|b}}\n',
+	'{{old<!--c-->|x}}',
+	'{{old|x<!--c-->}}',
+	'<!-- {{old|x}} -->{{old|y}}',
+	'<nowiki>{{old|x}}</nowiki>',
+	'{{q|{{old|x}}}}',
+	'{{old|{{m|en|x}}}}',
+	'{{older|x}} {{fold|y}}',
+	'{{{1|{{old}}}}}',
+]
+
+LOOKFROM_CORPUS = [
+	'===See also===\n* {{lookfrom}}\n',
+	'* {{lookfrom|foo}}\n',
+	'* {{Lookfrom|foo}}\n* {{lookfrom}}\n',
+	'{{lookfrom|en|foo}}',
+	'{{lookfrom|\nfoo}}',
+	'{{lookfromx|foo}}',
+	'{{lookfrom |foo}}',
+	'{{q|{{lookfrom|foo}}}}',
+	'No template at all.\n',
+]
+
+TWF_CORPUS = [
+	'# {{m|twf|twf|a’a}}\n',
+	'{{m|twf|twf|a’a|b’b}}',
+	'{{m|twf|a’a}} and {{m|twf|b’b}}\n{{m|twf|c’c}}',
+	'{{m|twf}} a’a',
+	'{{m|twf|}}',
+	'{{l|en|a’a}}',
+	'{{m|twf|\na’a}}',
+	'{{m\n|twf|a’a}}',
+	'{{m|twf|a’a\n}}',
+	'{{m|twf|a’a}}\n{{m|twf\n|b’b}}',
+	'{{m|twf|a’a}}<ref>x</ref>',
+	'{{m|tw|a’a}}',
+]
+
+@pytest.mark.parametrize('transform, baseline, corpus', [
+	(temp_move.rename_transform('old', 'new'), rename_baseline, RENAME_CORPUS),
+	(lookfrom.lookfrom_transform(), lookfrom_baseline, LOOKFROM_CORPUS),
+	(ns0_replace.twf_transform(), twf_baseline, TWF_CORPUS),
+], ids=['rename', 'lookfrom', 'twf'])
+def test_same_as_baseline(transform, baseline, corpus):
+	for text in corpus:
+		expected = baseline(text)
+		assert transform.apply_slow(text) == expected, text
+		fast = transform.apply_fast(text)
+		assert fast is None or fast == expected, text
+	# Both outcomes are exercised
+	assert 0 < sum(transform.apply(text) != text for text in corpus) < len(corpus)
+
+def test_comment_in_name_is_left_to_slow_path():
+	transform = temp_move.rename_transform('old', 'new')
+	assert transform.apply_fast('{{old<!--c-->|x}}') is None
+	assert transform.apply('{{old<!--c-->|x}}') == '{{new|x}}'
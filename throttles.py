@@ -0,0 +1,163 @@
+'''
+Pacing of saves to a wiki: an adaptive throttle that speeds up while the wiki keeps up and slows down when it struggles, and a variant that shares a rate budget between the processes running the shards of a job (see run_state.py).
+'''
+
+import argparse
+import collections
+import math
+import time
+from typing import Callable
+
+import pywikibot
+
+# The default ceiling on the rate of saves, in saves per minute
+MAX_SAVE_RATE = 30
+# The database lag (in seconds) above which the wiki is considered to be struggling, matching pywikibot's default maxlag for writes
+MAXLAG_TARGET = 5
+# A save that takes longer than this (in seconds) is taken as a sign that the wiki is struggling
+SLOW_SAVE_SECONDS = 10
+
+class AdaptiveThrottle:
+	'''
+	Paces saves to a site with additive increase / multiplicative decrease (as in TCP congestion control) in place of pywikibot's fixed put throttle: the rate of saves creeps up while the wiki keeps up, and is cut whenever it reports database lag, asks for a pause with Retry-After, or is slow to respond.
+	Call wait() before each save and record() after it, or just use save() (or move(), for moves).
+	max_rate: The ceiling on the rate of saves, in saves per minute.
+	min_rate: The floor on the rate of saves, in saves per minute.
+	increase: How much to raise the rate by after each save that went smoothly, in saves per minute.
+	decrease: The factor by which to cut the rate after each save that did not.
+	'''
+
+	def __init__(self, max_rate: float = MAX_SAVE_RATE, min_rate: float = 1, increase: float = 1, decrease: float = 0.5):
+		self.max_rate = max_rate
+		self.min_rate = min(min_rate, max_rate)
+		self.increase = increase
+		self.decrease = decrease
+		self.rate = max(self.min_rate, max_rate / 2)
+		self.next_save = 0.0
+		self.save_start = None
+		# what the hook installed by install() has seen since the last save
+		self.observed_lag = 0.0
+		self.observed_retry_after = 0.0
+		self.waited = 0.0
+		self.stats = collections.Counter()
+
+	def install(self, site: pywikibot.site.BaseSite) -> 'AdaptiveThrottle':
+		'''
+		Lowers pywikibot's own put throttle for site to the ceiling of this throttle (so that the two do not both sleep between saves), and hooks into its handling of maxlag errors so that record() learns about them.
+		Returns self, for convenience.
+		'''
+		site.throttle.set_delays(writedelay=60 / self.max_rate)
+		pywikibot_lag = site.throttle.lag
+		def lag(lagtime: float | None = None) -> None:
+			self.observed_lag = max(self.observed_lag, lagtime or 0)
+			self.observed_retry_after = max(self.observed_retry_after, site.throttle.retry_after)
+			pywikibot_lag(lagtime)
+		site.throttle.lag = lag
+		return self
+
+	def wait(self) -> None:
+		delay = self.next_save - time.monotonic()
+		if delay > 0:
+			self.waited += delay
+			time.sleep(delay)
+		self.save_start = time.monotonic()
+
+	def record(self, latency: float | None = None, lag: float = 0, retry_after: float = 0) -> None:
+		'''
+		Adjusts the rate after a save. The lag and Retry-After seen by the hook installed by install() are added to those given, and latency defaults to the time since wait() returned.
+		'''
+		now = time.monotonic()
+		if latency is None:
+			latency = now - self.save_start if self.save_start is not None else 0
+		lag = max(lag, self.observed_lag)
+		retry_after = max(retry_after, self.observed_retry_after)
+		self.observed_lag = self.observed_retry_after = 0.0
+		self.save_start = None
+		self.stats['saves'] += 1
+		reason = 'retry_after' if retry_after else 'lag' if lag > MAXLAG_TARGET else 'slow' if latency > SLOW_SAVE_SECONDS else None
+		if reason:
+			self.rate = max(self.min_rate, self.rate * self.decrease)
+			self.stats[f'decrease_{reason}'] += 1
+		else:
+			self.rate = min(self.max_rate, self.rate + self.increase)
+			self.stats['increase'] += 1
+		self.next_save = now + max(60 / self.rate, retry_after)
+
+	def save(self, page: pywikibot.Page, **save_kwargs) -> None:
+		'''Calls page.save() with save_kwargs when the current rate allows.'''
+		self.pace(page.save, **save_kwargs)
+
+	def move(self, page: pywikibot.Page, new_title: str, **move_kwargs) -> None:
+		'''Calls page.move() with new_title and move_kwargs when the current rate allows. A move is paced like a save, since it edits the wiki just the same (and makes a redirect too).'''
+		self.pace(page.move, new_title, **move_kwargs)
+
+	def pace(self, action: Callable[..., object], *args, **kwargs) -> None:
+		'''Calls action with args and kwargs when the current rate allows, and adjusts the rate according to how it went.'''
+		self.wait()
+		try:
+			action(*args, **kwargs)
+		except pywikibot.exceptions.MaxlagTimeoutError:
+			self.observed_lag = math.inf
+			raise
+		finally:
+			self.record()
+
+	def report(self) -> str:
+		decreases = {reason: self.stats[f'decrease_{reason}'] for reason in ('lag', 'retry_after', 'slow')}
+		return (f'Throttle: {self.stats["saves"]} saves, rate now {self.rate:.1f} of at most {self.max_rate:g} per minute, '
+			f'{self.stats["increase"]} increases, {sum(decreases.values())} decreases '
+			f'({decreases["lag"]} for lag, {decreases["retry_after"]} for Retry-After, {decreases["slow"]} for slow saves), '
+			f'{self.waited:.0f} seconds spent waiting.')
+
+class SharedThrottle(AdaptiveThrottle):
+	'''
+	An AdaptiveThrottle that also keeps to a rate budget shared by every process (on any machine) that uses the same coordinator file, for running one job as several shards at once.
+	The coordinator file holds the earliest time (in seconds since the epoch) at which the next save by any process may be made; each save locks it and reserves the next free slot.
+	budget_path: The coordinator file, which must be on a file system shared by all the processes that support locking.
+	max_rate: The ceiling on the rate of saves of all the processes together (as well as of this one), in saves per minute.
+	'''
+
+	def __init__(self, budget_path: str, max_rate: float = MAX_SAVE_RATE, **kwargs):
+		super().__init__(max_rate, **kwargs)
+		self.budget_path = budget_path
+
+	def wait(self) -> None:
+		# Only available on Unix (like PAWS), so only imported by sharded runs
+		import fcntl
+
+		super().wait()
+		with open(self.budget_path, 'a+', encoding='utf-8') as budget_file:
+			fcntl.flock(budget_file, fcntl.LOCK_EX)
+			budget_file.seek(0)
+			now = time.time()
+			slot = max(now, float(budget_file.read().strip() or 0))
+			budget_file.seek(0)
+			budget_file.truncate()
+			budget_file.write(str(slot + 60 / self.max_rate))
+			# The lock is released when the file is closed
+		if slot > now:
+			self.waited += slot - now
+			time.sleep(slot - now)
+		self.save_start = time.monotonic()
+
+def throttled_save(page: pywikibot.Page, throttle: AdaptiveThrottle | None, **save_kwargs) -> None:
+	if throttle is None:
+		page.save(**save_kwargs)
+	else:
+		throttle.save(page, **save_kwargs)
+
+def throttled_move(page: pywikibot.Page, new_title: str, throttle: AdaptiveThrottle | None, **move_kwargs) -> None:
+	if throttle is None:
+		page.move(new_title, **move_kwargs)
+	else:
+		throttle.move(page, new_title, **move_kwargs)
+
+def add_throttle_args(parser: argparse.ArgumentParser) -> None:
+	parser.add_argument('--max-save-rate', type=float, help=f'Pace saves adaptively according to how busy the wiki is, up to this many saves per minute (for example {MAX_SAVE_RATE}). By default pywikibot\'s fixed put throttle is used.')
+	parser.add_argument('--rate-budget', help=f'A coordinator file shared by several processes running shards of the same job, so that all of them together keep to --max-save-rate (or {MAX_SAVE_RATE} saves per minute if it is not given).')
+
+def throttle_from_args(args: argparse.Namespace, site: pywikibot.site.BaseSite) -> AdaptiveThrottle | None:
+	'''Returns a throttle installed on site according to the arguments added by add_throttle_args(), or None if none was asked for.'''
+	if args.rate_budget:
+		return SharedThrottle(args.rate_budget, args.max_save_rate or MAX_SAVE_RATE).install(site)
+	return AdaptiveThrottle(args.max_save_rate).install(site) if args.max_save_rate else None
@@ -0,0 +1,247 @@
+'''
+Helpers for editing wikitext that do not need a site (see pywikibot_helpers for those that do).
+'''
+
+import collections
+import json
+import re
+import sqlite3
+import zlib
+from typing import Callable, NamedTuple
+
+import wikitextparser
+
+# The start of every template transclusion, up to the end of its name
+TEMP_START_PATTERN = re.compile(r'\{\{([^{}|]*)(?=\||\}\})')
+# Markup inside a transclusion that changes how it splits into arguments, so that a regex can no longer be trusted to edit it
+NESTED_MARKUP_PATTERN = re.compile(r'\{\{|\[\[|<')
+# Regions in which templates are not parsed at all
+OPAQUE_PATTERN = re.compile(r'<!--.*?(?:-->|\Z)|<(nowiki|pre|math|syntaxhighlight|source)\b.*?(?:</\1\s*>|\Z)', flags=re.DOTALL | re.IGNORECASE)
+# A level 2 (language) header, like "==English=="
+L2_HEADER_PATTERN = re.compile(r'^==(?!=)(.+?)==[ \t]*$', flags=re.MULTILINE)
+PARSE_CACHE_PATH = 'parse_cache.sqlite'
+# How many new entries ParseCache collects before writing them to disk
+PARSE_CACHE_COMMIT_INTERVAL = 100
+
+class TemplateTransform:
+	'''
+	A local edit to every transclusion of some templates.
+	Most pages are edited on a fast path that applies a precompiled regex to the text of each transclusion. Only pages where a transclusion contains nested markup or is near a comment (or similar) are parsed in full with wikitextparser.
+	names: The normal names (see wikitextparser.Template.normal_name()) of the templates to edit, or None to consider every template.
+	pattern: A regex that must fullmatch the text of a transclusion (from "{{" to "}}") for it to be edited on the fast path.
+	repl: The replacement for pattern, as in re.sub().
+	edit: Makes the same edit to a parsed template on the slow path, leaving any transclusion the pattern would not match alone.
+	verify: Run both paths on every page and warn about any difference in output (in which case the slow path's output is used). Intended for dry runs.
+	stats: A counter to which to add how often each path was taken (so that several transforms can share one).
+	line_prefix: A regex that must fullmatch the text from the start of the line up to a transclusion for it to be edited (on either path), for example r'\\*+ ' for transclusions that start a bulleted line.
+	'''
+
+	def __init__(self, names: set[str] | None, pattern: str, repl: str | Callable[[re.Match], str], edit: Callable[[wikitextparser.Template], None], verify: bool = False, stats: collections.Counter | None = None, line_prefix: str | None = None):
+		self.names = names
+		self.pattern = re.compile(pattern, flags=re.DOTALL)
+		self.repl = repl
+		self.edit = edit
+		self.verify = verify
+		self.stats = collections.Counter() if stats is None else stats
+		self.line_prefix = None if line_prefix is None else re.compile(line_prefix)
+
+	def apply(self, text: str, revid: int | None = None, parse_cache: 'ParseCache | None' = None) -> str:
+		'''
+		revid, parse_cache: The revision the text is from and a cache of parse artifacts, which are consulted only when the fast path cannot handle the page, so that a revision already known to have no transclusions to edit is not parsed again.
+		'''
+		fast_text = self.apply_fast(text)
+		if fast_text is None:
+			parsed = None
+			if parse_cache and revid is not None:
+				artifacts = parse_cache.get(revid)
+				if artifacts is None:
+					parsed = parse_cache.parse(revid, text)
+				elif not self.matches(artifacts):
+					self.stats['transform_cached'] += 1
+					return text
+			self.stats['transform_slow'] += 1
+			return self.apply_slow(text, parsed)
+		self.stats['transform_fast'] += 1
+		if self.verify:
+			slow_text = self.apply_slow(text)
+			if fast_text != slow_text:
+				self.stats['transform_mismatch'] += 1
+				print('Warning: The fast path of a template transform gave different output from the slow path; using the latter.')
+				return slow_text
+		return fast_text
+
+	def apply_fast(self, text: str) -> str | None:
+		'''Returns None if the page is not simple enough around some transclusion for the fast path.'''
+		if '{{{' in text:
+			return None
+		opaque_starts = None
+		pieces = []
+		last_end = 0
+		for mat in TEMP_START_PATTERN.finditer(text):
+			# A comment (or the like) in a name hides the real name from normal_temp_name()
+			if '<' in mat[1]:
+				return None
+			if self.names is not None and normal_temp_name(mat[1]) not in self.names:
+				continue
+			start = mat.start()
+			# A nested transclusion of a template we are looking for has already been skipped over with its parent
+			if start < last_end:
+				return None
+			end = text.find('}}', mat.end())
+			if end == -1:
+				return None
+			end += 2
+			span = text[start:end]
+			if NESTED_MARKUP_PATTERN.search(span, 2):
+				return None
+			# Only look for comments and the like if there could be any
+			if '<' in text:
+				if opaque_starts is None:
+					opaque_starts = [(opaque.start(), opaque.end()) for opaque in OPAQUE_PATTERN.finditer(text)]
+				if any(op_start < end and start < op_end for op_start, op_end in opaque_starts):
+					return None
+			pieces.append(text[last_end:start])
+			pieces.append(self.pattern.sub(self.repl, span) if self.pattern.fullmatch(span) and self.after_line_prefix(text, start) else span)
+			last_end = end
+		pieces.append(text[last_end:])
+		return ''.join(pieces)
+
+	def after_line_prefix(self, text: str, start: int) -> bool:
+		return self.line_prefix is None or self.line_prefix.fullmatch(text, text.rfind('\n', 0, start) + 1, start) is not None
+
+	def matches(self, artifacts: 'ParseArtifacts') -> bool:
+		'''Whether a revision with the given artifacts has any transclusions that this transform might edit.'''
+		return self.names is None or not self.names.isdisjoint(artifacts.template_names())
+
+	def apply_slow(self, text: str, parsed: wikitextparser.WikiText | None = None) -> str:
+		'''parsed: The text already parsed, if it has been.'''
+		if parsed is None:
+			parsed = wikitextparser.parse(text)
+		for temp in parsed.templates:
+			# Earlier edits move later transclusions, so their positions are taken from the current text
+			if (self.names is None or temp.normal_name() in self.names) and (self.line_prefix is None or self.after_line_prefix(parsed.string, temp.span[0])):
+				self.edit(temp)
+		return parsed.string
+
+	def report(self) -> str:
+		fast = self.stats['transform_fast']
+		total = fast + self.stats['transform_slow']
+		report = f'Fast path taken for {fast} of {total} pages ({fast / total:.0%}).' if total else 'No pages transformed.'
+		if self.stats['transform_cached']:
+			report += f' Another {self.stats["transform_cached"]} pages were ruled out by the parse cache.'
+		if self.stats['transform_mismatch']:
+			report += f' The fast and slow paths disagreed on {self.stats["transform_mismatch"]} pages.'
+		return report
+
+def normal_temp_name(name: str) -> str:
+	'''
+	Equivalent to wikitextparser.Template.normal_name() for a template name that contains no comments.
+	'''
+	name = name.strip()
+	head, sep, tail = name.partition(':')
+	if not head and sep:
+		name = tail.strip(' ')
+		head, sep, tail = name.partition(':')
+	if head.strip(' ').casefold() == 'template' and sep:
+		name = tail.strip(' ')
+	name = name.replace('_', ' ').partition('#')[0]
+	return ' '.join(name.split())
+
+def lang_sections(text: str) -> list[tuple[str, int, int]]:
+	'''
+	Finds the level 2 (language) sections of a page with a scan of its headers, which is much cheaper than wikitextparser.parse(text).get_sections(level=2) on large pages.
+	Returns the title, start, and end of each section, where a section starts with its header and extends up to the next level 2 header (or the end of the page), as with wikitextparser.
+	'''
+	headers = [(mat[1].strip(), mat.start()) for mat in L2_HEADER_PATTERN.finditer(text)]
+	return [(title, start, headers[i + 1][1] if i + 1 < len(headers) else len(text)) for i, (title, start) in enumerate(headers)]
+
+def lang_section_span(text: str, lang_name: str) -> tuple[int, int] | None:
+	'''Returns the start and end of the section for the given language (see lang_sections()), or None if there is no such section.'''
+	return next(((start, end) for title, start, end in lang_sections(text) if title == lang_name), None)
+
+def edit_lang_section(text: str, lang_name: str, edit: Callable[[str], str]) -> str | None:
+	'''
+	Applies edit to just the text of the section for the given language and splices the result back into the page, so that only that section ever needs to be parsed.
+	Returns None if the page has no section for the language.
+	'''
+	span = lang_section_span(text, lang_name)
+	if span is None:
+		return None
+	start, end = span
+	return ''.join((text[:start], edit(text[start:end]), text[end:]))
+
+class ParseArtifacts(NamedTuple):
+	'''
+	What the transforms need to know about the structure of a revision, which is much smaller than the revision (let alone its parse tree).
+	templates: The start, end, normal name, and positional arguments (stripped) of each transclusion.
+	wikilinks: The start, end, and title of each wikilink.
+	sections: The level 2 sections, as from lang_sections().
+	'''
+	templates: list[tuple[int, int, str, list[str]]]
+	wikilinks: list[tuple[int, int, str]]
+	sections: list[tuple[str, int, int]]
+
+	@classmethod
+	def from_text(cls, text: str) -> 'ParseArtifacts':
+		return cls.from_parsed(wikitextparser.parse(text), text)
+
+	@classmethod
+	def from_parsed(cls, parsed: wikitextparser.WikiText, text: str) -> 'ParseArtifacts':
+		'''Makes the artifacts of text from its parse, which must not have been edited yet.'''
+		templates = [(*temp.span, temp.normal_name(), [arg.value.strip() for arg in temp.arguments if arg.positional]) for temp in parsed.templates]
+		wikilinks = [(*link.span, link.title.strip()) for link in parsed.wikilinks]
+		return cls(templates, wikilinks, lang_sections(text))
+
+	def template_names(self) -> set[str]:
+		return {name for _, _, name, _ in self.templates}
+
+class ParseCache:
+	'''
+	Keeps the ParseArtifacts of each revision (by revision ID) in a compressed on-disk store, so that later runs (of the same job or others) over unchanged pages can tell whether and where to edit without parsing them again.
+	Artifacts are only stored when a page is parsed in full anyway (because no fast path could handle it), so the cache never adds a parse of its own.
+	Use it as a context manager (or call close()) so that the last entries are written.
+	'''
+
+	def __init__(self, path: str = PARSE_CACHE_PATH):
+		self.connection = sqlite3.connect(path)
+		self.connection.execute('CREATE TABLE IF NOT EXISTS artifacts (revid INTEGER PRIMARY KEY, data BLOB NOT NULL)')
+		self.uncommitted = 0
+		self.stats = collections.Counter()
+
+	def __enter__(self) -> 'ParseCache':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close()
+
+	def get(self, revid: int) -> ParseArtifacts | None:
+		'''Returns the stored artifacts of the revision with the given ID, or None if there are none.'''
+		row = self.connection.execute('SELECT data FROM artifacts WHERE revid = ?', (revid,)).fetchone()
+		if row:
+			self.stats['parse_cache_hit'] += 1
+			templates, wikilinks, sections = json.loads(zlib.decompress(row[0]))
+			return ParseArtifacts([tuple(temp) for temp in templates], [tuple(link) for link in wikilinks], [tuple(section) for section in sections])
+		self.stats['parse_cache_miss'] += 1
+		return None
+
+	def parse(self, revid: int, text: str) -> wikitextparser.WikiText:
+		'''Parses the text of the revision with the given ID, storing its artifacts for later runs, and returns the parse for the caller to use.'''
+		parsed = wikitextparser.parse(text)
+		self.put(revid, ParseArtifacts.from_parsed(parsed, text))
+		return parsed
+
+	def put(self, revid: int, artifacts: ParseArtifacts) -> None:
+		self.connection.execute('INSERT OR REPLACE INTO artifacts VALUES (?, ?)', (revid, zlib.compress(json.dumps(artifacts, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))))
+		self.uncommitted += 1
+		if self.uncommitted >= PARSE_CACHE_COMMIT_INTERVAL:
+			self.connection.commit()
+			self.uncommitted = 0
+
+	def close(self) -> None:
+		self.connection.commit()
+		self.connection.close()
+
+	def report(self) -> str:
+		hits = self.stats['parse_cache_hit']
+		total = hits + self.stats['parse_cache_miss']
+		return f'Parse cache: {hits} of {total} revisions that no fast path could handle ({hits / total:.0%}) were found in the cache.' if total else 'Parse cache: no revisions looked up.'
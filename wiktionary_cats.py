@@ -1,26 +1,37 @@
 import argparse
+import collections
 import csv
+import functools
+import json
 import re
 import sys
+import time
 from typing import Self
 
 import pywikibot
 import pywikibot.pagegenerators
 import wikitextparser
 
+import pywikibot_helpers
+import run_state
+import throttles
+import wikitext_helpers
+
 NS_PREFIX = 'Category'
 CAT_ALIASES = {'categorize', 'cat'}
 CLN_ALIASES = {'catlangname', 'cln'}
 C_ALIASES = {'topics', 'top', 'C', 'c'}
 TEMP_ALIASES = CAT_ALIASES | CLN_ALIASES | C_ALIASES
+CAT_TREE_SNAPSHOT_PATH = 'cat_tree_snapshots.json'
+# How long (in seconds) a snapshot of the subcategories of a category is trusted without checking that it is still complete
+CAT_TREE_SNAPSHOT_TTL = 24 * 60 * 60
 
 class ParentCat():
-	def __init__(self, base_name: str, topic: bool, lang_file_path: str):
-		self.site = pywikibot.Site()
+	def __init__(self, base_name: str, topic: bool, lang_file_path: str, site: pywikibot.site.BaseSite | None = None):
+		self._site = site
 		self.base_name = base_name
 		self.topic = topic
 		self.full_name = self.base_to_full_name(self.base_name, self.topic)
-		self.pwb_cat = pywikibot.Category(self.site, self.full_name)
 		self.code_to_name = {}
 		self.name_to_code = {}
 		with open(lang_file_path, newline='', encoding='utf-8') as lang_file:
@@ -30,20 +41,27 @@ class ParentCat():
 				self.code_to_name[code] = name
 				self.name_to_code[name] = code
 
-	def move(self, dst_base_name: str, summary: str, dst_topic: bool = None, page: bool = False, dry_run: bool = False, limit: int | None = None, verbose: bool = False) -> int:
+	@property
+	def site(self) -> pywikibot.site.BaseSite:
+		# Only set up the site when it is first needed, so that constructing a category does not load the config (or log in)
+		if self._site is None:
+			self._site = pywikibot.Site()
+		return self._site
+
+	@functools.cached_property
+	def pwb_cat(self) -> pywikibot.Category:
+		return pywikibot.Category(self.site, self.full_name)
+
+	def move(self, dst_base_name: str, summary: str, dst_topic: bool = None, page: bool = False, dry_run: bool = False, limit: int | None = None, verbose: bool = False, throttle: throttles.AdaptiveThrottle | None = None, parse_cache: wikitext_helpers.ParseCache | None = None, checkpoint: run_state.ShardCheckpoint | None = None, snapshot_path: str | None = None, edit_log: run_state.EditLog | None = None) -> int:
+		'''
+		snapshot_path: Keep a snapshot of the subcategories in this file (see subcats()) instead of listing them afresh on every run.
+		'''
 		if dst_topic == None:
 			dst_topic = self.topic
-		actions = 0
-		if page:
-			move_or_redirect_cat_page(self.pwb_cat, self.base_to_full_name(dst_base_name, dst_topic), summary, dry_run, verbose)
-			actions += 1
-
-		for src_pwb_subcat in self.pwb_cat.subcategories():
-			if limit != None and limit <= actions:
-				break
-			# Pywikibot can misinterpret the language code in a topic category ('zh:Philosophy') as a link to a different wiki (the Chinese Wiktionary).
-			# One of the consequences of this is it will insert the NS prefix *after* the language code (zh:Category:Philosophy).
-			src_title = src_pwb_subcat.title(as_link=True).removeprefix('[[').removesuffix(']]').replace(f'{NS_PREFIX}:', '', 1)
+		# Work out all the category page moves up front so that they can be planned with a few batched queries
+		subcat_pairs = []
+		# The biggest subcategories are handled first, so that whatever work remains towards the end of a run (in any shard) comes in small pieces
+		for src_title, _, _ in sorted(self.subcats(snapshot_path), key=lambda subcat: subcat[2], reverse=True):
 			if self.topic:
 				lang_code, _, _ = src_title.partition(':')
 				lang_name = self.code_to_name[lang_code]
@@ -52,11 +70,69 @@ class ParentCat():
 				lang_code = self.name_to_code[lang_name]
 			src_subcat = LangCat(self.base_name, lang_code, lang_name, self.topic, self.site)
 			dst_full_name = LangCat(dst_base_name, lang_code, lang_name, dst_topic, self.site).full_name
-			move_or_redirect_cat_page(src_subcat.pwb_cat, dst_full_name, summary, dry_run, verbose)
+			subcat_pairs.append((src_subcat, dst_full_name))
+		cat_page_pairs = [(src_subcat.full_name, dst_full_name) for src_subcat, dst_full_name in subcat_pairs]
+		if page:
+			cat_page_pairs.append((self.full_name, self.base_to_full_name(dst_base_name, dst_topic)))
+		cat_page_actions = plan_cat_page_moves(self.site, cat_page_pairs)
+		if verbose:
+			print(f'Category pages: {collections.Counter(cat_page_actions.values())}')
+
+		# When the job is split into shards, the category pages are moved by the first shard alone
+		move_cat_pages = checkpoint is None or checkpoint.shard[0] == 0
+		actions = 0
+		if page and move_cat_pages:
+			dst_full_name = self.base_to_full_name(dst_base_name, dst_topic)
+			execute_cat_page_move(self.site, self.full_name, dst_full_name, cat_page_actions[(self.full_name, dst_full_name)], summary, dry_run, verbose, throttle)
 			actions += 1
-			actions += src_subcat.move(dst_base_name, dst_topic, summary, dry_run, limit = None if limit == None else limit - actions, verbose=verbose)
+
+		for src_subcat, dst_full_name in subcat_pairs:
+			if limit != None and limit <= actions:
+				break
+			if move_cat_pages:
+				execute_cat_page_move(self.site, src_subcat.full_name, dst_full_name, cat_page_actions[(src_subcat.full_name, dst_full_name)], summary, dry_run, verbose, throttle)
+				actions += 1
+			actions += src_subcat.move(dst_base_name, dst_topic, summary, dry_run, limit = None if limit == None else limit - actions, verbose=verbose, throttle=throttle, parse_cache=parse_cache, checkpoint=checkpoint, edit_log=edit_log)
 		return actions
 
+	def subcats(self, snapshot_path: str | None = None, ttl: float = CAT_TREE_SNAPSHOT_TTL) -> list[tuple[str, int, int]]:
+		'''
+		Returns the title (without the namespace prefix), page ID, and number of member pages of each subcategory.
+		snapshot_path: A JSON file of snapshots (by category) to reuse and update. A snapshot is reused if it is younger than ttl seconds and membership_key() is unchanged. The member counts may be out of date, but they are only used to decide the order in which to handle the subcategories.
+		'''
+		snapshots = {}
+		if snapshot_path:
+			try:
+				with open(snapshot_path, encoding='utf-8') as snapshot_file:
+					snapshots = json.load(snapshot_file)
+			except FileNotFoundError:
+				pass
+		snapshot = snapshots.get(self.full_name)
+		# Taken before listing, so that a change made while listing makes the snapshot look stale rather than fresh
+		key = self.membership_key()
+		if snapshot and time.time() - snapshot['taken'] < ttl and snapshot['key'] == key:
+			return [tuple(subcat) for subcat in snapshot['subcats']]
+
+		# Listing the subcategories through the API directly gives their plain titles, whereas pywikibot can misinterpret the language code in a topic category ('zh:Philosophy') as a link to a different wiki (the Chinese Wiktionary)
+		records = list(pywikibot_helpers.list_records(self.site, 'categorymembers', cmtitle=with_prefix(self.full_name), cmtype='subcat', cmprop='ids|title'))
+		sizes = {title: info.get('categoryinfo', {}).get('pages', 0) for title, info in pywikibot_helpers.query_pages(self.site, [record.title for record in records], prop='categoryinfo')}
+		subcats = [(record.title.removeprefix(f'{NS_PREFIX}:'), record.pageid, sizes[record.title]) for record in records]
+		if snapshot_path:
+			snapshots[self.full_name] = {'taken': time.time(), 'key': key, 'subcats': subcats}
+			with open(snapshot_path, 'w', encoding='utf-8') as snapshot_file:
+				json.dump(snapshots, snapshot_file, ensure_ascii=False)
+		return subcats
+
+	def membership_key(self) -> list:
+		'''
+		Returns the number of subcategories and the page ID and time of addition of the one added most recently, in one query.
+		Any change to the subcategories changes this: an addition (including the new name of a renamed subcategory) changes the latest addition, and a removal alone changes the number.
+		'''
+		result = self.site.simple_request(action='query', titles=with_prefix(self.full_name), prop='categoryinfo', list='categorymembers', cmtitle=with_prefix(self.full_name), cmtype='subcat', cmsort='timestamp', cmdir='desc', cmlimit=1, cmprop='ids|timestamp', formatversion=2).submit()
+		page = result['query']['pages'][0]
+		latest = result['query']['categorymembers'][:1]
+		return [page.get('categoryinfo', {}).get('subcats', 0), *((latest[0]['pageid'], latest[0]['timestamp']) if latest else (None, None))]
+
 	@classmethod
 	def base_to_full_name(cls, base_name: str, topic: bool) -> str:
 		return base_name if topic else f'{base_name.capitalize()} by language'
@@ -66,35 +142,55 @@ class LangCat:
 	# LangCat('2-syllable words', 'en', 'English')
 	# LangCat('Philosopy', 'en', 'English', topic=True)
 	def __init__(self, base_name: str, lang_code: str, lang_name: str, topic: bool = False, site: pywikibot.site._basesite.BaseSite | None = None):
-		self.site = site or pywikibot.Site()
+		self._site = site
 		self.base_name = base_name
 		self.lang_code = lang_code
 		self.lang_name = lang_name
 		self.topic = topic
 		self.full_name = f'{self.lang_code}:{self.base_name}' if topic else f'{self.lang_name} {self.base_name}'
-		self.pwb_cat = pywikibot.Category(self.site, with_prefix(self.full_name))
 		self.link_regexp = '\n' + r'\[\[[cC]at(egory)?:'+ f'({self.full_name}|{self.full_name.replace(" ", "_")})' + r'(\|(?P<sort>.*?))?\]\]'
 
-	def move(self, dst_base_name: str, dst_topic: bool = None, summary: str | None = None, dry_run: bool = False, limit: int | None = None, verbose: bool = False):
+	@property
+	def site(self) -> pywikibot.site.BaseSite:
+		# See ParentCat.site
+		if self._site is None:
+			self._site = pywikibot.Site()
+		return self._site
+
+	@functools.cached_property
+	def pwb_cat(self) -> pywikibot.Category:
+		return pywikibot.Category(self.site, with_prefix(self.full_name))
+
+	def move(self, dst_base_name: str, dst_topic: bool = None, summary: str | None = None, dry_run: bool = False, limit: int | None = None, verbose: bool = False, throttle: throttles.AdaptiveThrottle | None = None, parse_cache: wikitext_helpers.ParseCache | None = None, checkpoint: run_state.ShardCheckpoint | None = None, edit_log: run_state.EditLog | None = None):
 		if dst_topic == None:
 			dst_topic = self.topic
 
+		pages = self.pages()
+		if checkpoint:
+			pages = checkpoint.pages(pages)
 		actions = 0
-		for page in self.pages():
+		for page in pages:
 			if limit != None and limit <= actions:
 				break
-			dst_cat = LangCat(dst_base_name, self.lang_code, self.lang_name, dst_topic, self.site)
+			dst_cat = LangCat(dst_base_name, self.lang_code, self.lang_name, dst_topic, self._site)
+			title = page.title()
 			try:
-				sort_key = self.remove_one(page, verbose=verbose)
-				dst_cat.add_one(page, sort_key=sort_key, verbose=verbose)
+				if dry_run:
+					page.text = self.retarget_page_text(page.text, title, dst_cat, verbose, page.latest_revision_id, parse_cache)
+					with open(title.replace(' ', '_').replace('/', '_'), 'w') as outFile:
+						outFile.write(page.text)
+				# redo the move on the latest text if someone else edits the page in the meantime
+				elif not pywikibot_helpers.save_transformed(page, lambda text: self.retarget_page_text(text, title, dst_cat, verbose, page.latest_revision_id, parse_cache), summary, throttle=throttle, edit_log=edit_log, bot=True, quiet=not verbose):
+					if checkpoint:
+						checkpoint.record(page.pageid, title, 'skipped')
+					continue
 			except ValueError as er:
 				print(er)
+				if checkpoint:
+					checkpoint.record(page.pageid, title, 'skipped')
 				continue
-			if dry_run:
-				with open(page.title().replace(' ', '_').replace('/', '_'), 'w') as outFile:
-					outFile.write(page.text)
-			else:
-				page.save(summary=summary, bot=True, quiet=not verbose)
+			if checkpoint:
+				checkpoint.record(page.pageid, title, 'edited')
 			actions += 1
 		return actions
 
@@ -102,7 +198,16 @@ class LangCat:
 		return pywikibot.pagegenerators.CategorizedPageGenerator(self.pwb_cat)
 
 	def add_one(self, page: pywikibot.page.BasePage, sort_key: str | None = None, verbose: bool = False) -> None:
-		parsedPage = wikitextparser.parse(page.text)
+		page.text = self.add_to_page_text(page.text, page.title(), sort_key, verbose)
+
+	def add_to_page_text(self, text: str, page_title: str, sort_key: str | None = None, verbose: bool = False) -> str:
+		# Only parse the section for this language, since the biggest pages have over a hundred of them
+		new_text = wikitext_helpers.edit_lang_section(text, self.lang_name, lambda section: self.add_to(section, page_title, sort_key, verbose))
+		return self.add_to(text, page_title, sort_key, verbose) if new_text is None else new_text
+
+	def add_to(self, text: str, page_title: str, sort_key: str | None = None, verbose: bool = False) -> str:
+		'''Add to this category in text, which is either a whole page or just its section for this language.'''
+		parsedPage = wikitextparser.parse(text)
 		try:
 			temp = next(t for t in parsedPage.templates if t.normal_name() in (C_ALIASES if self.topic else CLN_ALIASES) and t.arguments[0].positional and t.arguments[0].value == self.lang_code)
 			last_positional = next(a for a in reversed(temp.arguments) if a.positional).name
@@ -111,7 +216,7 @@ class LangCat:
 			if sort_key and not temp.has_arg('sort'):
 				temp.set_arg('sort', sort_key)
 			if verbose:
-				print(f'Added to existing {{{{{temp.normal_name()}}}}} on [[{page.title()}]].')
+				print(f'Added to existing {{{{{temp.normal_name()}}}}} on [[{page_title}]].')
 		# no appropriate categorization template to add to
 		except StopIteration:
 			try:
@@ -121,14 +226,58 @@ class LangCat:
 					new_temp.set_arg('sort', sort_key)
 				section.contents += f'\n{new_temp}'
 				if verbose:
-					print(f'Added new {{{{{new_temp.normal_name()}}}}} on [[{page.title()}]].')
+					print(f'Added new {{{{{new_temp.normal_name()}}}}} on [[{page_title}]].')
 			except StopIteration:
-				print(f'Error: Unable to find a "{self.lang_name}" section on "{page.title()}". Failed to add it to {self.full_name}', file=sys.stderr)
-		parsedPage.string = self.remove_extra_newlines(str(parsedPage))
-		page.text = str(parsedPage)
+				print(f'Error: Unable to find a "{self.lang_name}" section on "{page_title}". Failed to add it to {self.full_name}', file=sys.stderr)
+		return self.remove_extra_newlines(parsedPage.string)
 
 	def remove_one(self, page: pywikibot.page.BasePage, verbose: bool = False) -> str | None:
-		parsedPage = wikitextparser.parse(page.text)
+		page.text, sort_key = self.remove_from_page_text(page.text, page.title(), verbose)
+		return sort_key
+
+	def remove_from_page_text(self, text: str, page_title: str, verbose: bool = False, revid: int | None = None, parse_cache: wikitext_helpers.ParseCache | None = None) -> tuple[str, str | None]:
+		'''
+		Like remove_from(), but for a whole page, and raises ValueError if the page is not in this category.
+		revid, parse_cache: The revision the text is from and a cache of parse artifacts, which are consulted only before parsing the whole page.
+		'''
+		# Only parse the section for this language if there is one
+		span = wikitext_helpers.lang_section_span(text, self.lang_name)
+		if span:
+			start, end = span
+			old_section = text[start:end]
+			new_section, sort_key = self.remove_from(old_section, page_title, verbose)
+			if new_section != old_section:
+				return ''.join((text[:start], new_section, text[end:])), sort_key
+		# Fall back to the whole page in case the category is added somewhere unusual, unless the revision is already known not to be in the category
+		parsed = None
+		if parse_cache and revid is not None:
+			artifacts = parse_cache.get(revid)
+			if artifacts is None:
+				parsed = parse_cache.parse(revid, text)
+			elif not self.in_artifacts(artifacts):
+				raise ValueError(f'Unable to find the link to "{self.full_name}" in the text of "{page_title}".')
+		new_text, sort_key = self.remove_from(text, page_title, verbose, parsed)
+		if new_text != text:
+			return new_text, sort_key
+		raise ValueError(f'Unable to find the link to "{self.full_name}" in the text of "{page_title}".')
+
+	def in_artifacts(self, artifacts: wikitext_helpers.ParseArtifacts) -> bool:
+		'''Whether a revision with the given artifacts has a link to this category that remove_from() could find.'''
+		if any(name in TEMP_ALIASES and args[:1] == [self.lang_code] and self.base_name in args[1:] for _, _, name, args in artifacts.templates):
+			return True
+		return any(ns.strip().casefold() in ('category', 'cat') and name.replace('_', ' ').strip() == self.full_name for ns, _, name in (link_title.partition(':') for _, _, link_title in artifacts.wikilinks))
+
+	def retarget_page_text(self, text: str, page_title: str, dst_cat: 'LangCat', verbose: bool = False, revid: int | None = None, parse_cache: wikitext_helpers.ParseCache | None = None) -> str:
+		'''Moves a whole page from this category to dst_cat, keeping its sort key. Raises ValueError if the page is not in this category.'''
+		text, sort_key = self.remove_from_page_text(text, page_title, verbose, revid, parse_cache)
+		return dst_cat.add_to_page_text(text, page_title, sort_key, verbose)
+
+	def remove_from(self, text: str, page_title: str, verbose: bool = False, parsed: wikitextparser.WikiText | None = None) -> tuple[str, str | None]:
+		'''
+		Remove from this category in text, which is either a whole page or just its section for this language. Returns the new text and the sort key that was used (if any).
+		parsed: The text already parsed, if it has been.
+		'''
+		parsedPage = wikitextparser.parse(text) if parsed is None else parsed
 		# setting temp.string to the empty string removes the temp from parsedPage.templates, so create copy to avoid modifying list while we are iterating over it
 		pageTemps = parsedPage.templates.copy()
 		for temp in pageTemps:
@@ -149,46 +298,66 @@ class LangCat:
 				else:
 					temp.del_arg(arg.name)
 				if verbose:
-					print(f'Removed {{{{{temp_name}}}}} link from [[{page.title()}]].')
-				break
-		# else branch of for loop
-		else:
-			mat = re.search(self.link_regexp, str(parsedPage))
-			if mat:
-				parsedPage.string = str(parsedPage)[:mat.start()] + str(parsedPage)[mat.end():]
-				sort_key = mat.group('sort')
-				if verbose:
-					print(f'Removed plain link from [[{page.title()}]].')
-			# template and link removal may leave behind stray newlines
-			parsedPage.string = self.remove_extra_newlines(str(parsedPage))
-
-		if page.text == str(parsedPage):
-			raise ValueError(f'Unable to find the link to "{self.full_name}" in the text of "{page.title()}".')
-		page.text = str(parsedPage)
-		return sort_key
+					print(f'Removed {{{{{temp_name}}}}} link from [[{page_title}]].')
+				return parsedPage.string, sort_key
+		# no template links to this category
+		mat = re.search(self.link_regexp, text)
+		if not mat:
+			return text, None
+		sort_key = mat.group('sort')
+		if verbose:
+			print(f'Removed plain link from [[{page_title}]].')
+		# template and link removal may leave behind stray newlines
+		return self.remove_extra_newlines(text[:mat.start()] + text[mat.end():]), sort_key
 
 	@classmethod
 	def remove_extra_newlines(cls, text: str) -> str:
 		return re.sub('\n{3,}', '\n\n', text)
 
 def move_or_redirect_cat_page(src_page: pywikibot.Category, dst_name: str, summary: str, dry_run: bool = False, verbose: bool = False) -> None:
+	src_name = src_page.title()
+	action = plan_cat_page_moves(src_page.site, [(src_name, dst_name)])[(src_name, dst_name)]
+	execute_cat_page_move(src_page.site, src_name, dst_name, action, summary, dry_run, verbose)
+
+def plan_cat_page_moves(site: pywikibot.site.BaseSite, pairs: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+	'''
+	Decides what needs doing to move each category page in pairs of (source name, destination name), with a few batched queries for the whole list rather than several queries per pair.
+	Returns the action for each pair: 'move' the source to the destination, 'redirect' the source to the destination (because the destination already exists), or 'done' (because the source does not exist or already redirects to the destination).
+	'''
+	src_info = pywikibot_helpers.page_info(site, [with_prefix(src_name) for src_name, _ in pairs])
+	dst_info = pywikibot_helpers.page_info(site, [with_prefix(dst_name) for _, dst_name in pairs])
+	redirect_targets = pywikibot_helpers.page_info(site, [title for title, info in src_info.items() if 'redirect' in info], resolve_redirects=True)
+	actions = {}
+	for src_name, dst_name in pairs:
+		src_title = with_prefix(src_name)
+		dst_title = with_prefix(dst_name)
+		if 'missing' in src_info[src_title]:
+			actions[(src_name, dst_name)] = 'done'
+		elif 'missing' in dst_info[dst_title]:
+			actions[(src_name, dst_name)] = 'move'
+		elif src_title in redirect_targets and redirect_targets[src_title]['title'] == dst_info[dst_title]['title']:
+			actions[(src_name, dst_name)] = 'done'
+		else:
+			actions[(src_name, dst_name)] = 'redirect'
+	return actions
+
+def execute_cat_page_move(site: pywikibot.site.BaseSite, src_name: str, dst_name: str, action: str, summary: str, dry_run: bool = False, verbose: bool = False, throttle: throttles.AdaptiveThrottle | None = None) -> None:
+	'''
+	action: What to do with the source category page; one of the actions decided by plan_cat_page_moves().
+	throttle: Pace the move (or the save of the redirect) with this throttle rather than just pywikibot's.
+	'''
 	verbose = verbose or dry_run
-	site = src_page.site
-	if not src_page.exists():
+	if action == 'done':
 		return
-	dst_page = pywikibot.page.Category(site, with_prefix(dst_name))
-	if dst_page.exists():
-		try:
-			src_target = src_page.getRedirectTarget().title()
-			if src_target == dst_name:
-				return
-		except pywikibot.exceptions.IsNotRedirectPageError:
-			pass
+	src_page = pywikibot.Category(site, with_prefix(src_name))
+	dst_page = pywikibot.Category(site, with_prefix(dst_name))
+	if action == 'redirect':
 		if dry_run:
 			if verbose:
 				print(f'Would turn "{src_page.title()}" into a redirect to "{dst_page.title()}".')
 		else:
-			src_page.set_redirect_target(dst_name, force=True, summary=summary)
+			src_page.set_redirect_target(dst_page, force=True, save=False)
+			throttles.throttled_save(src_page, throttle, summary=summary)
 			if verbose:
 				print(f'Turned "{src_page.title()}" into a redirect to "{dst_page.title()}".')
 	else:
@@ -196,7 +365,7 @@ def move_or_redirect_cat_page(src_page: pywikibot.Category, dst_name: str, summa
 			if verbose:
 				print(f'Would move "{src_page.title()}" to "{dst_page.title()}".')
 		else:
-			src_page.move(dst_name, reason=summary)
+			throttles.throttled_move(src_page, with_prefix(dst_name), throttle, reason=summary)
 			if verbose:
 				print(f'Moved "{src_page.title()}" to "{dst_page.title()}".')
 